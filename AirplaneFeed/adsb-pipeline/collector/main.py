@@ -1,11 +1,16 @@
 import os
-import time
 import json
+import time
 import hashlib
+import asyncio
+import httpx
 import requests
 from requests.auth import HTTPBasicAuth
 from dotenv import load_dotenv
 from datetime import datetime, timedelta
+from spool import Spool, Replayer
+from delta import DeltaTracker, DELTA_POSTING, delta_url
+from wire import encode_body
 
 # Load .env if present (local development convenience)
 load_dotenv()
@@ -20,8 +25,19 @@ LOMIN = float(os.getenv("LOMIN", "3.8"))
 LOMAX = float(os.getenv("LOMAX", "5.5"))
 # default poll every 5 seconds (accept env var as string or number)
 POLL = float(os.getenv("POLL_SECONDS", "5"))
+# Optional list of regions polled independently and merged into one snapshot, e.g.
+# [{"name": "be", "lamin": 49.5, "lamax": 51.5, "lomin": 2.5, "lomax": 6.5,
+#   "poll_seconds": 5, "credits_per_day": 4000}, ...]
+# Without it the single LAMIN/LAMAX/LOMIN/LOMAX box is polled every POLL_SECONDS.
+OPENSKY_TILES = os.getenv("OPENSKY_TILES")
+# Daily OpenSky credit budget shared equally by tiles that do not set their own
+OPENSKY_DAILY_CREDITS = os.getenv("OPENSKY_DAILY_CREDITS")
+# A tile whose last good response is older than this many of its poll intervals is stale
+TILE_STALE_FACTOR = float(os.getenv("TILE_STALE_FACTOR", "3"))
 # Where to POST the batch (backend service in compose)
 INGEST_URL = os.getenv("INGEST_URL", "http://backend:8000/planes/bulk")
+DELTA_URL = os.getenv("DELTA_URL", delta_url(INGEST_URL))
+HEALTH_URL = os.getenv("HEALTH_URL", INGEST_URL.rsplit("/planes", 1)[0] + "/health")
 
 # OpenSky OAuth2 credentials (new API clients - preferred)
 OPENSKY_CLIENT_ID = os.getenv("OPENSKY_CLIENT_ID")
@@ -39,24 +55,32 @@ AUTH_PASSWORD = os.getenv("AUTH_PASSWORD", "pass")
 _access_token = None
 _token_expires_at = None
 
+# Failed batches are spooled to disk and replayed in the background
+spool = Spool(prefix="opensky")
+# The replayer runs in its own thread, so it keeps a (thread-local) requests session
+_replay_session = requests.Session()
+_replay_session.auth = HTTPBasicAuth(AUTH_USERNAME, AUTH_PASSWORD)
+# Last record the backend accepted per icao, for change-only snapshots
+tracker = DeltaTracker()
+
 
-def get_opensky_token() -> str:
+async def get_opensky_token(client: httpx.AsyncClient) -> str:
     """
     Obtain an OAuth2 access token from OpenSky Network.
     Tokens are cached and reused until they expire (30 minutes).
     """
     global _access_token, _token_expires_at
-    
+
     # Return cached token if still valid (with 1 minute buffer)
     if _access_token and _token_expires_at:
         if datetime.now() < _token_expires_at - timedelta(minutes=1):
             return _access_token
-    
+
     # Request new token
     print("[collector] Requesting new OpenSky OAuth2 token...")
-    
+
     try:
-        resp = requests.post(
+        resp = await client.post(
             OPENSKY_TOKEN_URL,
             headers={"Content-Type": "application/x-www-form-urlencoded"},
             data={
@@ -67,17 +91,17 @@ def get_opensky_token() -> str:
             timeout=10
         )
         resp.raise_for_status()
-        
+
         token_data = resp.json()
         _access_token = token_data.get("access_token")
         expires_in = token_data.get("expires_in", 1800)  # Default 30 minutes
-        
+
         _token_expires_at = datetime.now() + timedelta(seconds=expires_in)
-        
+
         print(f"[collector] Token obtained, expires in {expires_in} seconds")
         return _access_token
-        
-    except requests.RequestException as e:
+
+    except httpx.HTTPError as e:
         print(f"[collector] Failed to obtain OAuth2 token: {e}", flush=True)
         raise
 
@@ -88,131 +112,356 @@ def msg_id(icao: str, ts_aircraft: int) -> str:
     return hashlib.sha1(s.encode()).hexdigest()[:24]
 
 
-def fetch_opensky() -> dict:
-    """Fetch JSON data from OpenSky Network for our bounding box."""
-    params = dict(lamin=LAMIN, lamax=LAMAX, lomin=LOMIN, lomax=LOMAX)
-    
+def credit_cost(lamin: float, lamax: float, lomin: float, lomax: float) -> int:
+    """OpenSky credits charged per /states/all call, by bbox area in square degrees."""
+    area = (lamax - lamin) * (lomax - lomin)
+    if area <= 25:
+        return 1
+    if area <= 100:
+        return 2
+    if area <= 400:
+        return 3
+    return 4
+
+
+class Tile:
+    """One polled region, with its own cadence and the records of its last good response."""
+
+    def __init__(self, name, lamin, lamax, lomin, lomax, poll_seconds=None, credits_per_day=None):
+        self.name = name
+        self.lamin, self.lamax, self.lomin, self.lomax = float(lamin), float(lamax), float(lomin), float(lomax)
+        self.cost = credit_cost(self.lamin, self.lamax, self.lomin, self.lomax)
+        self.interval = float(poll_seconds or POLL)
+        self.credits_per_day = float(credits_per_day) if credits_per_day else None
+        if self.credits_per_day:
+            # Never poll faster than the daily budget allows
+            self.interval = max(self.interval, 86400.0 * self.cost / self.credits_per_day)
+        self.batch = []
+        self.fetched_at = None
+        self.generation = 0
+        self.fetch_ms = 0.0
+
+    @property
+    def params(self) -> dict:
+        return dict(lamin=self.lamin, lamax=self.lamax, lomin=self.lomin, lomax=self.lomax)
+
+    def fresh(self, now: float) -> bool:
+        return self.fetched_at is not None and now - self.fetched_at <= self.interval * TILE_STALE_FACTOR
+
+
+def load_tiles() -> list:
+    """Build the tile list from OPENSKY_TILES, or the single LAMIN/LAMAX/LOMIN/LOMAX box."""
+    if OPENSKY_TILES:
+        specs = json.loads(OPENSKY_TILES)
+    else:
+        specs = [{"name": "default", "lamin": LAMIN, "lamax": LAMAX, "lomin": LOMIN, "lomax": LOMAX}]
+    unbudgeted = [spec for spec in specs if not spec.get("credits_per_day")]
+    share = float(OPENSKY_DAILY_CREDITS) / len(unbudgeted) if OPENSKY_DAILY_CREDITS and unbudgeted else None
+    tiles = []
+    for i, spec in enumerate(specs):
+        tiles.append(Tile(
+            spec.get("name") or f"tile{i}",
+            spec["lamin"], spec["lamax"], spec["lomin"], spec["lomax"],
+            poll_seconds=spec.get("poll_seconds"),
+            credits_per_day=spec.get("credits_per_day") or share,
+        ))
+    return tiles
+
+
+def merge_tiles(tiles) -> list:
+    """Combine tile batches into one, keeping the newest record per icao (tiles may overlap)."""
+    merged = {}
+    for tile in tiles:
+        for rec in tile.batch:
+            current = merged.get(rec["icao"])
+            if current is None or rec["ts_unix"] > current["ts_unix"]:
+                merged[rec["icao"]] = rec
+    return list(merged.values())
+
+
+def next_tick(deadline: float, interval: float, now: float, label: str) -> float:
+    """Advance a fixed-rate deadline, skipping (and logging) ticks that were overrun."""
+    deadline += interval
+    if now > deadline:
+        overrun = now - deadline
+        skipped = int(overrun // interval) + 1
+        deadline += skipped * interval
+        print(f"[collector] {label} overran by {overrun:.1f}s, skipped {skipped} tick(s)", flush=True)
+    return deadline
+
+
+def basic_auth():
+    if OPENSKY_USERNAME and OPENSKY_PASSWORD:
+        return httpx.BasicAuth(OPENSKY_USERNAME, OPENSKY_PASSWORD)
+    return None
+
+
+async def fetch_opensky(client: httpx.AsyncClient, params: dict) -> dict:
+    """Fetch JSON data from OpenSky Network for one bounding box."""
+
     headers = {}
     auth = None
     auth_method = "none"
-    
+
     # Prefer OAuth2 if credentials are available
     if OPENSKY_CLIENT_ID and OPENSKY_CLIENT_SECRET:
         try:
-            token = get_opensky_token()
+            token = await get_opensky_token(client)
             headers["Authorization"] = f"Bearer {token}"
             auth_method = "oauth2"
-            print("[collector] Using OAuth2 authentication")
         except Exception as e:
             print(f"[collector] OAuth2 failed, falling back to basic auth if available: {e}", flush=True)
             # Fall back to basic auth if OAuth2 fails
-            if OPENSKY_USERNAME and OPENSKY_PASSWORD:
-                auth = HTTPBasicAuth(OPENSKY_USERNAME, OPENSKY_PASSWORD)
-                auth_method = "basic"
-                print("[collector] Using legacy basic authentication")
-            else:
-                print("[collector] No fallback credentials, using anonymous API")
+            auth = basic_auth()
+            auth_method = "basic" if auth else "none"
     elif OPENSKY_USERNAME and OPENSKY_PASSWORD:
         # Use legacy basic auth
-        auth = HTTPBasicAuth(OPENSKY_USERNAME, OPENSKY_PASSWORD)
+        auth = basic_auth()
         auth_method = "basic"
-        print("[collector] Using legacy basic authentication")
-    else:
-        print("[collector] No authentication configured (using anonymous/rate-limited API)")
-    
+
     try:
-        resp = requests.get(
-            OPENSKY_URL,
-            params=params,
-            headers=headers,
-            auth=auth,
-            timeout=20
-        )
-        
+        resp = await client.get(OPENSKY_URL, params=params, headers=headers, auth=auth, timeout=20)
+
         # Handle token expiration (OAuth2)
         if resp.status_code == 401 and auth_method == "oauth2":
             print("[collector] Token expired or invalid, requesting new token...")
             global _access_token, _token_expires_at
             _access_token = None
             _token_expires_at = None
-            
+
             # Retry with new token
             try:
-                token = get_opensky_token()
+                token = await get_opensky_token(client)
                 headers["Authorization"] = f"Bearer {token}"
-                resp = requests.get(
-                    OPENSKY_URL,
-                    params=params,
-                    headers=headers,
-                    timeout=20
-                )
+                resp = await client.get(OPENSKY_URL, params=params, headers=headers, timeout=20)
             except Exception as e:
                 print(f"[collector] Failed to refresh token, trying basic auth: {e}", flush=True)
-                # Fall back to basic auth
-                if OPENSKY_USERNAME and OPENSKY_PASSWORD:
-                    auth = HTTPBasicAuth(OPENSKY_USERNAME, OPENSKY_PASSWORD)
-                    headers.pop("Authorization", None)
-                    resp = requests.get(
-                        OPENSKY_URL,
-                        params=params,
-                        auth=auth,
-                        timeout=20
-                    )
-                    auth_method = "basic"
-                else:
-                    # Fall back to no auth
+                # Fall back to basic auth, or no auth
+                headers.pop("Authorization", None)
+                auth = basic_auth()
+                auth_method = "basic" if auth else "none"
+                if not auth:
                     print("[collector] No basic auth available, trying anonymous...")
-                    headers.pop("Authorization", None)
-                    resp = requests.get(
-                        OPENSKY_URL,
-                        params=params,
-                        timeout=20
-                    )
-                    auth_method = "none"
-        
+                resp = await client.get(OPENSKY_URL, params=params, auth=auth, timeout=20)
+
         # Handle basic auth failure
         if resp.status_code == 401 and auth_method == "basic":
             print("[collector] Basic auth failed, falling back to anonymous API", flush=True)
             # Retry without authentication
-            resp = requests.get(
-                OPENSKY_URL,
-                params=params,
-                timeout=20
-            )
-            auth_method = "none"
+            resp = await client.get(OPENSKY_URL, params=params, timeout=20)
             print("[collector] Using anonymous API (rate-limited)")
-        
+
         resp.raise_for_status()
         return resp.json()
-        
-    except requests.RequestException as e:
+
+    except httpx.HTTPError as e:
         print(f"[collector] OpenSky API error: {e}", flush=True)
         raise
 
 
-def post_batch(batch):
-    headers = {"Content-Type": "application/json"}
-    
+def build_batch(data: dict) -> list:
+    """Turn an OpenSky /states/all response into /planes/bulk records."""
+    snap_ts = int(data.get("time") or time.time())
+    states = data.get("states", []) or []
+
+    batch = []
+    for s in states:
+        icao = s[0]
+        if not icao:
+            continue
+
+        lon, lat = s[5], s[6]
+        if lat is None or lon is None:
+            continue
+
+        last_contact = s[4]
+        time_position = s[3]
+        if isinstance(last_contact, (int, float)):
+            ts_aircraft = int(last_contact)
+        elif isinstance(time_position, (int, float)):
+            ts_aircraft = int(time_position)
+        else:
+            ts_aircraft = snap_ts
+
+        rec = {
+            "msg_id": msg_id(icao, ts_aircraft),
+            "source": "opensky",
+            "icao": icao.lower(),
+            "ts_unix": ts_aircraft,
+            # labeling / extras
+            "flight": s[1].strip() if s[1] else None,
+            "country": s[2],
+            # position & motion
+            "lat": lat,
+            "lon": lon,
+            "alt": s[7],
+            "alt_geom": s[13],
+            "spd": s[9],
+            "heading": s[10],
+            "vr": s[11],
+            # misc
+            "squawk": s[14],
+            "on_ground": s[8],
+        }
+        batch.append(rec)
+    return batch
+
+
+async def post_batch(client: httpx.AsyncClient, batch, snapshot: bool = True) -> bool:
+    body, headers = encode_body(batch)
     try:
-        resp = requests.post(
-            INGEST_URL, 
-            json=batch, 
-            headers=headers, 
-            auth=HTTPBasicAuth(AUTH_USERNAME, AUTH_PASSWORD),
+        resp = await client.post(
+            INGEST_URL,
+            content=body,
+            headers=headers,
+            params=None if snapshot else {"snapshot": "false"},
+            auth=(AUTH_USERNAME, AUTH_PASSWORD),
             timeout=30
         )
         resp.raise_for_status()
         print(f"[collector] posted {len(batch)} records -> {INGEST_URL}")
         return True
-    except requests.RequestException as e:
+    except httpx.HTTPError as e:
         print(f"[collector] post error: {e}", flush=True)
         return False
 
 
+async def post_delta(client: httpx.AsyncClient, changed, alive) -> bool:
+    """Post a snapshot as changed records + alive icaos; forget icaos the backend doesn't know."""
+    body, headers = encode_body({"source": "opensky", "planes": changed, "alive": alive})
+    try:
+        resp = await client.post(
+            DELTA_URL,
+            content=body,
+            headers=headers,
+            auth=(AUTH_USERNAME, AUTH_PASSWORD),
+            timeout=30
+        )
+        resp.raise_for_status()
+        unknown = resp.json().get("unknown") or []
+        tracker.commit(changed)
+        tracker.forget(unknown)
+        print(f"[collector] posted {len(changed)} changed + {len(alive)} alive records -> {DELTA_URL}"
+              + (f" ({len(unknown)} unknown)" if unknown else ""))
+        return True
+    except (httpx.HTTPError, ValueError) as e:
+        print(f"[collector] delta post error: {e}", flush=True)
+        return False
+
+
+async def deliver(client: httpx.AsyncClient, batch, snapshot: bool = True) -> float:
+    """Post a batch (spooling it on failure) and return the post latency in ms."""
+    t0 = time.perf_counter()
+    if snapshot and DELTA_POSTING:
+        ok = await post_delta(client, *tracker.split(batch))
+    else:
+        ok = await post_batch(client, batch, snapshot)
+    post_ms = (time.perf_counter() - t0) * 1000
+    if not ok:
+        # fallback: spool the batch; the replayer re-posts it once the backend is back
+        await asyncio.to_thread(spool.append, batch)
+        print(f"[collector] spooled failed batch ({len(batch)} records)")
+    return post_ms
+
+
+def replay_batch(batch):
+    """POST a spooled batch as a non-snapshot replay. Returns the HTTP status, or None."""
+    try:
+        resp = _replay_session.post(INGEST_URL, json=batch, params={"snapshot": "false"}, timeout=30)
+        print(f"[collector] replayed {len(batch)} records -> {resp.status_code}")
+        return resp.status_code
+    except requests.RequestException as e:
+        print(f"[collector] replay error: {e}", flush=True)
+        return None
+
+
+def backend_healthy() -> bool:
+    try:
+        return _replay_session.get(HEALTH_URL, timeout=5).ok
+    except requests.RequestException:
+        return False
+
+
+async def poll_tile(client: httpx.AsyncClient, tile: Tile):
+    """Poll one tile on its own fixed-rate schedule, keeping its latest records."""
+    loop = asyncio.get_running_loop()
+    next_deadline = loop.time()
+    while True:
+        try:
+            t0 = time.perf_counter()
+            data = await fetch_opensky(client, tile.params)
+            tile.fetch_ms = (time.perf_counter() - t0) * 1000
+            tile.batch = build_batch(data)
+            tile.fetched_at = loop.time()
+            tile.generation += 1
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code == 429:
+                # Out of credits: wait as long as OpenSky asks before polling this tile again
+                retry_after = float(e.response.headers.get("X-Rate-Limit-Retry-After-Seconds") or tile.interval)
+                print(f"[collector] tile {tile.name} rate limited, retrying in {retry_after:.0f}s", flush=True)
+                next_deadline = loop.time() + retry_after - tile.interval
+        except Exception as e:
+            print(f"[collector] tile {tile.name} error: {e}", flush=True)
+        next_deadline = next_tick(next_deadline, tile.interval, loop.time(), f"tile {tile.name}")
+        await asyncio.sleep(max(0.0, next_deadline - loop.time()))
+
+
+async def run():
+    """Poll every tile concurrently and post their merged records every POLL seconds.
+
+    The backend counts `missed_updates` per source snapshot, so a merged batch
+    is only posted as a snapshot when every tile has a fresh response. While a
+    tile is failing or rate limited, the others are still posted with
+    `snapshot=false`, so its planes are neither aged out nor removed.
+    """
+    tiles = load_tiles()
+    for tile in tiles:
+        print(f"[collector] tile {tile.name}: lat {tile.lamin}..{tile.lamax}, lon {tile.lomin}..{tile.lomax}; "
+              f"every {tile.interval:.1f}s, {tile.cost} credit(s)/call"
+              + (f", budget {tile.credits_per_day:.0f}/day" if tile.credits_per_day else ""), flush=True)
+
+    limits = httpx.Limits(max_keepalive_connections=max(4, len(tiles)), max_connections=max(8, 2 * len(tiles)))
+    async with httpx.AsyncClient(limits=limits) as opensky, httpx.AsyncClient(limits=limits) as backend:
+        pollers = [asyncio.create_task(poll_tile(opensky, tile)) for tile in tiles]
+        loop = asyncio.get_running_loop()
+        next_deadline = loop.time() + POLL
+        posted_generations = None
+        cycle = 0
+
+        try:
+            while True:
+                await asyncio.sleep(max(0.0, next_deadline - loop.time()))
+                lag_ms = max(0.0, (loop.time() - next_deadline) * 1000)
+                try:
+                    generations = tuple(tile.generation for tile in tiles)
+                    # Nothing new since the last post: posting again would only count as another snapshot
+                    if generations != posted_generations:
+                        now = loop.time()
+                        fresh = [tile for tile in tiles if tile.fresh(now)]
+                        snapshot = len(fresh) == len(tiles)
+                        batch = merge_tiles(fresh)
+                        cycle += 1
+                        post_ms = await deliver(backend, batch, snapshot) if batch else 0.0
+                        posted_generations = generations
+                        fetch_ms = ", ".join(f"{tile.name} {tile.fetch_ms:.0f}" for tile in fresh)
+                        print(f"[collector] cycle {cycle}: {len(batch)} records from {len(fresh)}/{len(tiles)} tiles"
+                              f"{'' if snapshot else ' (partial)'}; fetch ms [{fetch_ms}], post {post_ms:.0f} ms, "
+                              f"start lag {lag_ms:.0f} ms", flush=True)
+                except Exception as e:
+                    print("[collector] error:", e, flush=True)
+                next_deadline = next_tick(next_deadline, POLL, loop.time(), "cycle")
+        finally:
+            for task in pollers:
+                task.cancel()
+
+
 def main():
-    print(f"[collector] OpenSky bbox (lat {LAMIN}..{LAMAX}, lon {LOMIN}..{LOMAX}); poll={POLL}s")
+    if OPENSKY_TILES:
+        print(f"[collector] OpenSky tiles from OPENSKY_TILES; snapshot every {POLL}s")
+    else:
+        print(f"[collector] OpenSky bbox (lat {LAMIN}..{LAMAX}, lon {LOMIN}..{LOMAX}); poll={POLL}s")
     print(f"[collector] Backend authentication as: {AUTH_USERNAME}")
-    
+
     # Log authentication method
     if OPENSKY_CLIENT_ID and OPENSKY_CLIENT_SECRET:
         print(f"[collector] OpenSky OAuth2 configured (client_id: {OPENSKY_CLIENT_ID[:8]}...)")
@@ -220,69 +469,9 @@ def main():
         print(f"[collector] OpenSky legacy auth configured (username: {OPENSKY_USERNAME})")
     else:
         print("[collector] No OpenSky credentials - using anonymous API (rate limited)")
-    
-    while True:
-        try:
-            data = fetch_opensky()
-            snap_ts = int(data.get("time") or time.time())
-            states = data.get("states", []) or []
-
-            batch = []
-            for s in states:
-                icao = s[0]
-                if not icao:
-                    continue
-
-                lon, lat = s[5], s[6]
-                if lat is None or lon is None:
-                    continue
-
-                last_contact = s[4]
-                time_position = s[3]
-                if isinstance(last_contact, (int, float)):
-                    ts_aircraft = int(last_contact)
-                elif isinstance(time_position, (int, float)):
-                    ts_aircraft = int(time_position)
-                else:
-                    ts_aircraft = snap_ts
-
-                rec = {
-                    "msg_id": msg_id(icao, ts_aircraft),
-                    "source": "opensky",
-                    "icao": icao.lower(),
-                    "ts_unix": ts_aircraft,
-                    # labeling / extras
-                    "flight": s[1].strip() if s[1] else None,
-                    "country": s[2],
-                    # position & motion
-                    "lat": lat,
-                    "lon": lon,
-                    "alt": s[7],
-                    "alt_geom": s[13],
-                    "spd": s[9],
-                    "heading": s[10],
-                    "vr": s[11],
-                    # misc
-                    "squawk": s[14],
-                    "on_ground": s[8],
-                }
-                batch.append(rec)
-
-            if batch:
-                ok = post_batch(batch)
-                if not ok:
-                    # fallback: write batch to a local file for later re-processing
-                    fname = f"opensky_failed_{int(time.time())}.json"
-                    with open(fname, "w", encoding="utf-8") as f:
-                        json.dump(batch, f)
-                    print(f"[collector] saved failed batch to {fname}")
-
-            print(f"[collector] processed {len(batch)} records", flush=True)
 
-        except Exception as e:
-            print("[collector] error:", e, flush=True)
-            
-        time.sleep(POLL)
+    Replayer(spool, replay_batch, backend_healthy).start()
+    asyncio.run(run())
 
 
 if __name__ == "__main__":
@@ -0,0 +1,73 @@
+import pytest
+
+import delta
+from delta import DeltaTracker
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(delta.time, "monotonic", lambda: now[0])
+    return now
+
+
+def rec(icao, lat=50.0, lon=4.0, **fields):
+    return {"icao": icao, "lat": lat, "lon": lon, "alt": 1000.0, "spd": 100.0, "heading": 90.0,
+            "on_ground": False, **fields}
+
+
+def sent(tracker, batch):
+    changed, alive = tracker.split(batch)
+    tracker.commit(changed)
+    return [r.get("icao") for r in changed], alive
+
+
+def test_only_changes_are_resent(clock):
+    tracker = DeltaTracker()
+    assert sent(tracker, [rec("a"), rec("b"), rec("c")]) == (["a", "b", "c"], [])
+
+    clock[0] += 10
+    batch = [
+        rec("a", lat=50.0005),          # ~55 m: below DELTA_POSITION_M
+        rec("b", lat=50.002),           # ~220 m
+        rec("c", heading=358.0 - 360),  # wraps around: still 92 degrees away
+    ]
+    assert sent(tracker, batch) == (["b", "c"], ["a"])
+
+    clock[0] += 10
+    assert sent(tracker, [rec("a", alt=1031.0), rec("b", lat=50.002, spd=101.0), rec("c", heading=-2.0)]) == (["a"], ["b", "c"])
+
+
+def test_unchanged_planes_are_refreshed(clock):
+    tracker = DeltaTracker()
+    sent(tracker, [rec("a")])
+    clock[0] += delta.DELTA_REFRESH_SECONDS - 1
+    assert sent(tracker, [rec("a")]) == ([], ["a"])
+    clock[0] += 1
+    assert sent(tracker, [rec("a")]) == (["a"], [])
+
+
+def test_landings_and_anonymous_reports_always_go_out(clock):
+    tracker = DeltaTracker()
+    sent(tracker, [rec("a")])
+    assert sent(tracker, [rec("a", on_ground=True), {"lat": 50.0, "lon": 4.0}]) == (["a", None], [])
+    # The landing dropped the reference: the next airborne report goes out in full
+    assert sent(tracker, [rec("a")]) == (["a"], [])
+
+
+def test_rejected_and_vanished_planes_are_resent(clock):
+    tracker = DeltaTracker()
+    sent(tracker, [rec("a"), rec("b")])
+
+    # A post that failed is never committed
+    changed, alive = tracker.split([rec("a", lat=51.0), rec("b")])
+    assert ([r["icao"] for r in changed], alive) == (["a"], ["b"])
+    assert sent(tracker, [rec("a", lat=51.0), rec("b")]) == (["a"], ["b"])
+
+    # Reported unknown by the backend
+    tracker.forget(["b"])
+    assert sent(tracker, [rec("a", lat=51.0), rec("b")]) == (["b"], ["a"])
+
+    # Out of the picture for one cycle
+    sent(tracker, [rec("a", lat=51.0)])
+    assert sent(tracker, [rec("a", lat=51.0), rec("b")]) == (["b"], ["a"])
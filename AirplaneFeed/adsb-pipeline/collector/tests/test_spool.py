@@ -0,0 +1,78 @@
+import json
+import time
+
+import pytest
+
+import spool
+from spool import Spool
+
+
+@pytest.fixture
+def box(tmp_path):
+    return Spool(str(tmp_path), prefix="opensky")
+
+
+class Backend:
+    def __init__(self, *statuses):
+        self.statuses = list(statuses)
+        self.posted = []
+
+    def __call__(self, chunk):
+        self.posted.append(chunk)
+        return self.statuses.pop(0) if self.statuses else 200
+
+
+def rec(icao, age, lat=50.0):
+    return {"icao": icao, "ts_unix": int(time.time()) - age, "lat": lat, "lon": 4.0}
+
+
+def test_replays_the_newest_record_per_aircraft(box):
+    box.append([rec("a", 30, lat=50.1), rec("b", 30), {"lat": 51.0, "lon": 5.0}])
+    box.append([rec("a", 10, lat=50.2), rec("c", spool.SPOOL_MAX_AGE_SECONDS + 60)])
+    backend = Backend()
+
+    assert box.drain(backend)
+    assert [(r.get("icao"), r["lat"]) for r in backend.posted[0]] == [("a", 50.2), ("b", 50.0), (None, 51.0)]
+    assert box.pending_bytes() == 0
+
+
+@pytest.mark.parametrize("status", [None, 429, 503])
+def test_segments_are_kept_until_the_backend_accepts(box, status):
+    box.append([rec("a", 10)])
+    assert not box.drain(Backend(status))
+    assert box.pending_bytes() > 0
+
+    backend = Backend()
+    assert box.drain(backend)
+    assert [r["icao"] for r in backend.posted[0]] == ["a"]
+    assert box.pending_bytes() == 0
+
+
+def test_invalid_records_are_dropped(box, monkeypatch):
+    monkeypatch.setattr(spool, "SPOOL_REPLAY_CHUNK", 2)
+    box.append([rec("a", 10), rec("b", 10), rec("c", 10)])
+    backend = Backend(400)
+
+    assert box.drain(backend)
+    assert [[r["icao"] for r in chunk] for chunk in backend.posted] == [["a", "b"], ["c"]]
+    assert box.pending_bytes() == 0
+
+
+def test_torn_lines_are_skipped(box):
+    box.append([rec("a", 10)])
+    path = box.seal()[0]
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"spooled_at": 1, "batch": [{"icao"')
+    backend = Backend()
+
+    assert box.drain(backend)
+    assert [r["icao"] for r in backend.posted[0]] == ["a"]
+
+
+def test_oldest_segments_are_evicted(tmp_path):
+    line = len(json.dumps({"spooled_at": int(time.time()), "batch": [rec("p0", 10)]}, separators=(",", ":"))) + 1
+    box = Spool(str(tmp_path), prefix="opensky", segment_bytes=line, max_bytes=3 * line)
+    for i in range(5):
+        box.append([rec(f"p{i}", 10)])
+
+    assert [p.name for p in box.seal()] == [f"opensky-{i:012d}.ndjson" for i in (2, 3, 4)]
@@ -0,0 +1,374 @@
+"""Month-partitioned storage for archived reports.
+
+crud.archive_old_drone_reports moves reports into one collection per
+calendar month of `archived_at` (`archive_2026_01`, ...). Partitions are
+created with ARCHIVE_BLOCK_COMPRESSOR block compression and the archive
+indexes, and fields with no use once a report is archived (DROP_FIELDS;
+`last_seen` is kept as `original_last_seen`) are dropped on the way in.
+
+`archive_catalog` holds one small document per partition:
+
+    {'_id': 'archive_2026_01', 'from': 2026-01-01, 'until': 2026-02-01, 'count': 4120,
+     'min_lat': ..., 'min_lon': ..., 'max_lat': ..., 'max_lon': ..., 'sources': ['camera', ...]}
+
+`from`/`until` bound `archived_at`; the counts, extent and sources are kept
+current with `$inc`/`$min`/`$max` as batches are archived. Readers ask
+`partitions()` which partitions a time range / bbox can touch and query
+only those through `view()`, which looks like one collection to paging.py,
+export.py and the statistics.
+
+The pre-partitioning `archive` collection, if it holds documents, is
+registered in the catalog as one more partition on startup (`refresh()`
+computes its entry); its documents stay where they are.
+
+Retention (ARCHIVE_RETENTION_DAYS, 0 keeps everything) drops a partition
+once its whole month is past it, and deletes expired documents from the
+legacy collection.
+"""
+from . import counters, database
+from .config import settings
+from datetime import datetime, timedelta
+from pymongo.errors import CollectionInvalid
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import logging
+import math
+
+logger = logging.getLogger('backend.archive_store')
+
+LEGACY = 'archive'
+PREFIX = 'archive_'
+CATALOG = 'archive_catalog'
+# Not worth keeping once a report is archived
+DROP_FIELDS = ('position_history', 'missed_updates', 'last_seen')
+
+# Partitions known to exist (and be indexed) in this process
+_known: Set[str] = set()
+
+
+def _catalog():
+    return database.db[CATALOG]
+
+
+def month_start(ts: datetime) -> datetime:
+    return ts.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def next_month(month: datetime) -> datetime:
+    return month.replace(year=month.year + 1, month=1) if month.month == 12 else month.replace(month=month.month + 1)
+
+
+def partition_name(ts: datetime) -> str:
+    return f'{PREFIX}{ts:%Y_%m}'
+
+
+def slim(doc: dict) -> dict:
+    return {k: v for k, v in doc.items() if k not in DROP_FIELDS}
+
+
+def _lon_lat(doc: dict) -> Optional[Tuple[float, float]]:
+    try:
+        lon, lat = doc['position']['coordinates']
+        return float(lon), float(lat)
+    except Exception:
+        return None
+
+
+async def create_indexes(collection):
+    await collection.create_index([('position', '2dsphere')])
+    await collection.create_index([('archived_at', -1), ('_id', -1)])
+    await collection.create_index('original_last_seen')
+
+
+async def partition(ts: datetime) -> str:
+    """Name of the partition for reports archived at `ts`, created if needed."""
+    name = partition_name(ts)
+    if name in _known:
+        return name
+    try:
+        await database.db.create_collection(name, storageEngine={
+            'wiredTiger': {'configString': f'block_compressor={settings.ARCHIVE_BLOCK_COMPRESSOR}'}})
+        logger.info('Created archive partition %s', name)
+    except CollectionInvalid:
+        pass
+    await create_indexes(database.db[name])
+    month = month_start(ts)
+    await _catalog().update_one({'_id': name}, {'$setOnInsert': {'from': month, 'until': next_month(month), 'count': 0}},
+                                upsert=True)
+    _known.add(name)
+    return name
+
+
+async def already_archived(ids: List, ts: datetime) -> Set:
+    """Of `ids`, those already in the previous month's partition or the legacy collection.
+
+    An interrupted run leaves archived reports in `planes`; a rerun after
+    the month changed would otherwise archive them into a second partition.
+    """
+    previous = partition_name(month_start(ts) - timedelta(days=1))
+    found = set()
+    for name in (previous, LEGACY):
+        cursor = database.db[name].find({'_id': {'$in': ids}}, projection={'_id': True})
+        found.update(doc['_id'] for doc in await cursor.to_list(length=len(ids)))
+    return found
+
+
+async def record(name: str, docs: List[dict]):
+    """Update the catalog entry of partition `name` after `docs` were inserted into it."""
+    if not docs:
+        return
+    update = {
+        '$inc': {'count': len(docs)},
+        '$addToSet': {'sources': {'$each': sorted({str(d.get('source') or 'unknown') for d in docs})}},
+    }
+    points = [p for p in (_lon_lat(d) for d in docs) if p]
+    if points:
+        update['$min'] = {'min_lon': min(p[0] for p in points), 'min_lat': min(p[1] for p in points)}
+        update['$max'] = {'max_lon': max(p[0] for p in points), 'max_lat': max(p[1] for p in points)}
+    try:
+        await _catalog().update_one({'_id': name}, update, upsert=True)
+    except Exception as e:
+        logger.warning('Failed to update the archive catalog for %s: %s', name, e)
+
+
+async def refresh(name: str) -> Optional[dict]:
+    """Rebuild the catalog entry of a partition from its documents."""
+    lon = {'$arrayElemAt': ['$position.coordinates', 0]}
+    lat = {'$arrayElemAt': ['$position.coordinates', 1]}
+    rows = await database.db[name].aggregate([{'$group': {
+        '_id': None, 'count': {'$sum': 1},
+        'first': {'$min': '$archived_at'}, 'last': {'$max': '$archived_at'},
+        'min_lon': {'$min': lon}, 'max_lon': {'$max': lon}, 'min_lat': {'$min': lat}, 'max_lat': {'$max': lat},
+        'sources': {'$addToSet': {'$ifNull': ['$source', 'unknown']}},
+    }}]).to_list(length=1)
+    if not rows:
+        await _catalog().delete_one({'_id': name})
+        return None
+    row = rows[0]
+    if name == LEGACY:
+        start, until = row['first'] or datetime.min, (row['last'] or datetime.min) + timedelta(milliseconds=1)
+    else:
+        start = datetime.strptime(name[len(PREFIX):], '%Y_%m')
+        until = next_month(start)
+    entry = {'_id': name, 'from': start, 'until': until, 'count': row['count'], 'sources': sorted(map(str, row['sources']))}
+    entry.update({k: row[k] for k in ('min_lon', 'max_lon', 'min_lat', 'max_lat') if row[k] is not None})
+    await _catalog().replace_one({'_id': name}, entry, upsert=True)
+    return entry
+
+
+async def init():
+    """Catalog index, and the legacy collection registered as a partition."""
+    await _catalog().create_index('until')
+    if not await _catalog().find_one({'_id': LEGACY}) and await database.db[LEGACY].estimated_document_count():
+        entry = await refresh(LEGACY)
+        logger.info('Registered the legacy archive collection (%d reports) in the catalog', entry['count'] if entry else 0)
+
+
+async def catalog() -> List[dict]:
+    return await _catalog().find({}).sort('until', -1).to_list(length=None)
+
+
+async def partitions(start: Optional[datetime] = None, end: Optional[datetime] = None,
+                     bbox: Optional[Tuple[float, float, float, float]] = None) -> List[str]:
+    """Partitions that can hold reports archived in [start, end) inside bbox, newest first."""
+    query = {}
+    if start:
+        query['until'] = {'$gt': start}
+    if end:
+        query['from'] = {'$lt': end}
+    if bbox:
+        min_lat, min_lon, max_lat, max_lon = bbox
+        # An entry without an extent (nothing with a position recorded yet) is kept
+        query['$nor'] = [{'min_lat': {'$gt': max_lat}}, {'max_lat': {'$lt': min_lat}},
+                         {'min_lon': {'$gt': max_lon}}, {'max_lon': {'$lt': min_lon}}]
+    cursor = _catalog().find(query, projection={'_id': True}).sort('until', -1)
+    return [doc['_id'] for doc in await cursor.to_list(length=None)]
+
+
+def _sort_spec(key, direction=None) -> List[Tuple[str, int]]:
+    return [(key, direction or 1)] if isinstance(key, str) else list(key)
+
+
+def _inner_projection(projection: Optional[Dict[str, bool]], keys: Iterable[str]) -> Optional[Dict[str, bool]]:
+    """The projection per partition, keeping the sort keys for the final merge."""
+    if not projection:
+        return None
+    keys = set(keys)
+    if any(v for k, v in projection.items() if k != '_id'):
+        return {**{k: v for k, v in projection.items() if k != '_id'}, **{k: True for k in keys}}
+    inner = {k: v for k, v in projection.items() if k not in keys}
+    return inner or None
+
+
+class _NoResults:
+    async def to_list(self, length=None):
+        return []
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        raise StopAsyncIteration
+
+
+class _UnionFind:
+    """`find()` over several partitions, with the cursor methods the readers use."""
+
+    def __init__(self, names: List[str], query: dict, projection: Optional[Dict[str, bool]]):
+        self.names = names
+        self.query = query
+        self.projection = projection
+        self._sort: List[Tuple[str, int]] = []
+        self._skip = 0
+        self._limit = 0
+        self._batch_size = 0
+
+    def sort(self, key, direction=None):
+        self._sort = _sort_spec(key, direction)
+        return self
+
+    def skip(self, n: int):
+        self._skip = n
+        return self
+
+    def limit(self, n: int):
+        self._limit = n
+        return self
+
+    def batch_size(self, n: int):
+        self._batch_size = n
+        return self
+
+    def _cursor(self, name: str, skip: int = 0, limit: int = 0):
+        cursor = database.db[name].find(self.query, projection=self.projection)
+        if self._sort:
+            cursor = cursor.sort(self._sort)
+        if skip:
+            cursor = cursor.skip(skip)
+        if limit:
+            cursor = cursor.limit(limit)
+        if self._batch_size:
+            cursor = cursor.batch_size(self._batch_size)
+        return cursor
+
+    def _merged(self):
+        # Top skip+limit of every partition, then the same sort over their union
+        sort = dict(self._sort)
+        inner = [{'$match': self.query}, {'$sort': sort}, {'$limit': self._skip + self._limit}]
+        projection = _inner_projection(self.projection, sort)
+        if projection:
+            inner.append({'$project': projection})
+        pipeline = list(inner)
+        for name in self.names[1:]:
+            pipeline.append({'$unionWith': {'coll': name, 'pipeline': inner}})
+        pipeline += [{'$sort': sort}, {'$skip': self._skip}, {'$limit': self._limit}] if self._skip else \
+            [{'$sort': sort}, {'$limit': self._limit}]
+        if self.projection:
+            pipeline.append({'$project': self.projection})
+        options = {'batchSize': self._batch_size} if self._batch_size else {}
+        return database.db[self.names[0]].aggregate(pipeline, **options)
+
+    def _run(self):
+        if not self.names:
+            return _NoResults()
+        if len(self.names) == 1:
+            return self._cursor(self.names[0], self._skip, self._limit)
+        if self._limit and self._sort:
+            return self._merged()
+        return None
+
+    async def to_list(self, length=None):
+        cursor = self._run()
+        if cursor is not None:
+            return await cursor.to_list(length=length)
+        return [doc async for doc in self]
+
+    async def __aiter__(self):
+        cursor = self._run()
+        if cursor is not None:
+            async for doc in cursor:
+                yield doc
+            return
+        # Unbounded (exports): partition after partition. Their archived_at ranges don't
+        # overlap (except the legacy collection's last month), so a sort on archived_at holds.
+        names = list(self.names)
+        if self._sort and self._sort[0][1] > 0:
+            names.reverse()
+        skip = self._skip
+        for name in names:
+            async for doc in self._cursor(name):
+                if skip:
+                    skip -= 1
+                    continue
+                yield doc
+
+
+class ArchiveView:
+    """Some partitions, read as if they were one collection (`find`, `aggregate`, `count_documents`)."""
+
+    def __init__(self, names: List[str]):
+        self.names = names
+
+    def find(self, query: Optional[dict] = None, projection: Optional[Dict[str, bool]] = None):
+        return _UnionFind(self.names, query or {}, projection)
+
+    def aggregate(self, pipeline: List[dict], **kwargs):
+        if not self.names:
+            return _NoResults()
+        # A leading $match runs in every partition, before the union
+        head, rest = (pipeline[:1], pipeline[1:]) if pipeline and '$match' in pipeline[0] else ([], pipeline)
+        union = [{'$unionWith': {'coll': name, 'pipeline': head}} for name in self.names[1:]]
+        return database.db[self.names[0]].aggregate(head + union + rest, **kwargs)
+
+    async def count_documents(self, query: dict) -> int:
+        total = 0
+        for name in self.names:
+            total += await database.db[name].count_documents(query)
+        return total
+
+
+async def view(start: Optional[datetime] = None, end: Optional[datetime] = None,
+               bbox: Optional[Tuple[float, float, float, float]] = None) -> ArchiveView:
+    """The partitions a time range / bbox can touch, as one collection."""
+    return ArchiveView(await partitions(start, end, bbox))
+
+
+async def near(lat: float, lon: float, radius_m: float, limit: int, projection: Dict[str, bool]) -> List[dict]:
+    """Archived reports within `radius_m` of (lat, lon), nearest first, across the partitions around it."""
+    dlat = radius_m / 111320.0
+    dlon = dlat / max(math.cos(math.radians(lat)), 0.01)
+    names = await partitions(bbox=(lat - dlat, lon - dlon, lat + dlat, lon + dlon))
+    stages = [
+        {'$geoNear': {'near': {'type': 'Point', 'coordinates': [lon, lat]}, 'distanceField': '_distance',
+                      'maxDistance': radius_m, 'spherical': True}},
+        {'$limit': limit},
+    ]
+    projection = {**projection, '_distance': True} if any(v for k, v in projection.items() if k != '_id') else projection
+    results = []
+    for name in names:
+        results += await database.db[name].aggregate(stages + [{'$project': projection}]).to_list(length=limit)
+    results.sort(key=lambda doc: doc.get('_distance', 0))
+    for doc in results:
+        doc.pop('_distance', None)
+    return results[:limit]
+
+
+async def apply_retention(now: Optional[datetime] = None) -> dict:
+    """Drop partitions (and legacy documents) archived longer than ARCHIVE_RETENTION_DAYS ago."""
+    if not settings.ARCHIVE_RETENTION_DAYS:
+        return {'dropped': [], 'deleted': 0}
+    cutoff = (now or datetime.utcnow()) - timedelta(days=settings.ARCHIVE_RETENTION_DAYS)
+    expired = await _catalog().find({'_id': {'$ne': LEGACY}, 'until': {'$lte': cutoff}}).to_list(length=None)
+    dropped = []
+    for entry in expired:
+        await database.db.drop_collection(entry['_id'])
+        await _catalog().delete_one({'_id': entry['_id']})
+        _known.discard(entry['_id'])
+        dropped.append(entry['_id'])
+    deleted = 0
+    if await _catalog().find_one({'_id': LEGACY, 'from': {'$lt': cutoff}}):
+        deleted = (await database.db[LEGACY].delete_many({'archived_at': {'$lt': cutoff}})).deleted_count
+        await refresh(LEGACY)
+    if dropped or deleted:
+        logger.info('Archive retention: dropped %s, deleted %d legacy reports', ', '.join(dropped) or 'no partitions', deleted)
+        await counters.mark_dirty()
+    return {'dropped': dropped, 'deleted': deleted}
@@ -1,102 +1,134 @@
 from fastapi import Depends, HTTPException, status, Request
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
+from starlette.concurrency import run_in_threadpool
 import bcrypt
-from . import database
-from collections import defaultdict
-from datetime import datetime, timedelta
+from . import database, rate_store
+from .config import settings
+from typing import Dict, Optional, Tuple
+import hashlib
+import hmac
 import logging
+import os
+import time
 
 security = HTTPBasic()
 logger = logging.getLogger('backend.auth')
 
-# In-memory store for failed login attempts (use Redis in production)
-failed_attempts = defaultdict(list)
 MAX_ATTEMPTS = 5
 LOCKOUT_MINUTES = 60
+# Failed login attempts per client IP over the last LOCKOUT_MINUTES (per process or shared, see rate_store.py)
+failed_attempts = rate_store.create_store(LOCKOUT_MINUTES * 60)
 
+# Recently verified credentials: username -> (HMAC of username+password+stored hash, monotonic expiry).
+# Repeated Basic-auth requests (collectors, dashboards) skip bcrypt; only a keyed digest is kept,
+# never the password itself. The digest covers the stored password hash, so an entry stops
+# matching as soon as the password is changed in Mongo, whichever worker changed it.
+_verified: Dict[str, Tuple[bytes, float]] = {}
+_VERIFIED_KEY = os.urandom(32)
 
-def _is_ip_locked(ip: str) -> bool:
-    """Check if IP is locked due to too many failed attempts."""
-    if ip not in failed_attempts:
-        return False
-    
-    # Clean old attempts (older than LOCKOUT_MINUTES)
-    cutoff = datetime.now() - timedelta(minutes=LOCKOUT_MINUTES)
-    failed_attempts[ip] = [attempt for attempt in failed_attempts[ip] if attempt > cutoff]
-    
-    # Check if still over limit
-    return len(failed_attempts[ip]) >= MAX_ATTEMPTS
+
+async def _is_ip_locked(ip: str) -> Tuple[bool, float, int]:
+    """Check if IP is locked due to too many failed attempts.
+
+    Also returns the seconds until it unlocks and the failed attempts in the window.
+    """
+    attempts, retry_after = await failed_attempts.count(ip)
+    return attempts >= MAX_ATTEMPTS, retry_after, attempts
 
 
-def _record_failed_attempt(ip: str):
-    """Record a failed login attempt."""
-    failed_attempts[ip].append(datetime.now())
+async def _record_failed_attempt(ip: str) -> int:
+    """Record a failed login attempt; returns the attempts now in the window."""
+    return await failed_attempts.hit(ip)
 
 
-def _clear_failed_attempts(ip: str):
+async def _clear_failed_attempts(ip: str):
     """Clear failed attempts after successful login."""
-    if ip in failed_attempts:
-        del failed_attempts[ip]
+    await failed_attempts.clear(ip)
 
 
-async def _verify_password(username: str, password: str) -> bool:
-    """Verify password against database."""
+def _credential_digest(username: str, password: str, stored_hash: bytes) -> bytes:
+    return hmac.new(_VERIFIED_KEY, f"{username}\0{password}\0".encode('utf-8') + stored_hash, hashlib.sha256).digest()
+
+
+def invalidate_credentials(username: Optional[str] = None):
+    """Forget this process's cached verifications (of one user, or everyone)."""
+    if username is None:
+        _verified.clear()
+    else:
+        _verified.pop(username, None)
+
+
+async def _authenticate(username: str, password: str) -> Tuple[bool, Optional[str]]:
+    """Check a username/password pair and return (valid, role).
+
+    The user is fetched on every call, so deleted users and role changes
+    apply at once. bcrypt is skipped when the same password was verified
+    against the same stored hash in the last AUTH_CACHE_TTL_SECONDS;
+    otherwise it runs in the thread pool so it doesn't block the event loop.
+    """
     try:
         user = await database.get_user(username)
         if not user:
-            return False
+            return False, None
         
         stored_hash = user.get('password_hash')
         if not stored_hash:
-            return False
+            return False, None
         
         # Ensure both are bytes
         password_bytes = password.encode('utf-8') if isinstance(password, str) else password
         stored_hash_bytes = stored_hash if isinstance(stored_hash, bytes) else stored_hash.encode('utf-8')
-        
-        return bcrypt.checkpw(password_bytes, stored_hash_bytes)
+
+        digest = _credential_digest(username, password, stored_hash_bytes)
+        cached = _verified.get(username)
+        if cached is None or cached[1] <= time.monotonic() or not hmac.compare_digest(cached[0], digest):
+            if not await run_in_threadpool(bcrypt.checkpw, password_bytes, stored_hash_bytes):
+                return False, None
+            _remember(username, digest)
     except Exception as e:
         logger.error(f"Error verifying password for user {username}: {e}", exc_info=True)
-        return False
+        return False, None
 
+    return True, user.get('role', None)
 
-async def _get_user_role(username: str) -> str:
-    """Get user role from database."""
-    try:
-        user = await database.get_user(username)
-        if not user:
-            return None
-        return user.get('role', None)
-    except Exception as e:
-        logger.error(f"Error getting role for user {username}: {e}", exc_info=True)
-        return None
+
+def _remember(username: str, digest: bytes):
+    if settings.AUTH_CACHE_TTL_SECONDS <= 0:
+        return
+    now = time.monotonic()
+    if len(_verified) >= settings.AUTH_CACHE_MAX_ENTRIES:
+        for name in [n for n, entry in _verified.items() if entry[1] <= now] or list(_verified):
+            del _verified[name]
+    _verified[username] = (digest, now + settings.AUTH_CACHE_TTL_SECONDS)
+
+
+async def _verify_password(username: str, password: str) -> bool:
+    """Verify password against database."""
+    valid, _ = await _authenticate(username, password)
+    return valid
 
 
-async def _verify_credentials_with_ratelimit(credentials: HTTPBasicCredentials, request: Request) -> bool:
-    """Verify credentials and enforce rate limiting on failed attempts."""
+async def _verify_credentials_with_ratelimit(credentials: HTTPBasicCredentials, request: Request) -> Optional[str]:
+    """Verify credentials and enforce rate limiting on failed attempts. Returns the user's role."""
     # Get client IP
     client_ip = request.client.host if request.client else "unknown"
     
     # Check if IP is locked
-    if _is_ip_locked(client_ip):
-        remaining_attempts = failed_attempts[client_ip]
-        if remaining_attempts:
-            oldest_attempt = min(remaining_attempts)
-            unlock_time = oldest_attempt + timedelta(minutes=LOCKOUT_MINUTES)
-            minutes_remaining = int((unlock_time - datetime.now()).total_seconds() / 60)
-            logger.warning(f"IP {client_ip} is locked due to too many failed login attempts")
-            raise HTTPException(
-                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
-                detail=f"Too many failed login attempts. Try again in {minutes_remaining} minutes.",
-                headers={"WWW-Authenticate": "Basic"},
-            )
+    locked, retry_after, attempts = await _is_ip_locked(client_ip)
+    if locked:
+        minutes_remaining = int(retry_after / 60)
+        logger.warning(f"IP {client_ip} is locked due to too many failed login attempts")
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=f"Too many failed login attempts. Try again in {minutes_remaining} minutes.",
+            headers={"WWW-Authenticate": "Basic", "Retry-After": str(int(retry_after) + 1)},
+        )
     
-    # Verify password
-    is_valid = await _verify_password(credentials.username, credentials.password)
+    # Verify password (and get the role from the same lookup)
+    is_valid, role = await _authenticate(credentials.username, credentials.password)
     
     if not is_valid:
-        _record_failed_attempt(client_ip)
-        remaining = MAX_ATTEMPTS - len(failed_attempts[client_ip])
+        remaining = MAX_ATTEMPTS - await _record_failed_attempt(client_ip)
         logger.warning(f"Failed login attempt for user {credentials.username} from IP {client_ip}. Remaining attempts: {remaining}")
         
         if remaining <= 0:
@@ -112,16 +144,15 @@ async def _verify_credentials_with_ratelimit(credentials: HTTPBasicCredentials,
             headers={"WWW-Authenticate": "Basic"},
         )
     
-    # Successful login - clear failed attempts
-    _clear_failed_attempts(client_ip)
-    return True
+    # Successful login - clear failed attempts (if any: this runs on every authenticated request)
+    if attempts:
+        await _clear_failed_attempts(client_ip)
+    return role
 
 
 async def verify_admin(credentials: HTTPBasicCredentials = Depends(security), request: Request = None):
     """Verify admin role with rate limiting."""
-    await _verify_credentials_with_ratelimit(credentials, request)
-    
-    role = await _get_user_role(credentials.username)
+    role = await _verify_credentials_with_ratelimit(credentials, request)
     if role != "admin":
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -133,9 +164,7 @@ async def verify_admin(credentials: HTTPBasicCredentials = Depends(security), re
 
 async def verify_airplanefeed(credentials: HTTPBasicCredentials = Depends(security), request: Request = None):
     """Verify airplanefeed role (or admin) with rate limiting."""
-    await _verify_credentials_with_ratelimit(credentials, request)
-    
-    role = await _get_user_role(credentials.username)
+    role = await _verify_credentials_with_ratelimit(credentials, request)
     if role not in ["airplanefeed", "admin"]:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -147,9 +176,7 @@ async def verify_airplanefeed(credentials: HTTPBasicCredentials = Depends(securi
 
 async def verify_operator(credentials: HTTPBasicCredentials = Depends(security), request: Request = None):
     """Verify operator role (or admin) with rate limiting."""
-    await _verify_credentials_with_ratelimit(credentials, request)
-    
-    role = await _get_user_role(credentials.username)
+    role = await _verify_credentials_with_ratelimit(credentials, request)
     if role not in ["operator", "admin"]:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -160,4 +187,4 @@ async def verify_operator(credentials: HTTPBasicCredentials = Depends(security),
 
 
 # Export for use in other modules
-__all__ = ['security', 'verify_admin', 'verify_airplanefeed', 'verify_operator', '_verify_password', '_get_user_role']
\ No newline at end of file
+__all__ = ['security', 'verify_admin', 'verify_airplanefeed', 'verify_operator', 'invalidate_credentials', '_verify_password']
\ No newline at end of file
@@ -12,7 +12,84 @@ class Settings(BaseSettings):
     OPERATOR_PASSWORD: str = "pass"
     AUTHORITY_PASSWORD: str = "pass"
     ANALYST_PASSWORD: str = "pass"
-    
+    # Verified Basic-auth credentials are trusted for this long before bcrypt runs again (0 = never cache)
+    AUTH_CACHE_TTL_SECONDS: int = 300
+    AUTH_CACHE_MAX_ENTRIES: int = 1024
+
+    # Live documents keep only this many recent positions; the full path
+    # goes to the `track_points` time-series collection.
+    POSITION_HISTORY_MAX: int = 20
+    TRACK_RETENTION_HOURS: int = 72
+
+    # Largest ingest request body, before and after gzip/zstd decoding (see wire.py); larger ones get 413
+    MAX_REQUEST_BODY_BYTES: int = 64 * 1024 * 1024
+
+    # In-memory live picture serving GET /planes (see live_state.py)
+    LIVE_STATE_ENABLED: bool = True
+    LIVE_STATE_GRID_DEG: float = 0.5
+    LIVE_STATE_RESYNC_SECONDS: int = 60
+    # How often a worker checks the shared version for writes made by other workers
+    LIVE_STATE_SYNC_SECONDS: float = 1.0
+    # /planes/stream: per-client backlog before a full snapshot is resent, and ping interval
+    LIVE_STREAM_QUEUE_SIZE: int = 32
+    LIVE_STREAM_KEEPALIVE_SECONDS: float = 5.0
+    # Encoded GET /planes responses (see response_cache.py); grid in degrees the bbox/centre cache keys snap to (0 = exact)
+    RESPONSE_CACHE_ENABLED: bool = True
+    RESPONSE_CACHE_MAX_ENTRIES: int = 512
+    RESPONSE_CACHE_TILE_DEG: float = 0.01
+
+    # Login lockout counters: 'memory' (per process, bounded) or 'mongo' (shared by all workers); see rate_store.py
+    LOCKOUT_STORE: str = 'memory'
+    LOCKOUT_WINDOW_SLOTS: int = 12
+    LOCKOUT_MAX_KEYS: int = 10000
+    # slowapi route limits: storage (memory://, mongodb://..., redis://...) and strategy
+    RATE_LIMIT_STORAGE_URI: str = 'memory://'
+    RATE_LIMIT_STRATEGY: str = 'sliding-window-counter'
+
+    # Background jobs (see scheduler.py): lease held by the running worker, poll interval and jitter
+    SCHEDULER_ENABLED: bool = True
+    JOB_LEASE_SECONDS: int = 120
+    JOB_POLL_SECONDS: float = 15.0
+    JOB_JITTER_FRACTION: float = 0.2
+    JOB_HISTORY_DAYS: int = 7
+    # Cleanup job: opensky/ogn planes not seen for this long are removed
+    CLEANUP_INTERVAL_SECONDS: int = 300
+    STALE_PLANE_SECONDS: int = 900
+
+    # Archiving of old drone reports (see crud.archive_old_drone_reports)
+    ARCHIVE_INTERVAL_SECONDS: int = 300
+    ARCHIVE_AGE_HOURS: float = 1.0
+    ARCHIVE_BATCH_SIZE: int = 500
+    # Archive partitions (see archive_store.py): block compression, and how long archived reports are kept (0 = forever)
+    ARCHIVE_BLOCK_COMPRESSOR: str = 'zstd'
+    ARCHIVE_RETENTION_DAYS: int = 0
+    ARCHIVE_RETENTION_INTERVAL_SECONDS: int = 3600
+
+    # Materialized /statistics/overview counters (see counters.py) are rebuilt at least this often
+    STATS_RECOMPUTE_SECONDS: int = 3600
+    # Activity rollups (see rollups.py); minute buckets expire, hour buckets are kept
+    ROLLUP_INTERVAL_SECONDS: int = 60
+    ROLLUP_LAG_SECONDS: int = 120
+    ROLLUP_BACKFILL_HOURS: int = 72
+    ROLLUP_MINUTE_RETENTION_DAYS: int = 14
+
+    # GET /planes/viewport: aircraft are clustered when more than VIEWPORT_MAX_PLANES are in view;
+    # clusters are about VIEWPORT_CLUSTER_PX screen pixels wide
+    VIEWPORT_MAX_PLANES: int = 1500
+    VIEWPORT_CLUSTER_PX: int = 64
+
+    # Largest page for cursor-paged list endpoints (see paging.py)
+    PAGE_MAX_LIMIT: int = 5000
+    # Archive/track exports (see export.py): documents per cursor batch / Parquet row group
+    EXPORT_BATCH_SIZE: int = 5000
+    EXPORT_MAX_BATCH_SIZE: int = 50000
+
+    # Geofence alerting (see geofence.py)
+    GEOFENCE_GRID_DEG: float = 0.1
+    GEOFENCE_ALERT_EXPIRY_SECONDS: int = 300
+    # How often each process checks for zone edits made elsewhere and expires unseen alerts
+    GEOFENCE_SYNC_SECONDS: float = 5
+
 
     class Config:
         env_file = '.env'
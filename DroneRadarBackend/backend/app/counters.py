@@ -0,0 +1,123 @@
+"""Materialized statistics counters for the admin dashboard.
+
+`/statistics/overview` reads a single document (`stats`, `_id: 'overview'`)
+instead of counting the `planes` collection on every request. The ingest
+and archive paths keep its plane and archive counters current with `$inc`.
+Writes whose effect on the counters isn't known cheaply (single deletes,
+drone reports that change the drone_type/altitude breakdowns, bulk writes
+with errors) only mark the document `dirty`.
+
+A dirty document, one older than STATS_RECOMPUTE_SECONDS, or any
+`?exact=true` request is rebuilt from scratch with one `$facet` aggregation.
+The periodic rebuild also corrects drift the hooks can't see, such as an
+icao reported by both feeds switching source in a bulk upsert.
+"""
+from . import archive_store, database
+from .config import settings
+from collections import Counter
+from datetime import datetime
+from typing import Optional
+import logging
+
+logger = logging.getLogger('backend.counters')
+
+STATS_ID = 'overview'
+# Sources counted as live aircraft rather than reports
+AIRCRAFT_SOURCES = ('opensky', 'ogn')
+# dronereport fields broken down in the overview (document field -> overview key)
+DRONE_BREAKDOWNS = (('drone_type', 'drone_types'), ('altitude', 'drone_altitudes'))
+
+
+def _key(value) -> Optional[str]:
+    """The counter field name for a source, or None if it can't be used as a Mongo path."""
+    key = 'unknown' if value is None else str(value)
+    if not key or '.' in key or key.startswith('$') or '\0' in key:
+        return None
+    return key
+
+
+def affects_breakdowns(doc: dict) -> bool:
+    """Whether adding/removing `doc` changes the per drone_type/altitude counts."""
+    return doc.get('source') == 'dronereport' and any(doc.get(field) for field, _ in DRONE_BREAKDOWNS)
+
+
+async def record(added: Optional[Counter] = None, removed: Optional[Counter] = None,
+                 archived: int = 0, dirty: bool = False):
+    """Apply per-source deltas after a committed write. Never raises."""
+    inc = Counter()
+    for sign, counts in ((1, added), (-1, removed)):
+        for source, n in (counts or {}).items():
+            if not n:
+                continue
+            key = _key(source)
+            if key is None:
+                dirty = True
+                continue
+            inc[f'by_source.{key}'] += sign * n
+            inc['total_planes'] += sign * n
+    if archived:
+        inc['archived_reports'] += archived
+    inc = {k: v for k, v in inc.items() if v}
+    if not inc and not dirty:
+        return
+    update = {'$set': {'updated_at': datetime.utcnow()}}
+    if inc:
+        update['$inc'] = inc
+    if dirty:
+        update['$set']['dirty'] = True
+    try:
+        await database.db.stats.update_one({'_id': STATS_ID}, update, upsert=True)
+    except Exception as e:
+        logger.warning('Failed to update statistics counters: %s', e)
+
+
+async def mark_dirty():
+    await record(dirty=True)
+
+
+async def recompute() -> dict:
+    """Rebuild the counters from `planes` (one `$facet` aggregation) and the archive partitions."""
+    def breakdown(field: str) -> list:
+        return [
+            # Same as the old per-value loop: skip missing/empty values
+            {'$match': {'source': 'dronereport', field: {'$nin': [None, '', 0, False]}}},
+            {'$group': {'_id': f'${field}', 'count': {'$sum': 1}}},
+        ]
+
+    facets = {'by_source': [{'$group': {'_id': '$source', 'count': {'$sum': 1}}}]}
+    for field, name in DRONE_BREAKDOWNS:
+        facets[name] = breakdown(field)
+    result = (await database.db.planes.aggregate([{'$facet': facets}]).to_list(length=1))[0]
+
+    now = datetime.utcnow()
+    by_source = {}
+    for item in result['by_source']:
+        key = 'unknown' if item['_id'] is None else str(item['_id'])
+        by_source[key] = by_source.get(key, 0) + item['count']
+    doc = {
+        '_id': STATS_ID,
+        'total_planes': sum(by_source.values()),
+        'by_source': by_source,
+        'archived_reports': await (await archive_store.view()).count_documents({}),
+        'computed_at': now,
+        'updated_at': now,
+        'dirty': False,
+    }
+    for _, name in DRONE_BREAKDOWNS:
+        doc[name] = {str(item['_id']): item['count'] for item in result[name]}
+    await database.db.stats.replace_one({'_id': STATS_ID}, doc, upsert=True)
+    return doc
+
+
+async def overview(exact: bool = False) -> dict:
+    """The counters document, recomputed first if requested, dirty or stale."""
+    doc = await database.db.stats.find_one({'_id': STATS_ID})
+    stale = (
+        doc is None
+        or doc.get('dirty')
+        or doc.get('computed_at') is None
+        or (datetime.utcnow() - doc['computed_at']).total_seconds() > settings.STATS_RECOMPUTE_SECONDS
+    )
+    if exact or stale:
+        doc = await recompute()
+    return doc
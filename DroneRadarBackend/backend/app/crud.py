@@ -1,21 +1,28 @@
-from . import database
+from . import archive_store, counters, database
+from .config import settings
+from .live_state import store as live_state
+from .geofence import engine as geofence
 from .schemas import PlaneIn
 from typing import List, Optional
+from collections import Counter
 from datetime import datetime, timedelta
+from pymongo import UpdateOne, DeleteOne, InsertOne, UpdateMany, DeleteMany
+from pymongo.errors import BulkWriteError
+from bson import ObjectId
+import asyncio
+import logging
+import time
 
+logger = logging.getLogger('backend.crud')
 
-async def upsert_plane(plane: PlaneIn):
-    """Insert or update a plane.
 
-    If the plane exists, append the previous position/last_seen to
-    `position_history` (if a previous position exists) and set the
-    new `position` / telemetry fields. If the plane does not exist,
-    create it with `created_at`.
+def _infer_source(doc: dict) -> dict:
+    """Ensure a canonical `source` exists on the document.
+
+    The ingestion pipeline generally sets this (e.g. 'opensky' for ADS-B
+    snapshots, 'dronereport' for form reports). If missing, attempt a
+    lightweight inference so consumers (UI) can rely on it.
     """
-    doc = plane.to_db()
-    # Ensure a canonical `source` exists on the document. The ingestion pipeline
-    # generally sets this (e.g. 'opensky' for ADS-B snapshots, 'dronereport' for form reports).
-    # If missing, attempt a lightweight inference so consumers (UI) can rely on it.
     if not doc.get('source'):
         inferred = None
         # If we have an ICAO identifier, it's ADS-B/OpenSky telemetry
@@ -27,6 +34,87 @@ async def upsert_plane(plane: PlaneIn):
         # default to unknown to avoid accidental classification
         if inferred:
             doc['source'] = inferred
+    return doc
+
+
+def _last_seen_from(doc: dict) -> datetime:
+    """Compute a sensible last_seen timestamp: prefer ts_unix if provided."""
+    ts_unix = doc.get('ts_unix')
+    if isinstance(ts_unix, (int, float)):
+        try:
+            return datetime.utcfromtimestamp(int(ts_unix))
+        except Exception:
+            pass
+    return datetime.utcnow()
+
+
+def _snapshot_upsert_pipeline(doc: dict, now: datetime, last_seen: datetime, only_newer: bool = False,
+                              earlier: Optional[List[dict]] = None) -> list:
+    """Build an update pipeline that upserts one plane without reading it first.
+
+    The first stage appends the *stored* position/last_seen to
+    `position_history` server-side (only when a previous position exists),
+    mirroring what `upsert_plane` does after its `find_one`, and keeps only
+    the last `POSITION_HISTORY_MAX` entries, followed by `earlier`: the
+    positions of this plane that came before `doc` in the same batch. The
+    second stage writes the new telemetry. Values are wrapped in `$literal`
+    so strings starting with `$` are never interpreted as field paths.
+
+    With `only_newer`, a record older than the stored `last_seen` leaves the
+    document untouched (used when replaying spooled batches after live data).
+    """
+    previous = {
+        '$cond': [
+            {'$ifNull': ['$position', False]},
+            [{'position': '$position', 'last_seen': {'$ifNull': ['$last_seen', now]}}],
+            [],
+        ]
+    }
+    history_push = {
+        '$slice': [
+            {'$concatArrays': [{'$ifNull': ['$position_history', []]}, previous, {'$literal': earlier or []}]},
+            -settings.POSITION_HISTORY_MAX,
+        ]
+    }
+    set_fields = {k: {'$literal': v} for k, v in doc.items()}
+    set_fields.update({
+        'created_at': {'$ifNull': ['$created_at', now]},
+        'updated_at': now,
+        'last_seen': last_seen,
+        'missed_updates': 0,
+    })
+    if not only_newer:
+        return [
+            {'$set': {'position_history': history_push}},
+            {'$set': set_fields},
+        ]
+    # A `$cond` falling back to the stored value (missing stays missing) keeps stale records out
+    return [
+        {'$set': {'_fresh': {'$gte': [last_seen, {'$ifNull': ['$last_seen', datetime(1970, 1, 1)]}]}}},
+        {'$set': {'position_history': {'$cond': ['$_fresh', history_push, {'$ifNull': ['$position_history', []]}]}}},
+        {'$set': {k: {'$cond': ['$_fresh', v, '$' + k]} for k, v in set_fields.items()}},
+        {'$unset': '_fresh'},
+    ]
+
+
+def _track_point(doc: dict) -> dict:
+    """Build a `track_points` entry (metaField `icao`, timeField `ts`) from a plane doc."""
+    point = {'icao': doc['icao'], 'ts': _last_seen_from(doc), 'position': doc['position']}
+    for f in ('source', 'alt', 'spd', 'heading', 'vr'):
+        if doc.get(f) is not None:
+            point[f] = doc[f]
+    return point
+
+
+async def upsert_plane(plane: PlaneIn):
+    """Insert or update a plane.
+
+    If the plane exists, append the previous position/last_seen to
+    `position_history` (if a previous position exists) and set the
+    new `position` / telemetry fields. If the plane does not exist,
+    create it with `created_at`.
+    """
+    doc = _infer_source(plane.to_db())
     # Determine canonical icao value (use 'icao' as the canonical key)
     canonical_icao = getattr(plane, 'icao', None) or getattr(plane, 'icao24', None)
     if canonical_icao is None:
@@ -34,6 +122,9 @@ async def upsert_plane(plane: PlaneIn):
         now = datetime.utcnow()
         new_doc = {**doc, 'created_at': now, 'last_seen': now, 'position_history': [], 'missed_updates': 0}
         res = await database.db.planes.insert_one(new_doc)
+        await counters.record(Counter([new_doc.get('source')]), dirty=counters.affects_breakdowns(new_doc))
+        await live_state.changed()
+        await geofence.evaluate([new_doc])
         return res
 
     filter_ = {'icao': canonical_icao}
@@ -43,21 +134,17 @@ async def upsert_plane(plane: PlaneIn):
 
     if not existing:
         # New document: ensure created_at and optional empty history
-        new_doc = {**doc, 'icao': canonical_icao, 'created_at': datetime.utcnow(), 'position_history': [], 'missed_updates': 0}
+        new_doc = {**doc, 'icao': canonical_icao, 'created_at': datetime.utcnow(), 'last_seen': _last_seen_from(doc),
+                   'position_history': [], 'missed_updates': 0}
         res = await database.db.planes.insert_one(new_doc)
+        await counters.record(Counter([new_doc.get('source')]), dirty=counters.affects_breakdowns(new_doc))
+        await live_state.changed()
+        await geofence.evaluate([new_doc])
         return res
 
     # Existing doc: build update
     update: dict = {}
-    # compute a sensible last_seen timestamp: prefer ts_unix if provided
-    ts_unix = doc.get('ts_unix')
-    if isinstance(ts_unix, (int, float)):
-        try:
-            last_seen_val = datetime.utcfromtimestamp(int(ts_unix))
-        except Exception:
-            last_seen_val = datetime.utcnow()
-    else:
-        last_seen_val = datetime.utcnow()
+    last_seen_val = _last_seen_from(doc)
 
     # reset missed_updates to 0 when we see a fresh update
     set_fields = {**doc, 'updated_at': datetime.utcnow(), 'last_seen': last_seen_val, 'missed_updates': 0}
@@ -74,29 +161,67 @@ async def upsert_plane(plane: PlaneIn):
     if set_fields:
         update['$set'] = set_fields
     if push_fields:
-        # Use $push to append the snapshot to position_history
-        update['$push'] = {k: v for k, v in push_fields.items()}
+        # Use $push to append the snapshot to position_history, keeping only the recent tail
+        update['$push'] = {k: {'$each': [v], '$slice': -settings.POSITION_HISTORY_MAX} for k, v in push_fields.items()}
 
     # Perform the update
     res = await database.db.planes.update_one(filter_, update)
+    if existing.get('source') != doc.get('source') or counters.affects_breakdowns(existing) or counters.affects_breakdowns(doc):
+        await counters.mark_dirty()
+    await live_state.changed()
+    await geofence.evaluate([{**doc, 'icao': canonical_icao}])
     return res
 
 
-async def upsert_planes_bulk(planes: List[PlaneIn]):
-    # Treat the incoming batch as a snapshot for this poll.
-    #  - Upsert any planes present (resetting their missed_updates to 0)
-    #  - If a plane in the incoming batch reports `on_ground` remove it immediately
-    #  - For any existing opensky-sourced plane NOT present in this snapshot,
-    #    increment `missed_updates` and delete those with missed_updates >= 3
-    results = []
-    incoming_icaos = []
+async def upsert_planes_bulk(planes: List[PlaneIn], snapshot: bool = True,
+                             alive: Optional[List[str]] = None, source: Optional[str] = None):
+    """Ingest a full snapshot from one source in a constant number of round trips.
 
-    # Determine source of incoming planes by first plane
-    p = planes[0]
-    bulk_source = getattr(p, 'source', None)
+    Treat the incoming batch as a snapshot for this poll:
+     - Upsert any planes present (resetting their missed_updates to 0)
+     - If a plane in the incoming batch reports `on_ground` remove it immediately
+     - For any existing opensky/ogn-sourced plane NOT present in this snapshot,
+       increment `missed_updates` and delete those with missed_updates >= 3
+
+    All per-plane writes go out as one unordered `bulk_write`; the previous
+    position is pushed into `position_history` by an update pipeline so no
+    per-plane read is needed. The missed_updates bookkeeping runs as a second,
+    ordered `bulk_write` because it must observe the upserts.
+
+    With `snapshot=False` (collectors replaying spooled batches) the batch is
+    not treated as a snapshot: missed_updates is left alone, and records
+    older than what is already stored neither overwrite nor delete a plane.
 
+    With `alive` (a delta snapshot) `planes` holds only the aircraft that
+    changed; the icaos in `alive` are still present but unchanged, so they
+    only have their missed_updates reset and count as seen. `source` names
+    the snapshot's source when `planes` may be empty. Alive icaos the
+    backend does not know (e.g. aged out meanwhile) are returned in
+    `summary['unknown']` so the collector resends them in full.
 
-    # First pass: handle incoming planes
+    Returns a summary dict with write counts and per-phase timings (ms).
+    """
+    t_start = time.perf_counter()
+    now = datetime.utcnow()
+    summary = {'inserted': 0, 'upserted': 0, 'modified': 0, 'deleted': 0, 'write_errors': 0, 'timings_ms': {}}
+    alive = list(dict.fromkeys(alive or []))
+    if not planes and not alive:
+        return summary
+
+    # Determine source of incoming planes by first plane
+    bulk_source = source or getattr(planes[0], 'source', None)
+
+    # Keep only the last record per icao so unordered execution is deterministic;
+    # the positions before it still go to position_history and track_points
+    ops_by_icao = {}
+    source_by_icao = {}
+    earlier_by_icao = {}
+    track_points = []
+    live_upserts = {}
+    live_deleted = set()
+    standalone_docs = []
+    standalone_ops = []
+    incoming_icaos = []
     for p in planes:
         canonical_icao = getattr(p, 'icao', None) or getattr(p, 'icao24', None)
         if canonical_icao:
@@ -105,40 +230,164 @@ async def upsert_planes_bulk(planes: List[PlaneIn]):
         # If plane indicates it's on the ground, remove from DB if we have an icao
         if getattr(p, 'on_ground', None):
             if canonical_icao:
-                res = await database.db.planes.delete_one({'icao': canonical_icao})
-                results.append(res)
-            else:
-                # no icao: nothing to remove
-                results.append(None)
+                delete_filter = {'icao': canonical_icao}
+                if not snapshot:
+                    delete_filter['last_seen'] = {'$lte': _last_seen_from(p.to_db())}
+                ops_by_icao[canonical_icao] = DeleteOne(delete_filter)
+                earlier_by_icao.pop(canonical_icao, None)
+                live_upserts.pop(canonical_icao, None)
+                live_deleted.add(canonical_icao)
             continue
 
-        # otherwise upsert normally
-        r = await upsert_plane(p)
-        results.append(r)
-
-    # Second pass: increment missed_updates for opensky planes not seen in this snapshot
-    # Normalize incoming_icaos list for query
-    if bulk_source in ['opensky', 'ogn']:
+        doc = _infer_source(p.to_db())
+        if canonical_icao is None:
+            # No icao present: treat this as a standalone report (insert new doc)
+            # (assign `_id` up front so the live state can key the document)
+            new_doc = {**doc, '_id': ObjectId(), 'created_at': now, 'last_seen': now, 'position_history': [], 'missed_updates': 0}
+            standalone_docs.append(new_doc)
+            standalone_ops.append(InsertOne(new_doc))
+            continue
 
+        doc['icao'] = canonical_icao
+        source_by_icao[canonical_icao] = doc.get('source')
+        last_seen = _last_seen_from(doc)
+        superseded = live_upserts.get(canonical_icao)
+        if superseded is not None and superseded.get('position') is not None:
+            earlier_by_icao.setdefault(canonical_icao, []).append(
+                {'position': superseded['position'], 'last_seen': superseded['last_seen']})
+        earlier = earlier_by_icao.get(canonical_icao)
+        ops_by_icao[canonical_icao] = UpdateOne(
+            {'icao': canonical_icao},
+            _snapshot_upsert_pipeline(doc, now, last_seen, only_newer=not snapshot, earlier=earlier),
+            upsert=True,
+        )
+        live_upserts[canonical_icao] = {**doc, 'last_seen': last_seen}
+        live_deleted.discard(canonical_icao)
+        if doc.get('position'):
+            track_points.append(_track_point(doc))
+
+    operations = list(ops_by_icao.values()) + standalone_ops
+    # Source each operation adds a plane to (for the statistics counters)
+    op_sources = [source_by_icao.get(icao) for icao in ops_by_icao] + [d.get('source') for d in standalone_docs]
+    added, removed = Counter(), Counter()
+    t_built = time.perf_counter()
+
+    if operations:
+        try:
+            res = await database.db.planes.bulk_write(operations, ordered=False)
+            details = res.bulk_api_result
+        except BulkWriteError as e:
+            # Unordered: the remaining operations were still applied
+            details = e.details
+            logger.warning('Bulk ingest had %d write errors (first: %s)',
+                           len(details.get('writeErrors', [])),
+                           (details.get('writeErrors') or [{}])[0].get('errmsg'))
+        summary['inserted'] = details.get('nInserted', 0)
+        summary['upserted'] = details.get('nUpserted', 0)
+        summary['modified'] = details.get('nModified', 0)
+        summary['deleted'] = details.get('nRemoved', 0)
+        summary['write_errors'] = len(details.get('writeErrors', []))
+        for upserted in details.get('upserted', []):
+            added[op_sources[upserted['index']]] += 1
+        if summary['inserted']:
+            added.update(d.get('source') for d in standalone_docs)
+        # Landed planes are normally of this snapshot's source
+        removed[bulk_source] += summary['deleted']
+    if track_points:
+        try:
+            await database.db.track_points.insert_many(track_points, ordered=False)
+        except Exception as e:
+            # Track points are best-effort; the live picture is already written
+            logger.warning('Failed to record %d track points: %s', len(track_points), e)
+    if alive:
+        # Heartbeats: unchanged planes only need to count as seen in this snapshot
+        alive = [icao for icao in alive if icao not in ops_by_icao]
+        incoming_icaos.extend(alive)
+        res = await database.db.planes.update_many(
+            {'icao': {'$in': alive}, 'source': bulk_source},
+            {'$set': {'missed_updates': 0}},
+        )
+        if res.matched_count < len(alive):
+            known = await database.db.planes.distinct('icao', {'icao': {'$in': alive}, 'source': bulk_source})
+            summary['unknown'] = sorted(set(alive) - set(known))
+        await geofence.touch(alive)
+    t_written = time.perf_counter()
+
+    # Second pass: increment missed_updates for opensky/ogn planes not seen in this snapshot
+    if snapshot and bulk_source in ['opensky', 'ogn']:
         if incoming_icaos:
-            await database.db.planes.update_many(
-                {'icao': {'$nin': incoming_icaos}, 'source': bulk_source},
-                {'$inc': {'missed_updates': 1}}
-            )
+            missed_filter = {'icao': {'$nin': incoming_icaos}, 'source': bulk_source}
         else:
-            # No incoming icao values: increment all opensky planes
-            await database.db.planes.update_many({'source': bulk_source}, {'$inc': {'missed_updates': 1}})
-
-        # Remove planes which missed >= 3 consecutive snapshots
-        await database.db.planes.delete_many({'source': bulk_source, 'missed_updates': {'$gte': 3}})
-
-    return results
+            # No incoming icao values: increment all planes of this source
+            missed_filter = {'source': bulk_source}
+        res = await database.db.planes.bulk_write([
+            UpdateMany(missed_filter, {'$inc': {'missed_updates': 1}}),
+            # Remove planes which missed >= 3 consecutive snapshots
+            DeleteMany({'source': bulk_source, 'missed_updates': {'$gte': 3}}),
+        ], ordered=True)
+        summary['deleted'] += res.deleted_count
+        removed[bulk_source] += res.deleted_count
+    # Failed inserts and drone report breakdowns can't be counted incrementally
+    await counters.record(added, removed, dirty=bool(summary['write_errors']) or any(
+        counters.affects_breakdowns(d) for d in [*live_upserts.values(), *standalone_docs]))
+
+    version = await live_state.bump()
+    if summary['write_errors'] or version is None:
+        # Some writes didn't land; resync from Mongo rather than guess
+        live_state.invalidate()
+    else:
+        live_state.apply_bulk(
+            live_upserts, live_deleted, standalone_docs,
+            bulk_source if snapshot and bulk_source in ['opensky', 'ogn'] else None,
+            incoming_icaos, now, only_newer=not snapshot, alive=alive, earlier=earlier_by_icao,
+            version=version,
+        )
+    if snapshot:
+        # Replayed positions are stale; don't raise or end alerts from them
+        await geofence.evaluate(live_upserts.values())
+    t_done = time.perf_counter()
+
+    summary['timings_ms'] = {
+        'build': round((t_built - t_start) * 1000, 2),
+        'write': round((t_written - t_built) * 1000, 2),
+        'snapshot': round((t_done - t_written) * 1000, 2),
+        'total': round((t_done - t_start) * 1000, 2),
+    }
+    logger.info('Bulk ingest source=%s planes=%d alive=%d ops=%d upserted=%d modified=%d deleted=%d in %.1f ms (build %.1f, write %.1f, snapshot %.1f)',
+                bulk_source, len(planes), len(alive), len(operations), summary['upserted'], summary['modified'],
+                summary['deleted'], summary['timings_ms']['total'], summary['timings_ms']['build'],
+                summary['timings_ms']['write'], summary['timings_ms']['snapshot'])
+    return summary
 
 
 async def get_plane(icao: str) -> Optional[dict]:
     return await database.db.planes.find_one({'icao': icao}, projection={'_id': False})
 
 
+async def get_plane_track(icao: str, since: datetime, until: datetime, max_points: int = 500) -> List[dict]:
+    """Return the path of `icao` between `since` and `until`, downsampled server-side.
+
+    The time range is split into `max_points` equal buckets and the first
+    point of each bucket is kept, so the response size is bounded no matter
+    how long the aircraft has been tracked.
+    """
+    bucket_ms = max(1, int((until - since).total_seconds() * 1000 / max(1, max_points)))
+    pipeline = [
+        {'$match': {'icao': icao, 'ts': {'$gte': since, '$lte': until}}},
+        {'$sort': {'ts': 1}},
+        {'$group': {
+            '_id': {'$floor': {'$divide': [{'$subtract': ['$ts', since]}, bucket_ms]}},
+            'point': {'$first': '$$ROOT'},
+        }},
+        {'$sort': {'_id': 1}},
+        {'$limit': max_points},
+        {'$replaceRoot': {'newRoot': '$point'}},
+        {'$project': {'_id': False, 'icao': False}},
+    ]
+    cursor = database.db.track_points.aggregate(pipeline)
+    return await cursor.to_list(length=max_points)
+
+
 async def query_planes_near(lat: float, lon: float, radius_m: int = 5000, limit: int = 100):
     cursor = database.db.planes.find({
         'position': {
@@ -151,7 +400,7 @@ async def query_planes_near(lat: float, lon: float, radius_m: int = 5000, limit:
     return await cursor.to_list(length=limit)
 
 
-async def query_planes_bbox(min_lat, min_lon, max_lat, max_lon, limit=100):
+def bbox_query(min_lat, min_lon, max_lat, max_lon) -> dict:
     # polygon defined in GeoJSON coordinate order (lon lat)
     polygon = [
         [min_lon, min_lat],
@@ -160,34 +409,111 @@ async def query_planes_bbox(min_lat, min_lon, max_lat, max_lon, limit=100):
         [min_lon, max_lat],
         [min_lon, min_lat],
     ]
-    cursor = database.db.planes.find({
-        'position': {
-            '$geoWithin': {
-            '$polygon': polygon
-            }
-        }
-    }, projection={'_id': False}).limit(limit)
+    return {'position': {'$geoWithin': {'$polygon': polygon}}}
+
+
+async def query_planes_bbox(min_lat, min_lon, max_lat, max_lon, limit=100):
+    cursor = database.db.planes.find(bbox_query(min_lat, min_lon, max_lat, max_lon), projection={'_id': False}).limit(limit)
     return await cursor.to_list(length=limit)
 
 
+async def query_viewport(min_lat, min_lon, max_lat, max_lon, cell_deg: float, aircraft_sources,
+                         cluster: Optional[bool], limit: int):
+    """Viewport query against Mongo (used when the live state is unavailable).
+
+    Returns (clusters, planes, aircraft_count). Aircraft are aggregated into
+    `cell_deg` grid clusters server-side when `cluster` is True, or when it
+    is None and more than `limit` of them are in view; other documents
+    (reports) are always returned individually.
+    """
+    within = bbox_query(min_lat, min_lon, max_lat, max_lon)
+    aircraft = {**within, 'source': {'$in': list(aircraft_sources)}}
+    count = await database.db.planes.count_documents(aircraft)
+    if cluster is None:
+        cluster = count > limit
+    newest = [('last_seen', -1)]
+    if not cluster:
+        planes = await database.db.planes.find(within, projection={'_id': False}).sort(newest).limit(limit).to_list(length=limit)
+        return None, planes, count
+
+    lon = {'$arrayElemAt': ['$position.coordinates', 0]}
+    lat = {'$arrayElemAt': ['$position.coordinates', 1]}
+    pipeline = [
+        {'$match': aircraft},
+        {'$group': {
+            '_id': {'x': {'$floor': {'$divide': [lon, cell_deg]}}, 'y': {'$floor': {'$divide': [lat, cell_deg]}},
+                    'source': {'$ifNull': ['$source', 'unknown']}},
+            'count': {'$sum': 1}, 'lat': {'$sum': lat}, 'lon': {'$sum': lon},
+        }},
+        {'$group': {
+            '_id': {'x': '$_id.x', 'y': '$_id.y'},
+            'count': {'$sum': '$count'}, 'lat': {'$sum': '$lat'}, 'lon': {'$sum': '$lon'},
+            'sources': {'$push': {'k': '$_id.source', 'v': '$count'}},
+        }},
+    ]
+    rows = await database.db.planes.aggregate(pipeline).to_list(length=None)
+    clusters = [
+        {'lat': round(r['lat'] / r['count'], 5), 'lon': round(r['lon'] / r['count'], 5), 'count': r['count'],
+         'sources': {s['k']: s['v'] for s in r['sources']}}
+        for r in rows
+    ]
+    others = {**within, 'source': {'$nin': list(aircraft_sources)}}
+    planes = await database.db.planes.find(others, projection={'_id': False}).sort(newest).limit(limit).to_list(length=limit)
+    return clusters, planes, count
+
+
 async def delete_plane(icao: str):
-    return await database.db.planes.delete_one({'icao': icao})
+    res = await database.db.planes.delete_one({'icao': icao})
+    if res.deleted_count:
+        await counters.mark_dirty()
+    await live_state.changed()
+    return res
+
 
+async def prune_stale_planes(max_age_seconds: Optional[int] = None):
+    """Delete opensky/ogn planes not seen for `max_age_seconds` (default STALE_PLANE_SECONDS).
+
+    Snapshots age out planes of their own source, but if a collector stops
+    posting altogether its planes would otherwise stay on the map forever.
+    """
+    max_age_seconds = settings.STALE_PLANE_SECONDS if max_age_seconds is None else max_age_seconds
+    cutoff_time = datetime.utcnow() - timedelta(seconds=max_age_seconds)
+    removed = Counter()
+    for source in ('opensky', 'ogn'):
+        res = await database.db.planes.delete_many({'source': source, 'last_seen': {'$lt': cutoff_time}})
+        removed[source] = res.deleted_count
+    if sum(removed.values()):
+        await counters.record(removed=removed)
+        await live_state.changed()
+        logger.info('Pruned stale planes: %s', dict(removed))
+    return {'deleted': dict(removed)}
+
+
+async def archive_old_drone_reports(age_hours: Optional[float] = None, batch_size: Optional[int] = None):
+    """Move drone reports older than the specified age to the archive.
+
+    Reports move in batches of `batch_size`: one `insert_many` into the
+    current month's archive partition (see archive_store.py; keeping each
+    document's `_id`) and one `delete_many` by `_id` from `planes`,
+    yielding to the event loop between batches. Every batch
+    re-queries `planes`, so an interrupted run simply continues with
+    whatever is still there: documents archived but not yet deleted hit a
+    duplicate `_id` on the next insert, which is ignored, and are deleted.
 
-async def archive_old_drone_reports(age_hours: float = 1.0):
-    """Move drone reports older than the specified age to the archive collection.
-    
     Args:
-        age_hours: Age threshold in hours (default 1.0)
-        
+        age_hours: Age threshold in hours (default ARCHIVE_AGE_HOURS)
+        batch_size: Documents per batch (default ARCHIVE_BATCH_SIZE)
+
     Returns:
         Dictionary with counts of archived and deleted documents
     """
+    age_hours = settings.ARCHIVE_AGE_HOURS if age_hours is None else age_hours
+    batch_size = max(1, batch_size or settings.ARCHIVE_BATCH_SIZE)
     cutoff_time = datetime.utcnow() - timedelta(hours=age_hours)
 
     # Find reports older than the cutoff time for sources: dronereport, radar, camera
     sources = ['dronereport', 'radar', 'camera']
-    cursor = database.db.planes.find({
+    query = {
         '$and': [
             {
                 '$or': [
@@ -209,23 +535,67 @@ async def archive_old_drone_reports(age_hours: float = 1.0):
                 ]
             }
         ]
-    })
+    }
 
+    t_start = time.perf_counter()
     archived_count = 0
     deleted_count = 0
+    removed = Counter()
+    dirty = False
 
-    async for doc in cursor:
-        # Add archiving metadata
-        doc['archived_at'] = datetime.utcnow()
-        doc['original_last_seen'] = doc.get('last_seen')
+    while True:
+        batch = await database.db.planes.find(query).sort('_id', 1).limit(batch_size).to_list(length=batch_size)
+        if not batch:
+            break
 
-        # Insert into archive collection
-        await database.db.archive.insert_one(doc)
-        archived_count += 1
-
-        # Delete from planes collection
-        # Use _id for reliable deletion since we already have the doc
-        await database.db.planes.delete_one({'_id': doc['_id']})
-        deleted_count += 1
-
-    return {'archived': archived_count, 'deleted': deleted_count}
\ No newline at end of file
+        # Add archiving metadata
+        archived_at = datetime.utcnow()
+        for doc in batch:
+            doc['archived_at'] = archived_at
+            doc['original_last_seen'] = doc.get('last_seen')
+
+        # Reports an interrupted run already archived last month only need deleting
+        done = await archive_store.already_archived([doc['_id'] for doc in batch], archived_at)
+        pending = [archive_store.slim(doc) for doc in batch if doc['_id'] not in done]
+        inserted = pending
+        failed = []
+        try:
+            if pending:
+                partition = await archive_store.partition(archived_at)
+                res = await database.db[partition].insert_many(pending, ordered=False)
+                archived_count += len(res.inserted_ids)
+        except BulkWriteError as e:
+            archived_count += e.details.get('nInserted', 0)
+            errors = e.details.get('writeErrors', [])
+            inserted = [doc for i, doc in enumerate(pending) if i not in {err['index'] for err in errors}]
+            # Duplicate _id: already archived by an interrupted run, so still delete those below
+            failed = [err for err in errors if err.get('code') != 11000]
+            if failed:
+                logger.error('%d reports could not be archived (first: %s); stopping this run',
+                             len(failed), failed[0].get('errmsg'))
+                failed_ids = {pending[err['index']]['_id'] for err in failed}
+                batch = [doc for doc in batch if doc['_id'] not in failed_ids]
+        if inserted:
+            await archive_store.record(partition, inserted)
+
+        res = await database.db.planes.delete_many({'_id': {'$in': [doc['_id'] for doc in batch]}})
+        deleted_count += res.deleted_count
+        if res.deleted_count == len(batch):
+            removed.update(doc.get('source') for doc in batch)
+        else:
+            dirty = True
+        dirty = dirty or any(counters.affects_breakdowns(doc) for doc in batch)
+        if failed:
+            # The failed reports would be selected again forever
+            break
+        # Let ingest and API requests run between batches
+        await asyncio.sleep(0)
+
+    if archived_count or deleted_count:
+        await counters.record(removed=removed, archived=archived_count, dirty=dirty)
+    if deleted_count:
+        await live_state.changed()
+        elapsed = time.perf_counter() - t_start
+        logger.info('Archived %d reports (deleted %d from planes) in %.2f s (%.0f docs/s)',
+                    archived_count, deleted_count, elapsed, deleted_count / elapsed if elapsed > 0 else 0)
+    return {'archived': archived_count, 'deleted': deleted_count}
@@ -1,4 +1,5 @@
 from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorGridFSBucket
+from pymongo.errors import CollectionInvalid
 from .config import settings
 import asyncio
 import logging
@@ -40,6 +41,8 @@ async def init_db(retries: int = 20, delay: float = 0.5):
     await db.planes.create_index([('position', '2dsphere')])
     # Index last_seen to help with pruning and queries
     await db.planes.create_index('last_seen')
+    # Keyset paging of GET /planes (see paging.py)
+    await db.planes.create_index([('last_seen', -1), ('_id', -1)])
     # Index source and last_seen for efficient archiving queries
     await db.planes.create_index([('source', 1), ('last_seen', 1)])
     # Additional indexes to speed statistics queries and admin filters
@@ -48,11 +51,36 @@ async def init_db(retries: int = 20, delay: float = 0.5):
     await db.planes.create_index('admin_visible')
     await db.planes.create_index([('created_at', -1)])
 
-    # Ensure indexes for archive collection
+    # Indexes of the pre-partitioning archive collection (partitions: see archive_store.py)
     await db.archive.create_index([('position', '2dsphere')])
     await db.archive.create_index('archived_at')
+    await db.archive.create_index([('archived_at', -1), ('_id', -1)])
     await db.archive.create_index('original_last_seen')
 
+    # Time-series collection holding the full track of every aircraft
+    await init_track_points()
+
+    # Activity rollups: per-minute buckets expire, per-hour buckets are kept for long-term charts
+    await db.activity_rollups.create_index([('resolution', 1), ('ts', 1)])
+    await db.activity_rollups.create_index('ts', name='minute_buckets_ttl',
+                                           expireAfterSeconds=settings.ROLLUP_MINUTE_RETENTION_DAYS * 86400,
+                                           partialFilterExpression={'resolution': 'minute'})
+
+    # Background job run history
+    await db.job_runs.create_index('started_at', expireAfterSeconds=settings.JOB_HISTORY_DAYS * 86400)
+    await db.job_runs.create_index([('job', 1), ('started_at', -1)])
+
+    # Geofence zones and alerts; at most one active alert per (icao, zone)
+    await db.geofence_zones.create_index('zone_id', unique=True)
+    await db.alerts.create_index([('icao', 1), ('zone_id', 1)], unique=True,
+                                 partialFilterExpression={'status': 'active'})
+    await db.alerts.create_index([('started_at', -1)])
+    await db.alerts.create_index('status')
+
+    # Shared login lockout counters (LOCKOUT_STORE=mongo, see rate_store.py)
+    await db.rate_limits.create_index('expires_at', expireAfterSeconds=0)
+    await db.rate_limits.create_index([('key', 1), ('slot', 1)])
+
     # Ensure unique index on username in users collection
     await db.users.create_index('username', unique=True)
 
@@ -63,6 +91,20 @@ async def init_db(retries: int = 20, delay: float = 0.5):
     await init_default_users()
 
 
+async def init_track_points():
+    """Create the `track_points` time-series collection if it doesn't exist."""
+    try:
+        await db.create_collection(
+            'track_points',
+            timeseries={'timeField': 'ts', 'metaField': 'icao', 'granularity': 'seconds'},
+            expireAfterSeconds=settings.TRACK_RETENTION_HOURS * 3600,
+        )
+        logger.info('Created track_points time-series collection')
+    except CollectionInvalid:
+        pass
+    await db.track_points.create_index([('icao', 1), ('ts', 1)])
+
+
 async def init_default_users():
     """Create default users with passwords from config if they don't exist."""
     default_users = [
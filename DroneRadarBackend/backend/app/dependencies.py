@@ -1,5 +1,6 @@
 from slowapi import Limiter
 from fastapi import Request
+from .config import settings
 
 
 def get_real_ip(request: Request) -> str:
@@ -17,4 +18,11 @@ def get_real_ip(request: Request) -> str:
     return request.client.host if request.client else "unknown"
 
 
-limiter = Limiter(key_func=get_real_ip)
\ No newline at end of file
+# Route limits are shared across workers when RATE_LIMIT_STORAGE_URI points at Mongo or Redis;
+# if that storage is unreachable, limits fall back to per-process memory instead of failing requests.
+limiter = Limiter(
+    key_func=get_real_ip,
+    storage_uri=settings.RATE_LIMIT_STORAGE_URI,
+    strategy=settings.RATE_LIMIT_STRATEGY,
+    in_memory_fallback_enabled=not settings.RATE_LIMIT_STORAGE_URI.startswith('memory://'),
+)
@@ -0,0 +1,290 @@
+"""Bulk export of archived reports and track points.
+
+`GET /archive/export` and `python -m app.export` stream a dataset for a
+time range (and optionally a bbox, source or icao) as NDJSON, CSV or
+Parquet. Documents are read from a single Mongo cursor, oldest first, in
+batches of `batch_size` (also the cursor's batch size and the Parquet row
+group size), and each batch is encoded and sent before the next one is
+read, so memory stays bounded however many rows the export has.
+
+Datasets:
+
+- `archive`: archived reports, by `archived_at` (read partition by partition).
+- `tracks`: `track_points`, by `ts` (only as far back as TRACK_RETENTION_HOURS).
+
+NDJSON carries whole documents (`fields=` projects them as in paging.py).
+CSV and Parquet are tabular: they get the dataset's default columns unless
+`fields=` names others. `lat`/`lon` come from the GeoJSON position, and
+nested values are written as JSON strings. Parquet needs `pyarrow`.
+"""
+from . import archive_store, crud, database, paging
+from .config import settings
+from .live_state import encode_doc
+from datetime import datetime
+from typing import AsyncIterator, List, Optional, Sequence, Tuple
+import csv
+import io
+import json
+import logging
+import time
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # Parquet export is optional
+    pyarrow = None
+
+logger = logging.getLogger('backend.export')
+
+DATASETS = {
+    'archive': {
+        'collection': None,  # monthly partitions, see archive_store.py
+        'time_field': 'archived_at',
+        'columns': ('icao', 'source', 'created_at', 'original_last_seen', 'archived_at', 'lat', 'lon', 'alt',
+                    'altitude', 'drone_type', 'drone_description', 'notes', 'country', 'image_id'),
+    },
+    'tracks': {
+        'collection': 'track_points',
+        'time_field': 'ts',
+        'columns': ('icao', 'ts', 'lat', 'lon', 'source', 'alt', 'spd', 'heading', 'vr'),
+    },
+}
+# Format -> (media type, file extension)
+FORMATS = {
+    'ndjson': (paging.NDJSON, 'ndjson'),
+    'csv': ('text/csv', 'csv'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+# Typed Parquet columns; everything else is written as a string
+FLOAT_COLUMNS = {'lat', 'lon', 'alt', 'geo_alt', 'spd', 'heading', 'vr'}
+TIME_COLUMNS = {'ts', 'archived_at', 'created_at', 'original_last_seen', 'last_seen'}
+
+
+class ExportError(ValueError):
+    pass
+
+
+def build_query(dataset: str, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                bbox: Optional[Tuple[float, float, float, float]] = None,
+                source: Optional[str] = None, icao: Optional[str] = None) -> dict:
+    time_field = DATASETS[dataset]['time_field']
+    query = {}
+    window = {}
+    if start:
+        window['$gte'] = start
+    if end:
+        window['$lt'] = end
+    if window:
+        query[time_field] = window
+    if bbox:
+        query.update(crud.bbox_query(*bbox))
+    if source:
+        query['source'] = source
+    if icao:
+        query['icao'] = icao
+    return query
+
+
+def columns_for(dataset: str, fields: Optional[str]) -> List[str]:
+    if not fields:
+        return list(DATASETS[dataset]['columns'])
+    return [name for name, include in paging.projection(fields).items() if include]
+
+
+def _value(doc: dict, column: str):
+    if column in ('lat', 'lon') and column not in doc:
+        coords = (doc.get('position') or {}).get('coordinates') or (None, None)
+        return coords[1] if column == 'lat' else coords[0]
+    value = doc
+    for part in column.split('.'):
+        value = value.get(part) if isinstance(value, dict) else None
+    return value
+
+
+def _text(value) -> Optional[str]:
+    if value is None or isinstance(value, str):
+        return value
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, default=str, ensure_ascii=False, separators=(',', ':'))
+    return str(value)
+
+
+def _float(value) -> Optional[float]:
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+async def _batches(cursor, batch_size: int) -> AsyncIterator[List[dict]]:
+    batch = []
+    async for doc in cursor:
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def _ndjson(batches) -> AsyncIterator[bytes]:
+    async for batch in batches:
+        yield b''.join(encode_doc(doc) + b'\n' for doc in batch)
+
+
+async def _csv(batches, columns: Sequence[str]) -> AsyncIterator[bytes]:
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(columns)
+    async for batch in batches:
+        writer.writerows([_text(_value(doc, c)) for c in columns] for doc in batch)
+        yield out.getvalue().encode('utf-8')
+        out.seek(0)
+        out.truncate()
+    if out.tell():
+        yield out.getvalue().encode('utf-8')
+
+
+class _Sink:
+    """Write-only file for ParquetWriter; the bytes written so far are drained after each row group."""
+
+    def __init__(self):
+        self.chunks: List[bytes] = []
+        self.closed = False
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data, self.chunks = b''.join(self.chunks), []
+        return data
+
+
+def _arrow_schema(columns: Sequence[str]):
+    def arrow_type(column):
+        if column in FLOAT_COLUMNS:
+            return pyarrow.float64()
+        if column in TIME_COLUMNS:
+            return pyarrow.timestamp('ms')
+        return pyarrow.string()
+    return pyarrow.schema([(c, arrow_type(c)) for c in columns])
+
+
+def _arrow_values(docs: List[dict], column: str) -> list:
+    values = [_value(doc, column) for doc in docs]
+    if column in FLOAT_COLUMNS:
+        return [_float(v) for v in values]
+    if column in TIME_COLUMNS:
+        return [v if isinstance(v, datetime) else None for v in values]
+    return [_text(v) for v in values]
+
+
+async def _parquet(batches, columns: Sequence[str]) -> AsyncIterator[bytes]:
+    schema = _arrow_schema(columns)
+    sink = _Sink()
+    writer = pyarrow.parquet.ParquetWriter(sink, schema, compression='zstd')
+    async for batch in batches:
+        table = pyarrow.Table.from_pydict({c: _arrow_values(batch, c) for c in columns}, schema=schema)
+        writer.write_table(table)
+        data = sink.drain()
+        if data:
+            yield data
+    writer.close()
+    yield sink.drain()
+
+
+def check_format(fmt: str):
+    if fmt not in FORMATS:
+        raise ExportError(f'format must be one of {", ".join(FORMATS)}')
+    if fmt == 'parquet' and pyarrow is None:
+        raise ExportError('Parquet export needs pyarrow installed')
+
+
+async def export(dataset: str, fmt: str, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                 bbox: Optional[Tuple[float, float, float, float]] = None, source: Optional[str] = None,
+                 icao: Optional[str] = None, fields: Optional[str] = None,
+                 batch_size: Optional[int] = None) -> AsyncIterator[bytes]:
+    """Encoded chunks of the export, one per batch of documents."""
+    check_format(fmt)
+    spec = DATASETS[dataset]
+    query = build_query(dataset, start, end, bbox, source, icao)
+    batch_size = max(1, min(batch_size or settings.EXPORT_BATCH_SIZE, settings.EXPORT_MAX_BATCH_SIZE))
+    if fmt == 'ndjson':
+        proj = paging.projection(fields)
+    else:
+        # Only what the columns need (lat/lon fall back to the position)
+        columns = columns_for(dataset, fields)
+        proj = {c.split('.')[0]: True for c in columns}
+        proj.update(position=True, _id=False)
+    if dataset == 'archive':
+        # Only the monthly partitions the range / bbox touch (see archive_store.py)
+        collection = await archive_store.view(start, end, bbox)
+    else:
+        collection = database.db[spec['collection']]
+    cursor = collection.find(query, projection=proj).sort(spec['time_field'], 1).batch_size(batch_size)
+    batches = _batches(cursor, batch_size)
+
+    if fmt == 'ndjson':
+        chunks = _ndjson(batches)
+    elif fmt == 'csv':
+        chunks = _csv(batches, columns)
+    else:
+        chunks = _parquet(batches, columns)
+
+    t0 = time.perf_counter()
+    size = 0
+    async for chunk in chunks:
+        size += len(chunk)
+        yield chunk
+    logger.info('Exported %s as %s: %.1f MB in %.1fs', dataset, fmt, size / 1e6, time.perf_counter() - t0)
+
+
+def filename(dataset: str, fmt: str, start: Optional[datetime], end: Optional[datetime]) -> str:
+    span = '_'.join(d.strftime('%Y%m%dT%H%M') for d in (start, end) if d) or 'all'
+    return f'{dataset}_{span}.{FORMATS[fmt][1]}'
+
+
+if __name__ == '__main__':
+    import argparse
+    import asyncio
+    import sys
+
+    parser = argparse.ArgumentParser(description='Export archived reports or track points.')
+    parser.add_argument('--dataset', choices=sorted(DATASETS), default='archive')
+    parser.add_argument('--format', choices=sorted(FORMATS), default='ndjson')
+    parser.add_argument('--start', type=datetime.fromisoformat, help='ISO-8601, UTC')
+    parser.add_argument('--end', type=datetime.fromisoformat, help='ISO-8601, UTC (exclusive)')
+    parser.add_argument('--bbox', help='min_lat,min_lon,max_lat,max_lon')
+    parser.add_argument('--source')
+    parser.add_argument('--icao')
+    parser.add_argument('--fields', help='comma-separated fields / columns')
+    parser.add_argument('--batch-size', type=int)
+    parser.add_argument('-o', '--output', help='output file (default: stdout)')
+    args = parser.parse_args()
+
+    async def main():
+        from motor.motor_asyncio import AsyncIOMotorClient
+        database.db = AsyncIOMotorClient(settings.MONGO_URI)[settings.MONGO_DB]
+        bbox = tuple(float(x) for x in args.bbox.split(',')) if args.bbox else None
+        out = open(args.output, 'wb') if args.output else sys.stdout.buffer
+        try:
+            async for chunk in export(args.dataset, args.format, args.start, args.end, bbox, args.source, args.icao,
+                                      args.fields, args.batch_size):
+                out.write(chunk)
+        finally:
+            if args.output:
+                out.close()
+
+    try:
+        asyncio.run(main())
+    except ExportError as e:
+        sys.exit(str(e))
@@ -0,0 +1,303 @@
+"""Server-side geofence evaluation.
+
+Zones (circles and polygons) live in the `geofence_zones` collection and are
+indexed in memory on a grid of `GEOFENCE_GRID_DEG` degree cells, so each
+ingested position is only tested against the few zones whose bounding box
+covers its cell.
+
+An alert is raised when a plane is first seen inside a zone and ended when
+it is seen outside it again, or when it has not been seen for
+`GEOFENCE_ALERT_EXPIRY_SECONDS`. Open alerts are read from the `alerts`
+collection, not kept in memory, so every worker and replica sees the same
+state: each evaluated batch upserts the active alert of every hit (a partial
+unique index on active (icao, zone_id) pairs makes the first writer win),
+ends the active alerts of planes now seen outside their zone, and the
+transitions this process wrote are pushed to its `/alerts/stream`
+subscribers.
+
+Zone edits bump `zones_version` in the `geofence` document of `stats`;
+every process compares it with the version it loaded at most every
+`GEOFENCE_SYNC_SECONDS` (expiring unseen alerts at the same time) and
+reloads its zones when it changed.
+"""
+from . import database
+from .config import settings
+from .live_state import Subscription, haversine_m, encode_doc
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+import asyncio
+import logging
+import math
+import time
+
+logger = logging.getLogger('backend.geofence')
+
+# Airport corridors previously hard-coded in the authority page
+DEFAULT_ZONES = [
+    {'zone_id': 'BRU', 'name': 'Brussels-Zaventem', 'center': [4.4844, 50.9010]},
+    {'zone_id': 'CRL', 'name': 'Brussels South Charleroi', 'center': [4.4516, 50.4593]},
+    {'zone_id': 'LGG', 'name': 'Liège Airport', 'center': [5.4375, 50.6330]},
+    {'zone_id': 'ANR', 'name': 'Antwerp Airport', 'center': [4.4144, 51.1897]},
+    {'zone_id': 'MST', 'name': 'Maastricht Airport', 'center': [5.7755, 50.9170]},
+]
+DEFAULT_CORRIDOR_RADIUS_M = 3000
+DEFAULT_ZONE_SOURCES = ['dronereport', 'camera', 'radar']
+# `stats` document holding the zones version
+STATE_ID = 'geofence'
+
+
+def point_in_polygon(lon: float, lat: float, ring: List[List[float]]) -> bool:
+    """Ray-casting test of a point against a [lon, lat] ring."""
+    inside = False
+    j = len(ring) - 1
+    for i in range(len(ring)):
+        xi, yi = ring[i]
+        xj, yj = ring[j]
+        if (yi > lat) != (yj > lat) and lon < (xj - xi) * (lat - yi) / (yj - yi) + xi:
+            inside = not inside
+        j = i
+    return inside
+
+
+class Zone:
+    def __init__(self, doc: dict):
+        self.zone_id = doc['zone_id']
+        self.name = doc.get('name') or self.zone_id
+        self.kind = doc.get('kind', 'circle')
+        self.sources = set(doc['sources']) if doc.get('sources') else None
+        if self.kind == 'circle':
+            self.center_lon, self.center_lat = doc['center']
+            self.radius_m = float(doc['radius_m'])
+            dlat = math.degrees(self.radius_m / 6378100.0)
+            dlon = min(180.0, dlat / max(1e-6, math.cos(math.radians(self.center_lat))))
+            self.bounds = (self.center_lat - dlat, self.center_lon - dlon, self.center_lat + dlat, self.center_lon + dlon)
+        else:
+            self.ring = doc['polygon']
+            lons = [p[0] for p in self.ring]
+            lats = [p[1] for p in self.ring]
+            self.bounds = (min(lats), min(lons), max(lats), max(lons))
+
+    def applies_to(self, source: Optional[str]) -> bool:
+        return self.sources is None or source in self.sources
+
+    def test(self, lon: float, lat: float) -> Optional[dict]:
+        """Return hit details if the point lies inside the zone, else None."""
+        min_lat, min_lon, max_lat, max_lon = self.bounds
+        if not (min_lat <= lat <= max_lat and min_lon <= lon <= max_lon):
+            return None
+        if self.kind == 'circle':
+            distance = haversine_m(lat, lon, self.center_lat, self.center_lon)
+            if distance > self.radius_m:
+                return None
+            # Same bands the authority page used for its 3 km corridors
+            ratio = distance / self.radius_m
+            severity = 'critical' if ratio < 1 / 3 else 'high' if ratio < 2 / 3 else 'medium'
+            return {'distance_m': round(distance), 'severity': severity}
+        if point_in_polygon(lon, lat, self.ring):
+            return {'distance_m': None, 'severity': 'high'}
+        return None
+
+
+class GeofenceEngine:
+    def __init__(self, grid_deg: float = 0.1):
+        self.grid_deg = grid_deg
+        self.zones: Dict[str, Zone] = {}
+        self.grid: Dict[Tuple[int, int], List[Zone]] = {}
+        self.version: Optional[int] = None
+        self.synced_at: Optional[float] = None
+        self._subscribers: set = set()
+        self._lock = asyncio.Lock()
+
+    def _cell(self, lon: float, lat: float) -> Tuple[int, int]:
+        return (math.floor(lon / self.grid_deg), math.floor(lat / self.grid_deg))
+
+    async def load(self):
+        """Load zones, seeding the default airport corridors."""
+        if await database.db.geofence_zones.count_documents({}) == 0:
+            await database.db.geofence_zones.insert_many([
+                {**z, 'kind': 'circle', 'radius_m': DEFAULT_CORRIDOR_RADIUS_M,
+                 'sources': DEFAULT_ZONE_SOURCES, 'active': True, 'created_at': datetime.utcnow()}
+                for z in DEFAULT_ZONES
+            ])
+            logger.info('Seeded %d default geofence zones', len(DEFAULT_ZONES))
+        await self.load_zones()
+
+    async def zones_changed(self):
+        """Record a zone edit so that every process reloads its zones."""
+        await database.db.stats.update_one({'_id': STATE_ID}, {'$inc': {'zones_version': 1}}, upsert=True)
+        await self.load_zones()
+
+    async def load_zones(self):
+        state = await database.db.stats.find_one({'_id': STATE_ID}) or {}
+        zones, grid = {}, {}
+        async for doc in database.db.geofence_zones.find({'active': {'$ne': False}}):
+            try:
+                zone = Zone(doc)
+            except (KeyError, TypeError, ValueError) as e:
+                logger.warning('Skipping invalid geofence zone %s: %s', doc.get('zone_id'), e)
+                continue
+            zones[zone.zone_id] = zone
+            min_lat, min_lon, max_lat, max_lon = zone.bounds
+            x0, y0 = self._cell(min_lon, min_lat)
+            x1, y1 = self._cell(max_lon, max_lat)
+            for x in range(x0, x1 + 1):
+                for y in range(y0, y1 + 1):
+                    grid.setdefault((x, y), []).append(zone)
+        self.zones, self.grid = zones, grid
+        self.version = state.get('zones_version', 0)
+        self.synced_at = time.monotonic()
+        logger.info('Loaded %d geofence zones (version %d)', len(zones), self.version)
+
+    async def _reload_if_changed(self):
+        state = await database.db.stats.find_one({'_id': STATE_ID}) or {}
+        if state.get('zones_version', 0) != self.version:
+            await self.load_zones()
+        self.synced_at = time.monotonic()
+
+    async def _expire(self):
+        now = datetime.utcnow()
+        cutoff = now - timedelta(seconds=settings.GEOFENCE_ALERT_EXPIRY_SECONDS)
+        expired = await database.db.alerts.find(
+            {'status': 'active', 'last_seen': {'$lt': cutoff}}, projection={'icao': 1, 'zone_id': 1},
+        ).to_list(length=None)
+        if not expired:
+            return
+        await database.db.alerts.bulk_write([
+            UpdateOne({'_id': a['_id'], 'status': 'active'}, {'$set': {'status': 'ended', 'ended_at': now}})
+            for a in expired
+        ], ordered=False)
+        for a in expired:
+            self._publish('ended', {'icao': a['icao'], 'zone_id': a['zone_id'], 'ended_at': now})
+
+    async def evaluate(self, docs: Iterable[dict]):
+        """Check plane documents (with `icao` and `position`) against all zones.
+
+        Writes enter/exit transitions to the `alerts` collection and notifies
+        stream subscribers. Never raises: alerting must not fail ingestion.
+        """
+        try:
+            async with self._lock:
+                # Zones edited by another process, and alert expiry, are checked every GEOFENCE_SYNC_SECONDS
+                due = self.synced_at is None or time.monotonic() - self.synced_at >= settings.GEOFENCE_SYNC_SECONDS
+                if due:
+                    await self._reload_if_changed()
+                if self.zones:
+                    await self._evaluate(docs)
+                if due:
+                    await self._expire()
+        except Exception as e:
+            logger.error('Geofence evaluation failed: %s', e, exc_info=True)
+
+    async def _evaluate(self, docs: Iterable[dict]):
+        now = datetime.utcnow()
+        ops, entering = [], []
+        # icao -> zone_ids it is inside now, for every positioned plane of the batch
+        inside: Dict[str, set] = {}
+        for doc in docs:
+            icao = doc.get('icao')
+            pos = doc.get('position')
+            if not icao or not pos:
+                continue
+            lon, lat = pos['coordinates']
+            source = doc.get('source')
+            inside[icao] = set()
+            for zone in self.grid.get(self._cell(lon, lat), ()):
+                if not zone.applies_to(source):
+                    continue
+                hit = zone.test(lon, lat)
+                if hit is None:
+                    continue
+                inside[icao].add(zone.zone_id)
+                alert = {
+                    'icao': icao,
+                    'zone_id': zone.zone_id,
+                    'zone_name': zone.name,
+                    'zone_kind': zone.kind,
+                    'source': source,
+                    'position': pos,
+                    'status': 'active',
+                    'started_at': now,
+                    'report': {k: doc[k] for k in ('flight', 'drone_description', 'notes', 'image_id', 'alt', 'country') if doc.get(k) is not None},
+                    **hit,
+                }
+                # Inserted only if no process has an active alert for the pair yet
+                ops.append(UpdateOne(
+                    {'icao': icao, 'zone_id': zone.zone_id, 'status': 'active'},
+                    {'$setOnInsert': alert, '$set': {'last_seen': now}},
+                    upsert=True,
+                ))
+                entering.append({**alert, 'last_seen': now})
+        if not inside:
+            return
+
+        # Seen outside a zone it was alerting on: end that alert
+        cursor = database.db.alerts.find({'icao': {'$in': list(inside)}, 'status': 'active'},
+                                         projection={'icao': 1, 'zone_id': 1})
+        ended = [a async for a in cursor if a['zone_id'] not in inside[a['icao']]]
+        ops += [UpdateOne({'_id': a['_id'], 'status': 'active'}, {'$set': {'status': 'ended', 'ended_at': now}})
+                for a in ended]
+
+        upserted = []
+        if ops:
+            try:
+                details = (await database.db.alerts.bulk_write(ops, ordered=False)).bulk_api_result
+            except BulkWriteError as e:
+                # Duplicate keys: another process opened the same alert first
+                details = e.details
+                errors = [err for err in details.get('writeErrors', []) if err.get('code') != 11000]
+                if errors:
+                    logger.warning('Alert write errors: %s', errors)
+            upserted = [entering[u['index']] for u in details.get('upserted', [])]
+        if upserted:
+            logger.info('Geofence: %d new alert(s): %s', len(upserted), ', '.join(f"{a['icao']}@{a['zone_id']}" for a in upserted))
+        for alert in upserted:
+            self._publish('alert', alert)
+        for a in ended:
+            self._publish('ended', {'icao': a['icao'], 'zone_id': a['zone_id'], 'ended_at': now})
+
+    async def touch(self, icaos: Iterable[str]):
+        """Keep active alerts of planes reported alive-but-unchanged from expiring."""
+        icaos = list(icaos)
+        if not self.zones or not icaos:
+            return
+        try:
+            await database.db.alerts.update_many({'icao': {'$in': icaos}, 'status': 'active'},
+                                                 {'$set': {'last_seen': datetime.utcnow()}})
+        except Exception as e:
+            logger.error('Failed to refresh geofence alerts: %s', e)
+
+    async def end_zone(self, zone_id: str):
+        """End the active alerts of a deleted or deactivated zone."""
+        now = datetime.utcnow()
+        ended = await database.db.alerts.find({'zone_id': zone_id, 'status': 'active'},
+                                              projection={'icao': 1}).to_list(length=None)
+        if ended:
+            await database.db.alerts.update_many({'zone_id': zone_id, 'status': 'active'},
+                                                 {'$set': {'status': 'ended', 'ended_at': now}})
+        for a in ended:
+            self._publish('ended', {'icao': a['icao'], 'zone_id': zone_id, 'ended_at': now})
+
+    # ---- alert stream ----
+
+    def subscribe(self) -> Subscription:
+        sub = Subscription(maxsize=settings.LIVE_STREAM_QUEUE_SIZE)
+        self._subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscription):
+        self._subscribers.discard(sub)
+
+    def _publish(self, event: str, payload: dict):
+        if not self._subscribers:
+            return
+        message = (event, encode_doc(payload))
+        for sub in self._subscribers:
+            try:
+                sub.queue.put_nowait(message)
+            except asyncio.QueueFull:
+                sub.overflowed = True
+
+
+engine = GeofenceEngine(grid_deg=settings.GEOFENCE_GRID_DEG)
@@ -0,0 +1,412 @@
+"""In-process live picture of the `planes` collection.
+
+The ingest path applies every committed snapshot to this store, so
+`GET /planes` (default list, bbox and radius) is answered from memory
+instead of querying Mongo on every poll. Mongo stays the durable store:
+anything that writes to `planes` outside the bulk ingest path calls
+`changed()`, and the store reloads from Mongo on the next read (and at
+least every `LIVE_STATE_RESYNC_SECONDS` to correct any drift).
+
+Every write to `planes` also bumps a version shared by all workers and
+replicas (the `live_state` document in `stats`). The ETag, the response
+cache and stream snapshots use that version, and each process compares its
+own with it at most every `LIVE_STATE_SYNC_SECONDS`, reloading when another
+process wrote in the meantime. So an `If-None-Match` means the same on every
+worker, and no worker serves planes older than that interval.
+
+Each plane is kept alongside its pre-encoded JSON bytes, and a spatial grid
+of `LIVE_STATE_GRID_DEG` degree cells narrows bbox/radius lookups to the
+cells that can contain a match.
+
+Every change (ingest batch or reload) is also published as a delta of
+added/moved/removed planes to subscribers (see `subscribe()`), which
+back `/planes/stream`.
+"""
+from . import database
+from .config import settings
+from datetime import datetime
+from pymongo import ReturnDocument
+from typing import Dict, Iterable, List, Optional, Tuple
+import asyncio
+import json
+import logging
+import math
+import os
+import time
+
+logger = logging.getLogger('backend.live_state')
+
+# Same sphere radius Mongo uses for 2dsphere distance calculations
+EARTH_RADIUS_M = 6378100.0
+# `stats` document holding the shared version
+STATE_ID = 'live_state'
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def encode_doc(doc: dict) -> bytes:
+    """Serialize a plane document the way FastAPI's default encoder would."""
+    return json.dumps(doc, default=_json_default, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def haversine_m(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp = p2 - p1
+    dl = math.radians(lon2 - lon1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+def _coords(doc: dict) -> Optional[Tuple[float, float]]:
+    """Return (lon, lat) of a document's GeoJSON position, if any."""
+    pos = doc.get('position')
+    if not pos:
+        return None
+    try:
+        lon, lat = pos['coordinates']
+        return float(lon), float(lat)
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+class Subscription:
+    """A stream consumer's bounded queue of deltas.
+
+    If the consumer falls behind and the queue fills up, further deltas are
+    dropped and `overflowed` is set so the consumer resends a full snapshot.
+    """
+
+    def __init__(self, maxsize: int):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.overflowed = False
+
+
+class LiveState:
+    def __init__(self, grid_deg: float = 0.5):
+        self.grid_deg = grid_deg
+        self.planes: Dict[str, dict] = {}
+        self.encoded: Dict[str, bytes] = {}
+        self.cells: Dict[str, Tuple[int, int]] = {}
+        self.grid: Dict[Tuple[int, int], set] = {}
+        # Shared version of the data held here: (epoch of the `stats` document, write count)
+        self.epoch = ''
+        self.version = 0
+        self.loaded_at: Optional[float] = None
+        self.checked_at: Optional[float] = None
+        self.stale = True
+        self._sorted_version = -1
+        self._sorted_keys: List[str] = []
+        self._lock = asyncio.Lock()
+        self._subscribers: set = set()
+
+    # ---- bookkeeping ----
+
+    @property
+    def etag(self) -> str:
+        return f'"{self.epoch}-{self.version}"'
+
+    def _cell(self, lon: float, lat: float) -> Tuple[int, int]:
+        return (math.floor(lon / self.grid_deg), math.floor(lat / self.grid_deg))
+
+    def _put(self, key: str, doc: dict):
+        self._drop_from_grid(key)
+        self.planes[key] = doc
+        self.encoded[key] = encode_doc(doc)
+        coords = _coords(doc)
+        if coords is not None:
+            cell = self._cell(*coords)
+            self.cells[key] = cell
+            self.grid.setdefault(cell, set()).add(key)
+
+    def _remove(self, key: str):
+        self._drop_from_grid(key)
+        self.planes.pop(key, None)
+        self.encoded.pop(key, None)
+
+    def _drop_from_grid(self, key: str):
+        cell = self.cells.pop(key, None)
+        if cell is not None:
+            members = self.grid.get(cell)
+            if members is not None:
+                members.discard(key)
+                if not members:
+                    del self.grid[cell]
+
+    def invalidate(self):
+        """Mark the store stale so the next read reloads it from Mongo."""
+        self.stale = True
+
+    async def _shared(self) -> Tuple[str, int]:
+        doc = await database.db.stats.find_one({'_id': STATE_ID})
+        if doc is None:
+            # First start: a new epoch keeps ETags from an earlier database from matching
+            doc = await database.db.stats.find_one_and_update(
+                {'_id': STATE_ID},
+                {'$setOnInsert': {'epoch': os.urandom(4).hex(), 'version': 0}},
+                upsert=True, return_document=ReturnDocument.AFTER,
+            )
+        return doc['epoch'], doc['version']
+
+    async def bump(self) -> Optional[Tuple[str, int]]:
+        """Count a committed write to `planes` in the shared version; returns the new one (None on failure)."""
+        try:
+            doc = await database.db.stats.find_one_and_update(
+                {'_id': STATE_ID},
+                {'$inc': {'version': 1}, '$setOnInsert': {'epoch': os.urandom(4).hex()}},
+                upsert=True, return_document=ReturnDocument.AFTER,
+            )
+        except Exception as e:
+            logger.warning('Failed to bump the live state version: %s', e)
+            self.invalidate()
+            return None
+        return doc['epoch'], doc['version']
+
+    async def changed(self):
+        """Call after writing to `planes` outside `upsert_planes_bulk`: every process reloads."""
+        self.invalidate()
+        await self.bump()
+
+    async def ensure_fresh(self) -> bool:
+        """Reload from Mongo if stale, behind the shared version or past the resync interval.
+
+        Returns False if unavailable.
+        """
+        now = time.monotonic()
+        if not self.stale and self.checked_at is not None and now - self.checked_at < settings.LIVE_STATE_SYNC_SECONDS:
+            return True
+        async with self._lock:
+            now = time.monotonic()
+            if not self.stale and self.checked_at is not None and now - self.checked_at < settings.LIVE_STATE_SYNC_SECONDS:
+                return True
+            try:
+                shared = await self._shared()
+                expired = self.loaded_at is None or now - self.loaded_at > settings.LIVE_STATE_RESYNC_SECONDS
+                if self.stale or expired or shared != (self.epoch, self.version):
+                    await self.reload(shared)
+                self.checked_at = now
+            except Exception as e:
+                logger.warning('Live state reload failed: %s', e)
+                return not self.stale and self.loaded_at is not None
+        return True
+
+    async def reload(self, shared: Optional[Tuple[str, int]] = None):
+        t0 = time.perf_counter()
+        # Read before the documents: a write landing during the load shows up as a newer version
+        shared = shared or await self._shared()
+        docs = await database.db.planes.find({}).to_list(None)
+        previous = self.encoded
+        self.planes, self.encoded, self.cells, self.grid = {}, {}, {}, {}
+        for doc in docs:
+            oid = doc.pop('_id', None)
+            self._put(doc.get('icao') or str(oid), doc)
+        self.epoch, self.version = shared
+        self._sorted_version = -1
+        if self._subscribers and self.loaded_at is not None:
+            self._publish(
+                added=[k for k in self.encoded if k not in previous],
+                moved=[k for k, v in self.encoded.items() if k in previous and previous[k] != v],
+                removed=[k for k in previous if k not in self.encoded],
+            )
+        self.loaded_at = time.monotonic()
+        self.stale = False
+        logger.info('Live state loaded %d planes in %.1f ms', len(self.planes), (time.perf_counter() - t0) * 1000)
+
+    # ---- ingest ----
+
+    def apply_bulk(self, upserts: Dict[str, dict], deleted: Iterable[str], inserted: Iterable[dict],
+                   snapshot_source: Optional[str], incoming_icaos: Iterable[str], now: datetime,
+                   only_newer: bool = False, alive: Iterable[str] = (),
+                   earlier: Optional[Dict[str, List[dict]]] = None,
+                   version: Optional[Tuple[str, int]] = None):
+        """Apply a committed `upsert_planes_bulk` batch, mirroring its Mongo semantics.
+
+        `earlier` maps an icao to the positions it reported before its upsert
+        in the same batch; they follow the stored position in the history.
+        `version` is the shared version `bump()` returned for the batch; if
+        another write came in between, the store reloads instead.
+        """
+        if self.stale or self.loaded_at is None:
+            # Nothing trustworthy to patch; the next read reloads everything
+            return
+        if version is not None and version != (self.epoch, self.version + 1):
+            self.invalidate()
+            return
+        added, moved, removed = [], [], []
+        for icao in deleted:
+            if icao in self.planes:
+                if only_newer:
+                    # Replayed deletes only apply to planes not updated since (checked in Mongo too)
+                    self.invalidate()
+                    continue
+                removed.append(icao)
+            self._remove(icao)
+        for icao, doc in upserts.items():
+            stored = self.planes.get(icao)
+            if only_newer and stored and (stored.get('last_seen') or datetime.min) > doc['last_seen']:
+                continue
+            (moved if icao in self.planes else added).append(icao)
+            existing = self.planes.get(icao) or {}
+            history = list(existing.get('position_history') or [])
+            if existing.get('position') is not None:
+                history.append({'position': existing['position'], 'last_seen': existing.get('last_seen') or now})
+            history = (history + list((earlier or {}).get(icao, ())))[-settings.POSITION_HISTORY_MAX:]
+            self._put(icao, {
+                **existing,
+                **doc,
+                'position_history': history,
+                'created_at': existing.get('created_at') or now,
+                'updated_at': now,
+                'missed_updates': 0,
+            })
+        for icao in alive:
+            doc = self.planes.get(icao)
+            if doc is not None and doc.get('missed_updates'):
+                self._put(icao, {**doc, 'missed_updates': 0})
+        for doc in inserted:
+            doc = dict(doc)
+            oid = doc.pop('_id', None)
+            self._put(str(oid), doc)
+            added.append(str(oid))
+        if snapshot_source:
+            seen = set(incoming_icaos)
+            for key, doc in list(self.planes.items()):
+                if doc.get('source') != snapshot_source or doc.get('icao') in seen:
+                    continue
+                missed = (doc.get('missed_updates') or 0) + 1
+                if missed >= 3:
+                    self._remove(key)
+                    removed.append(key)
+                else:
+                    self._put(key, {**doc, 'missed_updates': missed})
+        self.version = version[1] if version is not None else self.version + 1
+        self._publish(added, moved, removed)
+
+    # ---- delta stream ----
+
+    def subscribe(self) -> Subscription:
+        sub = Subscription(maxsize=settings.LIVE_STREAM_QUEUE_SIZE)
+        self._subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscription):
+        self._subscribers.discard(sub)
+
+    def _publish(self, added: List[str], moved: List[str], removed: List[str]):
+        """Hand a delta to every subscriber; consumers filter and encode it themselves."""
+        if not self._subscribers or not (added or moved or removed):
+            return
+        changed = added + moved
+        delta = {
+            'version': self.version,
+            'added': added,
+            'moved': moved,
+            'removed': removed,
+            'encoded': {k: self.encoded[k] for k in changed},
+            'coords': {k: _coords(self.planes[k]) for k in changed},
+        }
+        for sub in self._subscribers:
+            try:
+                sub.queue.put_nowait(delta)
+            except asyncio.QueueFull:
+                sub.overflowed = True
+
+    def coords_of(self, key: str) -> Optional[Tuple[float, float]]:
+        doc = self.planes.get(key)
+        return _coords(doc) if doc else None
+
+    # ---- queries ----
+
+    def _newest_first(self) -> List[str]:
+        if self._sorted_version != self.version:
+            self._sorted_keys = sorted(
+                self.planes,
+                key=lambda k: self.planes[k].get('last_seen') or datetime.min,
+                reverse=True,
+            )
+            self._sorted_version = self.version
+        return self._sorted_keys
+
+    @staticmethod
+    def _to_json(keys: Iterable[str], encoded: Dict[str, bytes]) -> bytes:
+        return b'[' + b','.join(encoded[k] for k in keys) + b']'
+
+    def to_json(self, keys: Iterable[str]) -> bytes:
+        """The pre-encoded documents for `keys`, as a JSON array."""
+        return self._to_json(keys, self.encoded)
+
+    def docs(self, keys: Iterable[str]) -> List[dict]:
+        return [self.planes[k] for k in keys]
+
+    def latest_keys(self, limit: int) -> List[str]:
+        """Keys of the newest `limit` planes by last_seen."""
+        return self._newest_first()[:max(0, limit)]
+
+    def query_latest(self, limit: int) -> bytes:
+        """Newest `limit` planes by last_seen, as a JSON array."""
+        return self.to_json(self.latest_keys(limit))
+
+    def _keys_in_cells(self, min_lat: float, min_lon: float, max_lat: float, max_lon: float) -> List[str]:
+        x0, y0 = self._cell(min_lon, min_lat)
+        x1, y1 = self._cell(max_lon, max_lat)
+        if (x1 - x0 + 1) * (y1 - y0 + 1) > len(self.grid):
+            # Huge area: scanning occupied cells is cheaper than walking the range
+            return [k for (x, y), members in self.grid.items()
+                    if x0 <= x <= x1 and y0 <= y <= y1 for k in members]
+        keys = []
+        for x in range(x0, x1 + 1):
+            for y in range(y0, y1 + 1):
+                keys.extend(self.grid.get((x, y), ()))
+        return keys
+
+    def bbox_keys(self, min_lat: float, min_lon: float, max_lat: float, max_lon: float) -> List[str]:
+        """Keys of planes inside the bbox, newest first."""
+        keys = []
+        for k in self._keys_in_cells(min_lat, min_lon, max_lat, max_lon):
+            lon, lat = _coords(self.planes[k])
+            if min_lat <= lat <= max_lat and min_lon <= lon <= max_lon:
+                keys.append(k)
+        keys.sort(key=lambda k: self.planes[k].get('last_seen') or datetime.min, reverse=True)
+        return keys
+
+    def cluster_keys(self, keys: Iterable[str], cell_deg: float) -> List[dict]:
+        """Aggregate planes into `cell_deg` grid clusters: count, centroid and count per source."""
+        cells: Dict[Tuple[int, int], list] = {}
+        for k in keys:
+            lon, lat = _coords(self.planes[k])
+            cell = cells.setdefault((math.floor(lon / cell_deg), math.floor(lat / cell_deg)), [0, 0.0, 0.0, {}])
+            cell[0] += 1
+            cell[1] += lat
+            cell[2] += lon
+            source = self.planes[k].get('source') or 'unknown'
+            cell[3][source] = cell[3].get(source, 0) + 1
+        return [
+            {'lat': round(lat_sum / n, 5), 'lon': round(lon_sum / n, 5), 'count': n, 'sources': sources}
+            for n, lat_sum, lon_sum, sources in cells.values()
+        ]
+
+    def query_bbox(self, min_lat: float, min_lon: float, max_lat: float, max_lon: float, limit: int) -> bytes:
+        return self._to_json(self.bbox_keys(min_lat, min_lon, max_lat, max_lon)[:max(0, limit)], self.encoded)
+
+    def query_near(self, lat: float, lon: float, radius_m: float, limit: int) -> bytes:
+        """Planes within `radius_m` of (lat, lon), nearest first (like `$nearSphere`)."""
+        return self.to_json(self.near_keys(lat, lon, radius_m, limit))
+
+    def near_keys(self, lat: float, lon: float, radius_m: float, limit: int) -> List[str]:
+        dlat = math.degrees(radius_m / EARTH_RADIUS_M)
+        coslat = math.cos(math.radians(lat))
+        dlon = 180.0 if coslat < 1e-6 else min(180.0, dlat / coslat)
+        hits = []
+        for k in self._keys_in_cells(lat - dlat, lon - dlon, lat + dlat, lon + dlon):
+            plon, plat = _coords(self.planes[k])
+            d = haversine_m(lat, lon, plat, plon)
+            if d <= radius_m:
+                hits.append((d, k))
+        hits.sort()
+        return [k for _, k in hits[:max(0, limit)]]
+
+
+store = LiveState(grid_deg=settings.LIVE_STATE_GRID_DEG)
@@ -3,10 +3,11 @@ from fastapi.middleware.cors import CORSMiddleware
 from .dependencies import limiter
 from slowapi import _rate_limit_exceeded_handler
 from slowapi.errors import RateLimitExceeded
-from . import database, crud
-from .routers import planes, images, archive, admin, statistics
+from . import archive_store, database, crud, geofence, rollups
+from .config import settings
+from .scheduler import scheduler
+from .routers import planes, images, archive, admin, statistics, alerts
 import logging
-import asyncio
 
 
 logger = logging.getLogger('backend.main')
@@ -26,45 +27,29 @@ app.include_router(images.router)
 app.include_router(archive.router)
 app.include_router(admin.router)
 app.include_router(statistics.router)
+app.include_router(alerts.router)
 
 
 
-# Global reference to background task
-archive_task = None
-
-
-async def archive_drone_reports_periodically():
-    """Background task that archives old drone reports every 5 minutes."""
-    while True:
-        try:
-            await asyncio.sleep(300)
-            result = await crud.archive_old_drone_reports(age_hours=1.0)
-            if result['archived'] > 0:
-                logger.info(f"Archived {result['archived']} reports (dronereport, radar, camera)")
-        except asyncio.CancelledError:
-            logger.info("Archive task cancelled")
-            break
-        except Exception as e:
-            logger.error(f"Error in archive task: {e}", exc_info=True)
+# Background jobs, run by whichever worker holds the job's lease (see scheduler.py)
+scheduler.add('archive', crud.archive_old_drone_reports, settings.ARCHIVE_INTERVAL_SECONDS)
+scheduler.add('rollups', rollups.roll_up, settings.ROLLUP_INTERVAL_SECONDS)
+scheduler.add('cleanup', crud.prune_stale_planes, settings.CLEANUP_INTERVAL_SECONDS)
+scheduler.add('archive_retention', archive_store.apply_retention, settings.ARCHIVE_RETENTION_INTERVAL_SECONDS)
 
 
 @app.on_event('startup')
 async def startup_event():
-    global archive_task
     await database.init_db()
-    archive_task = asyncio.create_task(archive_drone_reports_periodically())
-    logger.info("Started background archive task")
+    await archive_store.init()
+    await geofence.engine.load()
+    if settings.SCHEDULER_ENABLED:
+        await scheduler.start()
 
 
 @app.on_event('shutdown')
 async def shutdown_event():
-    global archive_task
-    if archive_task:
-        archive_task.cancel()
-        try:
-            await archive_task
-        except asyncio.CancelledError:
-            pass
+    await scheduler.stop()
     await database.close_db()
 
 
@@ -0,0 +1,166 @@
+"""Keyset pagination, field projection and streamed list responses.
+
+List endpoints page newest first on a timestamp field plus `_id` as a
+tie-breaker (`last_seen` for planes, `archived_at` for the archive). A page
+ends with the `limit`-th document, whose key is handed back as an opaque
+cursor in `X-Next-Cursor` (and a `Link: <...>; rel="next"` header); passing
+it as `?cursor=` returns the documents after it. The cursor is resolved
+before the body is sent, so the page is streamed straight from the Mongo
+cursor, as a JSON array or, with `Accept: application/x-ndjson`, one
+document per line, instead of being built in memory. No `X-Next-Cursor`
+means the last page. Documents without the timestamp sort last (as Mongo
+orders missing values), by `_id`.
+
+Planes move to the front of `last_seen` order when they're updated, so a
+plane updated while a client pages may be seen twice or not at all; paging
+the archive is stable.
+
+`?fields=icao,position,last_seen` returns only those fields. Without it,
+HEAVY_FIELDS (the per-plane `position_history`) are left out.
+"""
+from .config import settings
+from .live_state import encode_doc
+from bson import json_util
+from fastapi import HTTPException, Request
+from fastapi.responses import StreamingResponse
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+import base64
+import re
+import zlib
+
+NDJSON = 'application/x-ndjson'
+# Left out of paged responses unless asked for with `fields=`
+HEAVY_FIELDS = ('position_history',)
+MAX_FIELDS = 50
+_FIELD_RE = re.compile(r'^[A-Za-z][A-Za-z0-9_]*(\.[A-Za-z0-9_]+)*$')
+
+
+def wants_ndjson(request: Request) -> bool:
+    return NDJSON in request.headers.get('accept', '')
+
+
+def projection(fields: Optional[str]) -> Dict[str, bool]:
+    """Mongo projection for a `fields=` parameter (comma-separated field paths)."""
+    if not fields:
+        proj = {name: False for name in HEAVY_FIELDS}
+    else:
+        names = [f.strip() for f in fields.split(',') if f.strip()]
+        if len(names) > MAX_FIELDS or not all(_FIELD_RE.match(n) for n in names):
+            raise HTTPException(status_code=400, detail=f'fields must be up to {MAX_FIELDS} comma-separated field names')
+        proj = {name: True for name in names}
+    proj['_id'] = False
+    return proj
+
+
+def encode_cursor(value, _id) -> str:
+    raw = json_util.dumps([value, _id]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Tuple:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        value, _id = json_util.loads(raw)
+        return value, _id
+    except Exception:
+        raise HTTPException(status_code=400, detail='Invalid cursor')
+
+
+class Page:
+    """One keyset page: the query that yields exactly its documents, and the next cursor."""
+
+    def __init__(self, query: dict, sort: List[Tuple[str, int]], limit: int, next_cursor: Optional[str]):
+        self.query = query
+        self.sort = sort
+        self.limit = limit
+        self.next_cursor = next_cursor
+
+    def find(self, collection, proj: Dict[str, bool]):
+        return collection.find(self.query, projection=proj).sort(self.sort).limit(self.limit)
+
+    def headers(self, request: Request) -> Dict[str, str]:
+        if not self.next_cursor:
+            return {}
+        next_url = request.url.include_query_params(cursor=self.next_cursor)
+        return {'X-Next-Cursor': self.next_cursor, 'Link': f'<{next_url}>; rel="next"'}
+
+
+async def keyset_page(collection, query: dict, sort_field: str, limit: int, cursor: Optional[str]) -> Page:
+    """Resolve the page of `query` after `cursor`, newest `sort_field` first."""
+    limit = max(1, min(limit or 1, settings.PAGE_MAX_LIMIT))
+    clauses = [query]
+    if cursor:
+        value, _id = decode_cursor(cursor)
+        clauses.append(_after(sort_field, value, _id))
+    sort = [(sort_field, -1), ('_id', -1)]
+    match = {'$and': clauses}
+    # The key of the page's last document bounds the streamed query and is the next cursor
+    last = await collection.find(match, projection={sort_field: True}).sort(sort).skip(limit - 1).limit(1).to_list(length=1)
+    if not last:
+        return Page(match, sort, limit, None)
+    value, _id = last[0].get(sort_field), last[0]['_id']
+    bounded = {'$and': clauses + [_up_to(sort_field, value, _id)]}
+    return Page(bounded, sort, limit, encode_cursor(value, _id))
+
+
+# Newest first, documents with a missing/null `sort_field` last (as Mongo sorts them)
+def _after(sort_field: str, value, _id) -> dict:
+    """Documents after the key (value, _id)."""
+    if value is None:
+        return {sort_field: None, '_id': {'$lt': _id}}
+    return {'$or': [{sort_field: {'$lt': value}}, {sort_field: value, '_id': {'$lt': _id}}, {sort_field: None}]}
+
+
+def _up_to(sort_field: str, value, _id) -> dict:
+    """Documents up to and including the key (value, _id)."""
+    if value is None:
+        return {'$or': [{sort_field: {'$ne': None}}, {sort_field: None, '_id': {'$gte': _id}}]}
+    return {'$or': [{sort_field: {'$gt': value}}, {sort_field: value, '_id': {'$gte': _id}}]}
+
+
+async def _aiter(docs) -> AsyncIterator[dict]:
+    if isinstance(docs, list):
+        for doc in docs:
+            yield doc
+    else:
+        async for doc in docs:
+            yield doc
+
+
+async def _encode(docs, ndjson: bool) -> AsyncIterator[bytes]:
+    docs = _aiter(docs)
+    if ndjson:
+        async for doc in docs:
+            yield encode_doc(doc) + b'\n'
+        return
+    sep = b'['
+    async for doc in docs:
+        yield sep + encode_doc(doc)
+        sep = b','
+    yield b'[]' if sep == b'[' else b']'
+
+
+async def gzip_chunks(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    gz = zlib.compressobj(5, zlib.DEFLATED, 31)
+    buffered = 0
+    async for chunk in chunks:
+        out = gz.compress(chunk)
+        buffered += len(chunk)
+        # Flush every ~64 KiB so the client starts receiving while Mongo is still being read
+        if buffered >= 65536:
+            out += gz.flush(zlib.Z_SYNC_FLUSH)
+            buffered = 0
+        if out:
+            yield out
+    yield gz.flush()
+
+
+def stream(request: Request, docs, headers: Optional[Dict[str, str]] = None) -> StreamingResponse:
+    """Stream documents (a cursor or a list) as a JSON array or NDJSON, gzipped when accepted."""
+    ndjson = wants_ndjson(request)
+    headers = {**(headers or {}), 'Vary': 'Accept, Accept-Encoding'}
+    body = _encode(docs, ndjson)
+    if 'gzip' in request.headers.get('accept-encoding', ''):
+        body = gzip_chunks(body)
+        headers['Content-Encoding'] = 'gzip'
+    return StreamingResponse(body, media_type=NDJSON if ndjson else 'application/json', headers=headers)
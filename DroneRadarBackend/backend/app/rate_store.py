@@ -0,0 +1,162 @@
+"""Sliding-window counters for login lockouts, shared across workers.
+
+`auth` counts failed logins per client IP through one of two stores,
+picked by `LOCKOUT_STORE`:
+
+- `memory`: per process. Each key holds a fixed ring of
+  LOCKOUT_WINDOW_SLOTS counters (one per window/slots seconds), and at
+  most LOCKOUT_MAX_KEYS keys are tracked (least recently used evicted),
+  so memory stays bounded however many IPs an attacker uses.
+- `mongo`: shared by every worker and replica. One document per (key,
+  slot) in `rate_limits`, bumped with an atomic upserting `$inc` and
+  expired by a TTL index.
+
+Both count a hit in the current slot and sum it with the slots of the
+preceding window, so a hit counts for at least the full window and at most
+one slot longer.
+
+The slowapi route limits are configured separately through
+RATE_LIMIT_STORAGE_URI (`memory://`, `mongodb://...` or `redis://...`).
+
+`python -m app.rate_store [--mongo]` benchmarks the cost per check.
+"""
+from . import database
+from .config import settings
+from collections import OrderedDict
+from datetime import datetime
+from typing import List, Optional, Tuple
+import time
+
+
+def _slot(now: float, slot_seconds: float) -> int:
+    return int(now // slot_seconds)
+
+
+class _Ring:
+    __slots__ = ('epochs', 'counts')
+
+    def __init__(self, slots: int):
+        self.epochs: List[int] = [-1] * slots
+        self.counts: List[int] = [0] * slots
+
+
+class MemoryStore:
+    def __init__(self, window_seconds: float, slots: int = 12, max_keys: int = 10000):
+        # One slot more than the window, so the slot holding the oldest hit never drops out early
+        self.slots = slots + 1
+        self.slot_seconds = window_seconds / slots
+        self.max_keys = max_keys
+        self.rings: 'OrderedDict[str, _Ring]' = OrderedDict()
+
+    def _window(self, ring: _Ring, current: int) -> Tuple[int, Optional[int]]:
+        """(hits in the window, oldest slot epoch holding any)."""
+        total, oldest = 0, None
+        for epoch, count in zip(ring.epochs, ring.counts):
+            if count and epoch > current - self.slots:
+                total += count
+                oldest = epoch if oldest is None else min(oldest, epoch)
+        return total, oldest
+
+    async def hit(self, key: str) -> int:
+        """Count one hit for `key`; returns the hits now in the window."""
+        current = _slot(time.time(), self.slot_seconds)
+        ring = self.rings.get(key)
+        if ring is None:
+            ring = self.rings[key] = _Ring(self.slots)
+            if len(self.rings) > self.max_keys:
+                self.rings.popitem(last=False)
+        else:
+            self.rings.move_to_end(key)
+        i = current % self.slots
+        if ring.epochs[i] != current:
+            ring.epochs[i], ring.counts[i] = current, 0
+        ring.counts[i] += 1
+        return self._window(ring, current)[0]
+
+    async def count(self, key: str) -> Tuple[int, float]:
+        """Hits for `key` in the window, and seconds until the oldest of them leaves it."""
+        ring = self.rings.get(key)
+        if ring is None:
+            return 0, 0.0
+        now = time.time()
+        total, oldest = self._window(ring, _slot(now, self.slot_seconds))
+        if not total:
+            return 0, 0.0
+        return total, max(0.0, (oldest + self.slots) * self.slot_seconds - now)
+
+    async def clear(self, key: str):
+        self.rings.pop(key, None)
+
+
+class MongoStore:
+    def __init__(self, window_seconds: float, slots: int = 12, collection: str = 'rate_limits'):
+        self.slots = slots + 1
+        self.slot_seconds = window_seconds / slots
+        self.collection = collection
+
+    @property
+    def _coll(self):
+        return database.db[self.collection]
+
+    async def hit(self, key: str) -> int:
+        now = time.time()
+        current = _slot(now, self.slot_seconds)
+        expires_at = datetime.utcfromtimestamp((current + self.slots) * self.slot_seconds)
+        await self._coll.update_one(
+            {'_id': f'{key}:{current}'},
+            {'$inc': {'count': 1}, '$setOnInsert': {'key': key, 'slot': current, 'expires_at': expires_at}},
+            upsert=True,
+        )
+        return (await self.count(key))[0]
+
+    async def count(self, key: str) -> Tuple[int, float]:
+        now = time.time()
+        current = _slot(now, self.slot_seconds)
+        rows = await self._coll.aggregate([
+            {'$match': {'key': key, 'slot': {'$gt': current - self.slots}}},
+            {'$group': {'_id': None, 'count': {'$sum': '$count'}, 'oldest': {'$min': '$slot'}}},
+        ]).to_list(length=1)
+        if not rows or not rows[0]['count']:
+            return 0, 0.0
+        return rows[0]['count'], max(0.0, (rows[0]['oldest'] + self.slots) * self.slot_seconds - now)
+
+    async def clear(self, key: str):
+        await self._coll.delete_many({'key': key})
+
+
+def create_store(window_seconds: float):
+    if settings.LOCKOUT_STORE == 'mongo':
+        return MongoStore(window_seconds, settings.LOCKOUT_WINDOW_SLOTS)
+    return MemoryStore(window_seconds, settings.LOCKOUT_WINDOW_SLOTS, settings.LOCKOUT_MAX_KEYS)
+
+
+async def _benchmark(store, label: str, n: int = 20000):
+    keys = [f'10.0.{i // 256}.{i % 256}' for i in range(1000)]
+    t0 = time.perf_counter()
+    for i in range(n):
+        await store.hit(keys[i % len(keys)])
+    t_hit = (time.perf_counter() - t0) / n
+    t0 = time.perf_counter()
+    for i in range(n):
+        await store.count(keys[i % len(keys)])
+    t_count = (time.perf_counter() - t0) / n
+    print(f'{label:>8}: hit {t_hit * 1e6:8.1f} us   check {t_count * 1e6:8.1f} us   ({n} ops over {len(keys)} keys)')
+
+
+if __name__ == '__main__':
+    import asyncio
+    import sys
+
+    async def main():
+        await _benchmark(MemoryStore(3600, settings.LOCKOUT_WINDOW_SLOTS, settings.LOCKOUT_MAX_KEYS), 'memory')
+        if '--mongo' in sys.argv:
+            from motor.motor_asyncio import AsyncIOMotorClient
+            database.db = AsyncIOMotorClient(settings.MONGO_URI)[settings.MONGO_DB]
+            await database.db.rate_limits_benchmark.create_index([('key', 1), ('slot', 1)])
+            store = MongoStore(3600, settings.LOCKOUT_WINDOW_SLOTS, collection='rate_limits_benchmark')
+            try:
+                await _benchmark(store, 'mongo', n=2000)
+            finally:
+                await database.db.drop_collection('rate_limits_benchmark')
+
+    asyncio.run(main())
@@ -0,0 +1,102 @@
+"""Cache of fully encoded `GET /planes` responses.
+
+Entries are keyed by query shape (default list, bbox, radius; each with its
+limit) plus the negotiated representation, and hold the final response
+bytes. Bbox corners and radius centres are snapped to a grid of
+`RESPONSE_CACHE_TILE_DEG` degrees in the key only, so nearby map viewports
+share one slot instead of filling the cache; each entry also holds the
+exact query it was built for and is only served to that query, since the
+response is always computed on the caller's exact bbox or centre.
+Entries are only valid for the live-state version they were built from:
+the whole cache is dropped as soon as an ingest batch moves the version on.
+
+Single-plane responses live in a separate `PlaneCache`.
+"""
+from .config import settings
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional, Tuple
+import math
+
+Entry = Tuple[bytes, str, Dict[str, str]]
+
+
+def snap_bbox(min_lat: float, min_lon: float, max_lat: float, max_lon: float) -> Tuple[float, float, float, float]:
+    """Grow a bbox outward to the cache tile grid (for cache keys)."""
+    tile = settings.RESPONSE_CACHE_TILE_DEG
+    if tile <= 0:
+        return min_lat, min_lon, max_lat, max_lon
+    return (
+        max(-90.0, math.floor(min_lat / tile) * tile),
+        max(-180.0, math.floor(min_lon / tile) * tile),
+        min(90.0, math.ceil(max_lat / tile) * tile),
+        min(180.0, math.ceil(max_lon / tile) * tile),
+    )
+
+
+def snap_point(lat: float, lon: float) -> Tuple[float, float]:
+    """Round a radius query's centre to the cache tile grid (for cache keys)."""
+    tile = settings.RESPONSE_CACHE_TILE_DEG
+    if tile <= 0:
+        return lat, lon
+    return round(lat / tile) * tile, round(lon / tile) * tile
+
+
+class ResponseCache:
+    def __init__(self, max_entries: int = 512):
+        self.max_entries = max_entries
+        self.version: Optional[int] = None
+        self.entries: 'OrderedDict[Hashable, Tuple[Hashable, Entry]]' = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, version: int, query: Hashable = None) -> Optional[Entry]:
+        """The entry in slot `key`, if it was built for exactly `query`."""
+        if version != self.version:
+            self.entries.clear()
+            self.version = version
+        slot = self.entries.get(key)
+        if slot is None or slot[0] != query:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return slot[1]
+
+    def put(self, key: Hashable, version: int, entry: Entry, query: Hashable = None):
+        if version != self.version:
+            # Built from a state that has moved on meanwhile
+            return
+        self.entries[key] = (query, entry)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+
+class PlaneCache:
+    """`GET /planes/{icao}` bodies, valid while the plane's live-state document is unchanged.
+
+    Validity is checked by identity against the live state's pre-encoded
+    bytes for the plane, so an entry survives ingest batches that didn't
+    touch that plane.
+    """
+
+    def __init__(self, max_entries: int = 512):
+        self.max_entries = max_entries
+        self.entries: 'OrderedDict[str, Tuple[bytes, bytes, str]]' = OrderedDict()
+
+    def get(self, icao: str, source: bytes) -> Optional[Tuple[bytes, str]]:
+        entry = self.entries.get(icao)
+        if entry is None or entry[0] is not source:
+            return None
+        self.entries.move_to_end(icao)
+        return entry[1], entry[2]
+
+    def put(self, icao: str, source: bytes, body: bytes, etag: str):
+        self.entries[icao] = (source, body, etag)
+        self.entries.move_to_end(icao)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+
+cache = ResponseCache(max_entries=settings.RESPONSE_CACHE_MAX_ENTRIES)
+plane_cache = PlaneCache(max_entries=settings.RESPONSE_CACHE_MAX_ENTRIES)
@@ -0,0 +1,141 @@
+"""Per-minute and per-hour activity rollups.
+
+The `rollups` scheduler job (see scheduler.py) aggregates closed time buckets into
+the `activity_rollups` collection, one document per bucket:
+
+    {'resolution': 'minute', 'ts': <bucket start>, 'by_source': {'opensky': 812, ...},
+     'unique_aircraft': 1034, 'reports': 2, 'archived': 0}
+
+`by_source` and `unique_aircraft` count distinct icaos with a track point
+in the bucket, `reports` counts reports created in it (live or already
+archived) and `archived` the reports archived during it. Hour buckets are
+aggregated from the raw data too, since distinct counts can't be summed
+from minutes.
+
+Progress is kept per resolution in the `stats` collection (`_id:
+'rollups'`), so a restart continues where it stopped, backfilling at most
+ROLLUP_BACKFILL_HOURS. Buckets are only rolled up ROLLUP_LAG_SECONDS after
+they close so late (spooled) track points still land in them. Rewriting a
+bucket replaces it, so reruns are harmless.
+"""
+from . import archive_store, database
+from .config import settings
+from datetime import datetime, timedelta
+from pymongo import ReplaceOne
+from typing import Dict, List, Optional
+import logging
+
+logger = logging.getLogger('backend.rollups')
+
+STATE_ID = 'rollups'
+RESOLUTIONS = {'minute': timedelta(minutes=1), 'hour': timedelta(hours=1)}
+REPORT_SOURCES = ['dronereport', 'radar', 'camera']
+# Most buckets rolled up per aggregation, so a long backfill runs in bounded chunks
+MAX_BUCKETS_PER_PASS = {'minute': 240, 'hour': 24}
+
+
+def floor_ts(ts: datetime, resolution: str) -> datetime:
+    if resolution == 'hour':
+        return ts.replace(minute=0, second=0, microsecond=0)
+    return ts.replace(second=0, microsecond=0)
+
+
+def _empty_bucket(resolution: str, ts: datetime) -> dict:
+    return {'_id': f'{resolution}:{ts.isoformat()}', 'resolution': resolution, 'ts': ts,
+            'by_source': {}, 'unique_aircraft': 0, 'reports': 0, 'archived': 0}
+
+
+async def _grouped_counts(collection, match: dict, time_field: str, unit: str,
+                          union: Optional[List[str]] = None) -> Dict[datetime, int]:
+    pipeline = [{'$match': match}]
+    for name in union or []:
+        pipeline.append({'$unionWith': {'coll': name, 'pipeline': [{'$match': match}]}})
+    pipeline.append({'$group': {'_id': {'$dateTrunc': {'date': f'${time_field}', 'unit': unit}}, 'count': {'$sum': 1}}})
+    rows = await collection.aggregate(pipeline).to_list(length=None)
+    return {row['_id']: row['count'] for row in rows}
+
+
+async def compute_buckets(resolution: str, start: datetime, end: datetime) -> List[dict]:
+    """Aggregate the buckets of `resolution` in [start, end) (bounds aligned to the resolution)."""
+    step = RESOLUTIONS[resolution]
+    buckets = {}
+    ts = start
+    while ts < end:
+        buckets[ts] = _empty_bucket(resolution, ts)
+        ts += step
+
+    window = {'$gte': start, '$lt': end}
+    # One row per (bucket, icao) first, so aircraft seen by both feeds count once in unique_aircraft
+    pipeline = [
+        {'$match': {'ts': window}},
+        {'$group': {
+            '_id': {'bucket': {'$dateTrunc': {'date': '$ts', 'unit': resolution}}, 'icao': '$icao'},
+            'sources': {'$addToSet': '$source'},
+        }},
+        {'$facet': {
+            'unique': [{'$group': {'_id': '$_id.bucket', 'count': {'$sum': 1}}}],
+            'by_source': [
+                {'$unwind': '$sources'},
+                {'$group': {'_id': {'bucket': '$_id.bucket', 'source': '$sources'}, 'count': {'$sum': 1}}},
+            ],
+        }},
+    ]
+    result = (await database.db.track_points.aggregate(pipeline).to_list(length=1))[0]
+    for row in result['unique']:
+        buckets[row['_id']]['unique_aircraft'] = row['count']
+    for row in result['by_source']:
+        source = row['_id'].get('source') or 'unknown'
+        buckets[row['_id']['bucket']]['by_source'][source] = row['count']
+
+    # Reports created in the window can only have been archived since its start
+    reports = await _grouped_counts(
+        database.db.planes, {'source': {'$in': REPORT_SOURCES}, 'created_at': window},
+        'created_at', resolution, union=await archive_store.partitions(start=start))
+    archived = await _grouped_counts(await archive_store.view(start, end), {'archived_at': window}, 'archived_at', resolution)
+    for ts, count in reports.items():
+        buckets[ts]['reports'] = count
+    for ts, count in archived.items():
+        buckets[ts]['archived'] = count
+    return list(buckets.values())
+
+
+async def roll_up(now: Optional[datetime] = None) -> Dict[str, int]:
+    """Roll up every closed bucket not yet written; returns the number written per resolution."""
+    now = now or datetime.utcnow()
+    state = await database.db.stats.find_one({'_id': STATE_ID}) or {}
+    written = {}
+    for resolution, step in RESOLUTIONS.items():
+        end = floor_ts(now - timedelta(seconds=settings.ROLLUP_LAG_SECONDS), resolution)
+        earliest = floor_ts(now - timedelta(hours=settings.ROLLUP_BACKFILL_HOURS), resolution)
+        start = max(state.get(resolution) or earliest, earliest)
+        written[resolution] = 0
+        while start < end:
+            chunk_end = min(end, start + step * MAX_BUCKETS_PER_PASS[resolution])
+            buckets = await compute_buckets(resolution, start, chunk_end)
+            await database.db.activity_rollups.bulk_write(
+                [ReplaceOne({'_id': b['_id']}, b, upsert=True) for b in buckets], ordered=False)
+            await database.db.stats.update_one({'_id': STATE_ID}, {'$set': {resolution: chunk_end}}, upsert=True)
+            written[resolution] += len(buckets)
+            start = chunk_end
+    return written
+
+
+async def series(resolution: str, since: datetime, until: datetime) -> List[dict]:
+    """Buckets of `resolution` in [since, until), with empty buckets filled in as zeros."""
+    since, until = floor_ts(since, resolution), floor_ts(until, resolution)
+    cursor = database.db.activity_rollups.find(
+        {'resolution': resolution, 'ts': {'$gte': since, '$lt': until}},
+        projection={'_id': False, 'resolution': False},
+    ).sort('ts', 1)
+    stored = {doc['ts']: doc for doc in await cursor.to_list(length=None)}
+    out = []
+    ts = since
+    while ts < until:
+        doc = stored.get(ts)
+        if doc is None:
+            doc = _empty_bucket(resolution, ts)
+            del doc['_id'], doc['resolution']
+        out.append(doc)
+        ts += RESOLUTIONS[resolution]
+    return out
+
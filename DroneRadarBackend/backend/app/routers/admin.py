@@ -1,7 +1,8 @@
 from fastapi import APIRouter, HTTPException, Depends, status, Request
 from pydantic import BaseModel
-from .. import database
-from ..auth import _verify_password, verify_admin
+from .. import database, scheduler
+from ..live_state import store as live_state
+from ..auth import _verify_password, invalidate_credentials, verify_admin
 from ..dependencies import limiter
 import logging
 from typing import List
@@ -68,6 +69,7 @@ async def update_passwords(
     
     if not success:
         raise HTTPException(status_code=500, detail="Failed to update password")
+    invalidate_credentials(password_update.username)
     
     logger.info(f"Admin {admin_username} updated password for user: {password_update.username}")
     
@@ -131,4 +133,13 @@ async def delete_drone_reports(payload: DeleteReportsRequest, username: str = De
         {'_id': {'$in': object_ids}, 'source': 'dronereport'},
         {'$set': {'admin_visible': False}}
     )
-    return {'matched_count': res.matched_count, 'modified_count': res.modified_count}
\ No newline at end of file
+    if res.modified_count:
+        await live_state.changed()
+    return {'matched_count': res.matched_count, 'modified_count': res.modified_count}
+
+
+@router.get('/jobs')
+async def list_background_jobs(username: str = Depends(verify_admin)):
+    """Background jobs with their schedule, current lease holder and recent runs (admin only)."""
+    jobs = await scheduler.list_jobs()
+    return {'worker': scheduler.WORKER_ID, 'jobs': jobs}
@@ -0,0 +1,120 @@
+from fastapi import APIRouter, HTTPException, Depends, Query, Request
+from fastapi.responses import StreamingResponse
+from typing import Optional
+from datetime import datetime, timezone
+from .. import database, schemas
+from ..auth import verify_admin, verify_operator
+from ..config import settings
+from ..dependencies import limiter
+from ..geofence import engine as geofence
+import asyncio
+import logging
+
+logger = logging.getLogger('backend.alerts')
+
+router = APIRouter(prefix="/alerts", tags=["alerts"])
+
+
+@router.get('')
+async def list_alerts(
+    status: Optional[str] = Query(None, regex='^(active|ended)$'),
+    zone_id: Optional[str] = Query(None),
+    since: Optional[datetime] = Query(None),
+    limit: int = Query(100, ge=1, le=1000),
+    username: str = Depends(verify_operator)
+):
+    """List geofence alerts, newest first."""
+    query = {}
+    if status:
+        query['status'] = status
+    if zone_id:
+        query['zone_id'] = zone_id
+    if since:
+        if since.tzinfo is not None:
+            since = since.astimezone(timezone.utc).replace(tzinfo=None)
+        query['started_at'] = {'$gte': since}
+    cursor = database.db.alerts.find(query).sort('started_at', -1).limit(limit)
+    results = await cursor.to_list(length=limit)
+    for doc in results:
+        doc['alert_id'] = str(doc.pop('_id'))
+    return results
+
+
+@router.get('/stream')
+async def stream_alerts(request: Request, username: str = Depends(verify_operator)):
+    """Server-Sent Events: an `alert` event when a plane enters a zone, `ended` when it leaves."""
+    async def events():
+        sub = geofence.subscribe()
+        try:
+            while not await request.is_disconnected():
+                try:
+                    event, data = await asyncio.wait_for(sub.queue.get(), timeout=settings.LIVE_STREAM_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield b': keep-alive\n\n'
+                    continue
+                if sub.overflowed:
+                    # Alerts are durable: tell the client to re-query GET /alerts
+                    sub.overflowed = False
+                    yield b'event: resync\ndata: {}\n\n'
+                yield b'event: ' + event.encode() + b'\ndata: ' + data + b'\n\n'
+        finally:
+            geofence.unsubscribe(sub)
+
+    return StreamingResponse(events(), media_type='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@router.post('/authority')
+@limiter.limit("60/hour")
+async def post_authority_alert(request: Request, payload: dict):
+    """Record an alert raised client-side by the authority page. Public endpoint - rate limited.
+
+    Kept for older Map GUI builds; corridor alerts are now raised by the
+    backend geofence engine and listed by GET /alerts.
+    """
+    airport = payload.get('airport') or {}
+    doc = {
+        'origin': 'client',
+        'zone_id': str(airport.get('id') or 'unknown')[:64],
+        'zone_name': str(airport.get('name') or '')[:200],
+        'distance_m': payload.get('distance_m'),
+        'severity': payload.get('severity'),
+        'status': 'reported',
+        'started_at': datetime.utcnow(),
+    }
+    report = payload.get('report') or {}
+    if isinstance(report, dict) and report.get('icao'):
+        doc['icao'] = str(report['icao'])[:64]
+    await database.db.alerts.insert_one(doc)
+    return {'status': 'ok'}
+
+
+@router.get('/zones')
+async def list_zones(username: str = Depends(verify_operator)):
+    """List configured geofence zones."""
+    cursor = database.db.geofence_zones.find({}, projection={'_id': False})
+    return await cursor.to_list(length=1000)
+
+
+@router.post('/zones')
+async def upsert_zone(zone: schemas.GeofenceZoneIn, username: str = Depends(verify_admin)):
+    """Create or replace a geofence zone. Admin only."""
+    doc = zone.dict(exclude_none=True)
+    doc['updated_at'] = datetime.utcnow()
+    await database.db.geofence_zones.replace_one({'zone_id': zone.zone_id}, doc, upsert=True)
+    await geofence.zones_changed()
+    if not zone.active:
+        await geofence.end_zone(zone.zone_id)
+    logger.info(f"Admin {username} saved geofence zone {zone.zone_id}")
+    return {'status': 'ok', 'zone_id': zone.zone_id}
+
+
+@router.delete('/zones/{zone_id}')
+async def delete_zone(zone_id: str, username: str = Depends(verify_admin)):
+    """Delete a geofence zone and end its active alerts. Admin only."""
+    res = await database.db.geofence_zones.delete_one({'zone_id': zone_id})
+    if res.deleted_count == 0:
+        raise HTTPException(status_code=404, detail='Zone not found')
+    await geofence.zones_changed()
+    await geofence.end_zone(zone_id)
+    logger.info(f"Admin {username} deleted geofence zone {zone_id}")
+    return {'deleted': 1}
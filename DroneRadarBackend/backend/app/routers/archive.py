@@ -1,37 +1,98 @@
-from fastapi import APIRouter, Depends, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from datetime import datetime
 from typing import Optional
-from .. import crud, database
+from .. import archive_store, crud, export, paging
+from ..config import settings
 from ..auth import verify_operator
 
 router = APIRouter(prefix="/archive", tags=["archive"])
 
 
+def _parse_area(bbox: Optional[str]):
+    if not bbox:
+        return None
+    try:
+        min_lat, min_lon, max_lat, max_lon = [float(x) for x in bbox.split(',')]
+    except Exception:
+        raise HTTPException(status_code=400, detail='bbox must be min_lat,min_lon,max_lat,max_lon')
+    return min_lat, min_lon, max_lat, max_lon
+
+
 @router.get('')
 async def get_archived_reports(
+    request: Request,
     lat: Optional[float] = Query(None),
     lon: Optional[float] = Query(None),
     radius: Optional[int] = Query(5000),
+    start: Optional[datetime] = Query(None, description='Archived at or after (ISO-8601)'),
+    end: Optional[datetime] = Query(None, description='Archived before (ISO-8601)'),
+    bbox: Optional[str] = Query(None, description='min_lat,min_lon,max_lat,max_lon'),
     limit: Optional[int] = Query(100),
+    cursor: Optional[str] = Query(None, description='X-Next-Cursor of the previous page'),
+    fields: Optional[str] = Query(None, description='Comma-separated fields to return'),
     username: str = Depends(verify_operator)
 ):
-    """Retrieve archived drone reports, optionally filtered by location."""
+    """Retrieve archived drone reports, optionally filtered by location and archive time.
+
+    Only the monthly partitions the filters can touch are queried (see
+    archive_store.py). Without a location, reports are paged newest
+    `archived_at` first and streamed (JSON array, or NDJSON on request);
+    see paging.py.
+    """
+    projection = paging.projection(fields)
     if lat is not None and lon is not None:
-        cursor = database.db.archive.find({
-            'position': {
-                '$nearSphere': {
-                    '$geometry': {'type': 'Point', 'coordinates': [lon, lat]},
-                    '$maxDistance': radius
-                }
-            }
-        }, projection={'_id': False}).limit(limit)
-    else:
-        cursor = database.db.archive.find({}, projection={'_id': False}).sort('archived_at', -1).limit(limit)
-    
-    return await cursor.to_list(length=limit)
+        if cursor is not None:
+            raise HTTPException(status_code=400, detail='Paging is not available for radius queries')
+        limit = max(1, min(limit, settings.PAGE_MAX_LIMIT))
+        return paging.stream(request, await archive_store.near(lat, lon, radius, limit, projection))
+
+    area = _parse_area(bbox)
+    query = crud.bbox_query(*area) if area else {}
+    window = {k: v for k, v in (('$gte', start), ('$lt', end)) if v}
+    if window:
+        query['archived_at'] = window
+    archive = await archive_store.view(start, end, area)
+    page = await paging.keyset_page(archive, query, 'archived_at', limit, cursor)
+    return paging.stream(request, page.find(archive, projection), page.headers(request))
+
+
+@router.get('/export')
+async def export_archive(
+    request: Request,
+    dataset: str = Query('archive', description='archive or tracks'),
+    format: str = Query('ndjson', description='ndjson, csv or parquet'),
+    start: Optional[datetime] = Query(None),
+    end: Optional[datetime] = Query(None),
+    bbox: Optional[str] = Query(None, description='min_lat,min_lon,max_lat,max_lon'),
+    source: Optional[str] = Query(None),
+    icao: Optional[str] = Query(None),
+    fields: Optional[str] = Query(None, description='Comma-separated fields / columns'),
+    batch_size: Optional[int] = Query(None, ge=1),
+    username: str = Depends(verify_operator)
+):
+    """Stream archived reports or track points for a time range and area (see export.py)."""
+    if dataset not in export.DATASETS:
+        raise HTTPException(status_code=400, detail=f'dataset must be one of {", ".join(export.DATASETS)}')
+    try:
+        export.check_format(format)
+    except export.ExportError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    area = _parse_area(bbox)
+    export.columns_for(dataset, fields)  # validates fields before the response starts
+
+    body = export.export(dataset, format, start, end, area, source, icao, fields, batch_size)
+    media_type, _ = export.FORMATS[format]
+    headers = {'Content-Disposition': f'attachment; filename="{export.filename(dataset, format, start, end)}"'}
+    # Parquet pages are compressed already
+    if format != 'parquet' and 'gzip' in request.headers.get('accept-encoding', ''):
+        body = paging.gzip_chunks(body)
+        headers['Content-Encoding'] = 'gzip'
+    return StreamingResponse(body, media_type=media_type, headers=headers)
 
 
 @router.post('/manual')
 async def trigger_manual_archive(username: str = Depends(verify_operator)):
     """Manually trigger archiving of old drone reports."""
-    result = await crud.archive_old_drone_reports(age_hours=1.0)
+    result = await crud.archive_old_drone_reports()
     return result
\ No newline at end of file
@@ -1,12 +1,20 @@
 from fastapi import APIRouter, HTTPException, Depends, Query, Request
 from typing import List, Optional
-from .. import schemas, crud, database
+from datetime import datetime, timedelta, timezone
+from .. import schemas, crud, database, paging, response_cache, wire
+from ..config import settings
+from ..live_state import store as live_state, encode_doc
 from ..auth import verify_airplanefeed, verify_operator
 from ..dependencies import limiter
-from fastapi.responses import JSONResponse
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pymongo.results import InsertOneResult, UpdateResult
+from pydantic import ValidationError
+import asyncio
+import json
 import logging
 import time
+import zlib
 
 logger = logging.getLogger("backend.routers.planes")
 
@@ -52,22 +60,281 @@ async def post_single_plane(request: Request, payload: dict):
     return JSONResponse(payload_out)
 
 
+# At most this many reject details are echoed back per request
+MAX_REPORTED_REJECTS = 100
+
+
+def _validate_batch(records: List[dict], allow_empty: bool = False):
+    planes, rejects = schemas.validate_plane_batch(records)
+    if rejects:
+        logger.warning('Bulk ingest rejected %d of %d records (first: %s)',
+                       len(rejects), len(records), rejects[0]['error'])
+        if not planes and not allow_empty:
+            raise HTTPException(status_code=400, detail=f"Invalid payload: {rejects[0]['error']}")
+    return planes, rejects
+
+
+def _rejected(rejects: List[dict]) -> dict:
+    if not rejects:
+        return {}
+    return {'rejected': len(rejects), 'rejects': rejects[:MAX_REPORTED_REJECTS]}
+
+
 @router.post('/bulk')
 async def post_planes_bulk(
     request: Request,
-    payload: List[dict],
+    snapshot: bool = Query(True),
     username: str = Depends(verify_airplanefeed)
 ):
+    """Upsert a batch of planes. By default the batch is a full snapshot of its
+    source; pass `snapshot=false` for partial/replayed batches.
+
+    The body is a JSON list of plane objects, or the same records in the
+    columnar/MessagePack formats of `app.wire`, optionally gzip/zstd encoded.
+    Invalid records are skipped and listed in `rejected` (index + error); the
+    request only fails with 400 when no record is valid."""
+    t0 = time.perf_counter()
+    payload = await wire.read_body(request)
+    if not isinstance(payload, list):
+        raise HTTPException(status_code=400, detail='Invalid payload: expected a list of planes')
+    planes, rejects = _validate_batch(payload)
+    validate_ms = round((time.perf_counter() - t0) * 1000, 2)
+    summary = await crud.upsert_planes_bulk(planes, snapshot=snapshot)
+    timings = {'validate': validate_ms, **summary.get('timings_ms', {})}
+    return JSONResponse({'ingested': len(planes), **_rejected(rejects), 'timings_ms': timings})
+
+
+@router.post('/bulk/delta')
+async def post_planes_bulk_delta(
+    request: Request,
+    username: str = Depends(verify_airplanefeed)
+):
+    """Ingest a delta snapshot: `planes` that changed since the collector last
+    sent them, plus `alive` icaos that are still present but unchanged. Together
+    they count as a full snapshot of `source` for missed_updates. Unknown alive
+    icaos come back in `unknown`; the collector should resend those in full.
+    `planes` may use the columnar layout, and the body any `app.wire` encoding."""
+    t0 = time.perf_counter()
+    body = await wire.read_body(request)
+    if not isinstance(body, dict):
+        raise HTTPException(status_code=400, detail='Invalid payload: expected {source, planes, alive}')
     try:
-        planes = [schemas.PlaneIn(**p) for p in payload]
-    except Exception as e:
+        payload = schemas.PlaneDeltaBatchIn(**{**body, 'planes': wire.from_columns(body.get('planes', []))})
+    except ValidationError as e:
         raise HTTPException(status_code=400, detail=f'Invalid payload: {e}')
-    await crud.upsert_planes_bulk(planes)
-    return JSONResponse({'ingested': len(planes)})
+    # Heartbeats still count even if every changed record was rejected
+    planes, rejects = _validate_batch(payload.planes, allow_empty=bool(payload.alive))
+    validate_ms = round((time.perf_counter() - t0) * 1000, 2)
+    summary = await crud.upsert_planes_bulk(planes, alive=payload.alive, source=payload.source)
+    timings = {'validate': validate_ms, **summary.get('timings_ms', {})}
+    return JSONResponse({'ingested': len(planes), 'alive': len(payload.alive), **_rejected(rejects),
+                         'unknown': summary.get('unknown', []), 'timings_ms': timings})
+
+
+def _parse_bbox(bbox: str):
+    try:
+        min_lat, min_lon, max_lat, max_lon = [float(x) for x in bbox.split(',')]
+    except Exception:
+        raise HTTPException(status_code=400, detail='bbox must be min_lat,min_lon,max_lat,max_lon')
+    return min_lat, min_lon, max_lat, max_lon
+
+
+def _sse(event: str, data: bytes) -> bytes:
+    return b'event: ' + event.encode() + b'\ndata: ' + data + b'\n\n'
+
+
+@router.get('/stream')
+async def stream_planes(request: Request, bbox: Optional[str] = Query(None)):
+    """Server-Sent Events stream of the live picture.
+
+    Sends a `snapshot` event with every plane (inside `bbox`, if given), then a
+    `delta` event per committed ingest batch with only the planes that were
+    `added`, `moved` or `removed` (as seen through the bbox: a plane leaving it
+    is reported as removed, one entering it as added). A comment line is sent
+    every LIVE_STREAM_KEEPALIVE_SECONDS to keep proxies from closing the
+    connection. A client that falls too far behind gets a fresh snapshot.
+    """
+    area = _parse_bbox(bbox) if bbox else None
+    if not await live_state.ensure_fresh():
+        raise HTTPException(status_code=503, detail='Live state unavailable')
+
+    def inside(coords) -> bool:
+        if area is None:
+            return True
+        if coords is None:
+            return False
+        lon, lat = coords
+        return area[0] <= lat <= area[2] and area[1] <= lon <= area[3]
+
+    def snapshot(visible: set) -> bytes:
+        keys = live_state.bbox_keys(*area) if area else list(live_state.planes)
+        visible.clear()
+        visible.update(keys)
+        planes = b'[' + b','.join(live_state.encoded[k] for k in keys) + b']'
+        return _sse('snapshot', b'{"version":%d,"planes":%s}' % (live_state.version, planes))
+
+    async def events():
+        sub = live_state.subscribe()
+        visible: set = set()
+        try:
+            yield snapshot(visible)
+            while not await request.is_disconnected():
+                try:
+                    delta = await asyncio.wait_for(sub.queue.get(), timeout=settings.LIVE_STREAM_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    # Lets the store resync after invalidations even without GET /planes traffic
+                    await live_state.ensure_fresh()
+                    yield b': keep-alive\n\n'
+                    continue
+                if sub.overflowed:
+                    while not sub.queue.empty():
+                        sub.queue.get_nowait()
+                    sub.overflowed = False
+                    yield snapshot(visible)
+                    continue
+
+                added, moved, removed = [], [], []
+                for k in delta['added'] + delta['moved']:
+                    if inside(delta['coords'][k]):
+                        (moved if k in visible else added).append(k)
+                        visible.add(k)
+                    elif k in visible:
+                        visible.discard(k)
+                        removed.append(k)
+                for k in delta['removed']:
+                    if k in visible:
+                        visible.discard(k)
+                        removed.append(k)
+                if not (added or moved or removed):
+                    continue
+                enc = delta['encoded']
+                yield _sse('delta', b'{"version":%d,"added":[%s],"moved":[%s],"removed":%s}' % (
+                    delta['version'],
+                    b','.join(enc[k] for k in added),
+                    b','.join(enc[k] for k in moved),
+                    json.dumps(removed).encode(),
+                ))
+        finally:
+            live_state.unsubscribe(sub)
+
+    return StreamingResponse(events(), media_type='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+# Sources clustered by /planes/viewport; everything else (reports) is always shown individually
+AIRCRAFT_SOURCES = ('opensky', 'ogn')
+
+
+def _viewport_body(mode: str, zoom: int, cell_deg: float, count: int, clusters: Optional[list],
+                   planes_json: bytes, truncated: bool) -> bytes:
+    head = {'mode': mode, 'zoom': zoom, 'cell_deg': cell_deg, 'count': count, 'truncated': truncated,
+            'clusters': clusters or []}
+    return json.dumps(head, separators=(',', ':')).encode('utf-8')[:-1] + b',"planes":' + planes_json + b'}'
+
+
+@router.get('/viewport')
+async def get_viewport(
+    request: Request,
+    bbox: str = Query(..., description='min_lat,min_lon,max_lat,max_lon'),
+    zoom: int = Query(..., ge=0, le=22),
+):
+    """Aircraft in a map viewport, at a level of detail suited to the zoom.
+
+    With at most VIEWPORT_MAX_PLANES aircraft in view the individual
+    planes are returned (`mode: planes`). Otherwise aircraft are aggregated
+    into grid clusters about VIEWPORT_CLUSTER_PX screen pixels wide at this zoom
+    (`mode: clusters`, each with a centroid, count and per-source counts)
+    while reports are still listed individually. `count` is the number of
+    aircraft in view; `truncated` says the plane list hit the limit.
+    """
+    min_lat, min_lon, max_lat, max_lon = _parse_bbox(bbox)
+    # Degrees per cluster: a 256 px tile spans 360 / 2^zoom degrees of longitude
+    cell_deg = 360.0 / 2 ** zoom * settings.VIEWPORT_CLUSTER_PX / 256
+    limit = settings.VIEWPORT_MAX_PLANES
+
+    if settings.LIVE_STATE_ENABLED and await live_state.ensure_fresh():
+        _, encoding = wire.negotiate(request)
+        etag = wire.representation_etag(live_state.etag, '', encoding)
+        if wire.not_modified(request, etag):
+            return _not_modified(etag, {'Vary': 'Accept-Encoding'})
+        # Nearby viewports share a cache slot; the response is for the exact bbox (see response_cache.py)
+        key = ('viewport',) + response_cache.snap_bbox(min_lat, min_lon, max_lat, max_lon) + (zoom, encoding)
+        query = (min_lat, min_lon, max_lat, max_lon)
+        entry = response_cache.cache.get(key, live_state.version, query) if settings.RESPONSE_CACHE_ENABLED else None
+        if entry is None:
+            keys = live_state.bbox_keys(min_lat, min_lon, max_lat, max_lon)
+            aircraft = [k for k in keys if live_state.planes[k].get('source') in AIRCRAFT_SOURCES]
+            if len(aircraft) > limit:
+                others = [k for k in keys if live_state.planes[k].get('source') not in AIRCRAFT_SOURCES]
+                body = _viewport_body('clusters', zoom, cell_deg, len(aircraft),
+                                      live_state.cluster_keys(aircraft, cell_deg),
+                                      live_state.to_json(others[:limit]), len(others) > limit)
+            else:
+                body = _viewport_body('planes', zoom, cell_deg, len(aircraft), None,
+                                      live_state.to_json(keys[:limit]), len(keys) > limit)
+            entry = wire.render('', encoding, body, lambda: [])
+            if settings.RESPONSE_CACHE_ENABLED:
+                response_cache.cache.put(key, live_state.version, entry, query)
+        body, media_type, headers = entry
+        return Response(content=body, media_type=media_type, headers={**headers, 'ETag': etag})
+
+    clusters, planes, count = await crud.query_viewport(
+        min_lat, min_lon, max_lat, max_lon, cell_deg, AIRCRAFT_SOURCES, None, limit)
+    planes_json = b'[' + b','.join(encode_doc(doc) for doc in planes) + b']'
+    body = _viewport_body('clusters' if clusters is not None else 'planes', zoom, cell_deg, count, clusters,
+                          planes_json, len(planes) >= limit)
+    _, encoding = wire.negotiate(request)
+    body, media_type, headers = wire.render('', encoding, body, lambda: [])
+    return Response(content=body, media_type=media_type, headers=headers)
+
+
+def _naive_utc(dt: datetime) -> datetime:
+    """Mongo stores naive UTC datetimes; normalize aware query values to match."""
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt
+
+
+@router.get('/{icao}/track')
+async def get_plane_track(
+    icao: str,
+    since: Optional[datetime] = Query(None),
+    until: Optional[datetime] = Query(None),
+    max_points: int = Query(500, ge=2, le=5000),
+):
+    """Return the downsampled path of a plane from the `track_points` collection.
+
+    Defaults to the last hour. `since`/`until` accept ISO-8601 datetimes (UTC).
+    """
+    until = _naive_utc(until) if until else datetime.utcnow()
+    since = _naive_utc(since) if since else until - timedelta(hours=1)
+    if since >= until:
+        raise HTTPException(status_code=400, detail='since must be before until')
+    points = await crud.get_plane_track(icao, since, until, max_points=max_points)
+    return {'icao': icao, 'since': since, 'until': until, 'count': len(points), 'points': points}
+
+
+def _not_modified(etag: str, headers: Optional[dict] = None) -> Response:
+    return Response(status_code=304, headers={**(headers or {}), 'ETag': etag})
 
 
 @router.get('/{icao}', response_model=schemas.PlaneOut)
-async def get_plane(icao: str):
+async def get_plane(request: Request, icao: str):
+    # From the live picture: encode through PlaneOut once per change of the plane
+    if settings.LIVE_STATE_ENABLED and settings.RESPONSE_CACHE_ENABLED and await live_state.ensure_fresh():
+        source = live_state.encoded.get(icao)
+        if source is None:
+            raise HTTPException(status_code=404, detail='Not found')
+        cached = response_cache.plane_cache.get(icao, source)
+        if cached is None:
+            doc = jsonable_encoder(schemas.PlaneOut(**live_state.planes[icao]))
+            cached = (json.dumps(doc, ensure_ascii=False, separators=(',', ':')).encode('utf-8'),
+                      '"p-%08x"' % zlib.crc32(source))
+            response_cache.plane_cache.put(icao, source, *cached)
+        body, etag = cached
+        if wire.not_modified(request, etag):
+            return _not_modified(etag)
+        return Response(content=body, media_type='application/json', headers={'ETag': etag})
+
     doc = await crud.get_plane(icao)
     if not doc:
         raise HTTPException(status_code=404, detail='Not found')
@@ -76,25 +343,76 @@ async def get_plane(icao: str):
 
 @router.get('')
 async def get_planes(
+    request: Request,
     lat: Optional[float] = Query(None),
     lon: Optional[float] = Query(None),
     radius: Optional[int] = Query(5000),
     bbox: Optional[str] = Query(None),
     limit: Optional[int] = Query(100),
+    cursor: Optional[str] = Query(None, description='X-Next-Cursor of the previous page; empty for the first page'),
+    fields: Optional[str] = Query(None, description='Comma-separated fields to return'),
 ):
+    """Planes near a point, in a bbox, or the most recently seen.
+
+    With `cursor`, `fields` or `Accept: application/x-ndjson`, the list is
+    paged on `last_seen` and streamed from Mongo (see paging.py).
+    """
+    if bbox and (lat is None or lon is None):
+        min_lat, min_lon, max_lat, max_lon = _parse_bbox(bbox)
+
+    if cursor is not None or fields or paging.wants_ndjson(request):
+        if lat is not None and lon is not None:
+            raise HTTPException(status_code=400, detail='Paging is not available for radius queries; use bbox')
+        query = crud.bbox_query(min_lat, min_lon, max_lat, max_lon) if bbox else {}
+        page = await paging.keyset_page(database.db.planes, query, 'last_seen', limit, cursor)
+        return paging.stream(request, page.find(database.db.planes, paging.projection(fields)), page.headers(request))
+
+    # Serve from the in-memory live picture when it's available
+    # (JSON by default; columnar JSON/MessagePack and compression per Accept headers)
+    if settings.LIVE_STATE_ENABLED and await live_state.ensure_fresh():
+        variant, encoding = wire.negotiate(request)
+        etag = wire.representation_etag(live_state.etag, variant, encoding)
+        if wire.not_modified(request, etag):
+            return _not_modified(etag, {'Vary': 'Accept, Accept-Encoding'})
+
+        if settings.RESPONSE_CACHE_ENABLED:
+            # Nearby viewports share a cache slot; the response is for the exact query (see response_cache.py)
+            if lat is not None and lon is not None:
+                shape = ('near',) + response_cache.snap_point(lat, lon) + (radius, limit)
+                query = (lat, lon)
+            elif bbox:
+                shape = ('bbox',) + response_cache.snap_bbox(min_lat, min_lon, max_lat, max_lon) + (limit,)
+                query = (min_lat, min_lon, max_lat, max_lon)
+            else:
+                shape = ('latest', limit)
+                query = None
+            key = shape + (variant, encoding)
+            entry = response_cache.cache.get(key, live_state.version, query)
+        else:
+            entry = None
+
+        if entry is None:
+            if lat is not None and lon is not None:
+                keys = live_state.near_keys(lat, lon, radius, limit)
+            elif bbox:
+                keys = live_state.bbox_keys(min_lat, min_lon, max_lat, max_lon)[:max(0, limit)]
+            else:
+                keys = live_state.latest_keys(limit)
+            entry = wire.render(variant, encoding, live_state.to_json(keys), lambda: live_state.docs(keys))
+            if settings.RESPONSE_CACHE_ENABLED:
+                response_cache.cache.put(key, live_state.version, entry, query)
+        body, media_type, headers = entry
+        return Response(content=body, media_type=media_type, headers={**headers, 'ETag': etag})
+
     if lat is not None and lon is not None:
         results = await crud.query_planes_near(lat, lon, radius_m=radius, limit=limit)
-        return results
-    if bbox:
-        try:
-            parts = [float(x) for x in bbox.split(',')]
-            min_lat, min_lon, max_lat, max_lon = parts
-        except Exception:
-            raise HTTPException(status_code=400, detail='bbox must be min_lat,min_lon,max_lat,max_lon')
+    elif bbox:
         results = await crud.query_planes_bbox(min_lat, min_lon, max_lat, max_lon, limit=limit)
-        return results
-    cursor = database.db.planes.find({}, projection={'_id': False}).sort('last_seen', -1).limit(limit)
-    return await cursor.to_list(length=limit)
+    else:
+        cursor = database.db.planes.find({}, projection={'_id': False}).sort('last_seen', -1).limit(limit)
+        results = await cursor.to_list(length=limit)
+    body = b'[' + b','.join(encode_doc(doc) for doc in results) + b']'
+    return wire.respond(request, body, lambda: results)
 
 
 @router.delete('/{icao}')
@@ -1,6 +1,8 @@
-from fastapi import APIRouter, Depends
-from .. import database
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from typing import Optional
+from .. import database, paging
 from ..auth import verify_admin
+from ..config import settings
 from datetime import datetime
 import logging
 
@@ -14,11 +16,11 @@ async def get_sensors(username: str = Depends(verify_admin)):
     try:
         sensors_col = database.db.sensors
         
-        sensors = await sensors_col.find({}, projection={'_id': False}).to_list(None)
-        
+        sensors = await sensors_col.find({}, projection={'_id': False}).to_list(length=settings.PAGE_MAX_LIMIT)
+
         return {
             'sensors': sensors,
-            'total': len(sensors)
+            'total': await sensors_col.count_documents({})
         }
     except Exception as e:
         logger.error(f"Error getting sensors: {e}")
@@ -60,12 +62,28 @@ async def toggle_sensor_status(body: dict, username: str = Depends(verify_admin)
 
 
 @router.get('/by-source/{source}')
-async def get_sensors_by_source(source: str, username: str = Depends(verify_admin)):
-    """Get all reports by source type (camera/radar/dronereport)"""
+async def get_sensors_by_source(
+    request: Request,
+    source: str,
+    limit: int = Query(1000),
+    cursor: Optional[str] = Query(None, description='next_cursor of the previous page'),
+    fields: Optional[str] = Query(None, description='Comma-separated fields to return'),
+    username: str = Depends(verify_admin),
+):
+    """Get reports by source type (camera/radar/dronereport), newest first, one page at a time.
+
+    With `Accept: application/x-ndjson` the page is streamed one report per
+    line (cursor in `X-Next-Cursor`) instead of grouped by site.
+    """
     try:
         planes_col = database.db.planes
-        
-        reports = await planes_col.find({'source': source}, projection={'_id': False}).to_list(None)
+        query = {'source': source}
+        page = await paging.keyset_page(planes_col, query, 'last_seen', limit, cursor)
+        projection = paging.projection(fields)
+        if paging.wants_ndjson(request):
+            return paging.stream(request, page.find(planes_col, projection), page.headers(request))
+
+        reports = await page.find(planes_col, projection).to_list(length=page.limit)
 
         # Group by site_name
         by_site = {}
@@ -77,9 +95,12 @@ async def get_sensors_by_source(source: str, username: str = Depends(verify_admi
         
         return {
             'source': source,
-            'total_count': len(reports),
-            'by_site': by_site
+            'total_count': await planes_col.count_documents(query),
+            'by_site': by_site,
+            'next_cursor': page.next_cursor,
         }
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error getting reports by source: {e}")
-        return {'error': str(e)}
\ No newline at end of file
+        return {'error': str(e)}
@@ -1,6 +1,7 @@
-from fastapi import APIRouter, Depends
-from .. import database
+from fastapi import APIRouter, Depends, HTTPException, Query
+from .. import archive_store, counters, database, rollups
 from ..auth import verify_admin
+from ..config import settings
 from datetime import datetime, timedelta
 import logging
 
@@ -8,60 +9,33 @@ logger = logging.getLogger('backend.statistics')
 
 router = APIRouter(prefix="/statistics", tags=["statistics"])
 
+# /timeseries switches from minute to hour buckets above this period
+MINUTE_SERIES_MAX_HOURS = 6
+
 
 @router.get('/overview')
-async def get_statistics_overview(username: str = Depends(verify_admin)):
-    """Get overall statistics about planes, drones, and archived reports."""
+async def get_statistics_overview(exact: bool = Query(False, description='Recompute the counters from the collections first'),
+                                  username: str = Depends(verify_admin)):
+    """Get overall statistics about planes, drones, and archived reports.
+
+    Served from the materialized counters document (see counters.py);
+    `computed_at` is when it was last rebuilt from the collections and
+    `updated_at` when the ingest/archive paths last adjusted it.
+    """
     try:
-        # Count total planes (including drones)
-        total_planes = await database.db.planes.count_documents({})
-        
-        # Count active planes (OpenSky/ADS-B)
-        active_planes = await database.db.planes.count_documents({'source': {'$in': ['opensky', 'ogn']}})
-        
-        # Count active drone reports
-        active_drones = await database.db.planes.count_documents({'source': 'dronereport'})
-        
-        # Count archived drone reports
-        archived_reports = await database.db.archive.count_documents({})
-        
-        # Get statistics by source
-        sources = await database.db.planes.distinct('source')
-        source_stats = {}
-        for source in sources:
-            count = await database.db.planes.count_documents({'source': source})
-            source_stats[source or 'unknown'] = count
-        
-        # Get statistics by drone type
-        drone_types = await database.db.planes.distinct('drone_type', {'source': 'dronereport'})
-        drone_type_stats = {}
-        for drone_type in drone_types:
-            if drone_type:  # Skip None
-                count = await database.db.planes.count_documents({
-                    'source': 'dronereport',
-                    'drone_type': drone_type
-                })
-                drone_type_stats[drone_type] = count
-        
-        # Get statistics by altitude (for drone reports)
-        altitudes = await database.db.planes.distinct('altitude', {'source': 'dronereport'})
-        altitude_stats = {}
-        for altitude in altitudes:
-            if altitude:  # Skip None
-                count = await database.db.planes.count_documents({
-                    'source': 'dronereport',
-                    'altitude': altitude
-                })
-                altitude_stats[altitude] = count
-        
+        stats = await counters.overview(exact=exact)
+        by_source = {source: max(0, count) for source, count in stats.get('by_source', {}).items() if count}
         return {
-            'total_planes': total_planes,
-            'active_planes': active_planes,
-            'active_drones': active_drones,
-            'archived_reports': archived_reports,
-            'by_source': source_stats,
-            'drone_types': drone_type_stats,
-            'drone_altitudes': altitude_stats,
+            'total_planes': max(0, stats.get('total_planes', 0)),
+            'active_planes': sum(by_source.get(source, 0) for source in counters.AIRCRAFT_SOURCES),
+            'active_drones': by_source.get('dronereport', 0),
+            'archived_reports': max(0, stats.get('archived_reports', 0)),
+            'by_source': by_source,
+            'drone_types': stats.get('drone_types', {}),
+            'drone_altitudes': stats.get('drone_altitudes', {}),
+            'computed_at': stats['computed_at'].isoformat(),
+            'updated_at': stats.get('updated_at', stats['computed_at']).isoformat(),
+            'exact': exact,
             'timestamp': datetime.utcnow().isoformat()
         }
     except Exception as e:
@@ -92,8 +66,9 @@ async def get_recent_activity(hours: int = 24, username: str = Depends(verify_ad
             'last_seen': {'$gte': cutoff_time}
         })
         
-        # Recently archived reports
-        recently_archived = await database.db.archive.count_documents({
+        # Recently archived reports (only the partitions that can hold them)
+        archive = await archive_store.view(start=cutoff_time)
+        recently_archived = await archive.count_documents({
             'archived_at': {'$gte': cutoff_time}
         })
         
@@ -105,7 +80,7 @@ async def get_recent_activity(hours: int = 24, username: str = Depends(verify_ad
         recent_updates = await cursor.to_list(length=10)
         
         # Get the newest archived reports
-        arch_cursor = database.db.archive.find(
+        arch_cursor = archive.find(
             {'archived_at': {'$gte': cutoff_time}},
             projection={'drone_description': 1, 'timestamp': 1, 'archived_at': 1, '_id': 0}
         ).sort('archived_at', -1).limit(10)
@@ -131,6 +106,37 @@ async def get_recent_activity(hours: int = 24, username: str = Depends(verify_ad
         }
 
 
+@router.get('/timeseries')
+async def get_activity_timeseries(
+    hours: int = Query(24, ge=1, le=24 * 366),
+    resolution: str = Query('auto', regex='^(auto|minute|hour)$'),
+    username: str = Depends(verify_admin),
+):
+    """Activity over the last N hours from the per-minute/per-hour rollups (see rollups.py).
+
+    `auto` picks minute buckets for up to MINUTE_SERIES_MAX_HOURS and hour
+    buckets beyond. The series ends at the last rolled-up bucket
+    (`rolled_up_until`), so a bucket still being filled isn't shown as empty.
+    """
+    if resolution == 'auto':
+        resolution = 'minute' if hours <= MINUTE_SERIES_MAX_HOURS else 'hour'
+    if resolution == 'minute' and hours > min(24 * 7, settings.ROLLUP_MINUTE_RETENTION_DAYS * 24):
+        raise HTTPException(status_code=400, detail='Use resolution=hour for periods longer than a week')
+    state = await database.db.stats.find_one({'_id': rollups.STATE_ID}) or {}
+    until = state.get(resolution) or rollups.floor_ts(datetime.utcnow(), resolution)
+    since = until - timedelta(hours=hours)
+    buckets = await rollups.series(resolution, since, until)
+    for bucket in buckets:
+        bucket['ts'] = bucket['ts'].isoformat()
+    return {
+        'period_hours': hours,
+        'resolution': resolution,
+        'rolled_up_until': until.isoformat(),
+        'buckets': buckets,
+        'timestamp': datetime.utcnow().isoformat()
+    }
+
+
 @router.get('/top-countries')
 async def get_top_countries(limit: int = 10, username: str = Depends(verify_admin)):
     """Get top countries by number of planes."""
@@ -165,12 +171,25 @@ async def get_database_health(username: str = Depends(verify_admin)):
     try:
         # Get collection sizes
         planes_stats = await database.db.command('collStats', 'planes')
-        archive_stats = await database.db.command('collStats', 'archive')
         users_stats = await database.db.command('collStats', 'users')
-        
+
+        # The archive is one collection per month (see archive_store.py)
+        partitions = []
+        for entry in await archive_store.catalog():
+            stats = await database.db.command('collStats', entry['_id'])
+            partitions.append({
+                'name': entry['_id'],
+                'from': entry.get('from'),
+                'until': entry.get('until'),
+                'count': stats.get('count', 0),
+                'size_mb': round(stats.get('size', 0) / (1024 * 1024), 2),
+                'storage_mb': round(stats.get('storageSize', 0) / (1024 * 1024), 2),
+            })
+        archive_count = sum(p['count'] for p in partitions)
+
         # Size in MB
         planes_size_mb = planes_stats.get('size', 0) / (1024 * 1024)
-        archive_size_mb = archive_stats.get('size', 0) / (1024 * 1024)
+        archive_size_mb = sum(p['size_mb'] for p in partitions)
         users_size_mb = users_stats.get('size', 0) / (1024 * 1024)
         
         return {
@@ -181,9 +200,12 @@ async def get_database_health(username: str = Depends(verify_admin)):
                     'avg_doc_size': planes_stats.get('avgObjSize', 0)
                 },
                 'archive': {
-                    'count': archive_stats.get('count', 0),
+                    'count': archive_count,
                     'size_mb': round(archive_size_mb, 2),
-                    'avg_doc_size': archive_stats.get('avgObjSize', 0)
+                    'storage_mb': round(sum(p['storage_mb'] for p in partitions), 2),
+                    'avg_doc_size': round(archive_size_mb * 1024 * 1024 / archive_count) if archive_count else 0,
+                    'partitions': partitions,
+                    'retention_days': settings.ARCHIVE_RETENTION_DAYS or None,
                 },
                 'users': {
                     'count': users_stats.get('count', 0),
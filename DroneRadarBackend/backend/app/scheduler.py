@@ -0,0 +1,152 @@
+"""Background jobs that run once per interval across all backend processes.
+
+Every worker (uvicorn `--workers`, or replicas behind a load balancer) runs
+the same scheduler, but each run of a job is claimed through a lease in the
+`scheduled_jobs` collection:
+
+    {'_id': 'archive', 'owner': 'host:pid:abcd', 'lease_until': ..., 'next_run_at': ..., 'last_run': {...}}
+
+A worker only runs a job after atomically taking a due, unleased document
+(`find_one_and_update`). It renews the lease while the job runs, and on
+completion schedules the next run and releases the lease. A worker that dies
+mid-run stops renewing, so another one takes over once the lease lapses.
+Workers poll with a random jitter so they don't all race for the same
+document at the same instant.
+
+Each run is recorded in `job_runs` (expired after JOB_HISTORY_DAYS) and the
+last one on the job document, for `/admin/jobs`.
+"""
+from . import database
+from .config import settings
+from datetime import datetime, timedelta
+from pymongo import ReturnDocument
+from typing import Awaitable, Callable, Dict, List, Optional
+import asyncio
+import logging
+import os
+import random
+import socket
+import time
+import uuid
+
+logger = logging.getLogger('backend.scheduler')
+
+# Identifies this process as a lease owner
+WORKER_ID = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}'
+
+
+class Job:
+    def __init__(self, name: str, func: Callable[[], Awaitable[Optional[dict]]], interval: float):
+        self.name = name
+        self.func = func
+        self.interval = interval
+
+
+class Scheduler:
+    def __init__(self):
+        self.jobs: Dict[str, Job] = {}
+        self.tasks: List[asyncio.Task] = []
+
+    def add(self, name: str, func: Callable[[], Awaitable[Optional[dict]]], interval: float):
+        """Register `func` to run every `interval` seconds; it may return a dict summary for the run history."""
+        self.jobs[name] = Job(name, func, interval)
+
+    async def start(self):
+        # Make sure every job has a document to lease; existing schedules are kept
+        now = datetime.utcnow()
+        for job in self.jobs.values():
+            await database.db.scheduled_jobs.update_one(
+                {'_id': job.name},
+                {'$setOnInsert': {'next_run_at': now, 'lease_until': now}},
+                upsert=True,
+            )
+        self.tasks = [asyncio.create_task(self._loop(job)) for job in self.jobs.values()]
+        logger.info('Scheduler %s started jobs: %s', WORKER_ID, ', '.join(self.jobs))
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        for task in self.tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self.tasks = []
+
+    def _jittered(self, seconds: float) -> float:
+        return max(0.0, seconds * (1 + random.uniform(-1, 1) * settings.JOB_JITTER_FRACTION))
+
+    async def _claim(self, job: Job) -> bool:
+        """Take the job's lease if its next run is due and nobody holds it."""
+        now = datetime.utcnow()
+        doc = await database.db.scheduled_jobs.find_one_and_update(
+            {'_id': job.name, 'next_run_at': {'$lte': now}, 'lease_until': {'$lte': now}},
+            {'$set': {'owner': WORKER_ID, 'lease_until': now + timedelta(seconds=settings.JOB_LEASE_SECONDS)}},
+            return_document=ReturnDocument.AFTER,
+        )
+        return doc is not None
+
+    async def _renew(self, job: Job):
+        """Extend the lease while the job runs."""
+        while True:
+            await asyncio.sleep(settings.JOB_LEASE_SECONDS / 3)
+            res = await database.db.scheduled_jobs.update_one(
+                {'_id': job.name, 'owner': WORKER_ID},
+                {'$set': {'lease_until': datetime.utcnow() + timedelta(seconds=settings.JOB_LEASE_SECONDS)}},
+            )
+            if not res.matched_count:
+                logger.warning('Lost the lease on job %s while running it', job.name)
+                return
+
+    async def _run(self, job: Job):
+        started = datetime.utcnow()
+        t0 = time.perf_counter()
+        renew = asyncio.create_task(self._renew(job))
+        run = {'job': job.name, 'worker': WORKER_ID, 'started_at': started}
+        try:
+            result = await job.func()
+            run.update(status='ok', result=result if isinstance(result, dict) else None)
+        except asyncio.CancelledError:
+            run.update(status='cancelled')
+            raise
+        except Exception as e:
+            logger.error(f"Error in job {job.name}: {e}", exc_info=True)
+            run.update(status='error', error=str(e))
+        finally:
+            renew.cancel()
+            finished = datetime.utcnow()
+            run.update(finished_at=finished, duration_ms=round((time.perf_counter() - t0) * 1000, 1))
+            # A cancelled run (shutdown) releases the lease without pushing the next run back
+            next_run = started if run['status'] == 'cancelled' else started + timedelta(seconds=job.interval)
+            try:
+                await database.db.scheduled_jobs.update_one(
+                    {'_id': job.name, 'owner': WORKER_ID},
+                    {'$set': {'lease_until': finished, 'next_run_at': next_run, 'last_run': run}},
+                )
+                await database.db.job_runs.insert_one(dict(run))
+            except Exception as e:
+                logger.warning('Failed to record run of job %s: %s', job.name, e)
+
+    async def _loop(self, job: Job):
+        while True:
+            try:
+                await asyncio.sleep(self._jittered(min(job.interval, settings.JOB_POLL_SECONDS)))
+                if await self._claim(job):
+                    await self._run(job)
+            except asyncio.CancelledError:
+                logger.info('Job %s cancelled', job.name)
+                break
+            except Exception as e:
+                logger.error(f"Error scheduling job {job.name}: {e}", exc_info=True)
+
+
+async def list_jobs() -> List[dict]:
+    """Job documents plus their recent runs, newest first."""
+    jobs = await database.db.scheduled_jobs.find({}).sort('_id', 1).to_list(length=100)
+    for job in jobs:
+        cursor = database.db.job_runs.find({'job': job['_id']}, projection={'_id': False}).sort('started_at', -1).limit(10)
+        job['recent_runs'] = await cursor.to_list(length=10)
+    return jobs
+
+
+scheduler = Scheduler()
@@ -1,6 +1,7 @@
-from pydantic import BaseModel, Field, validator, root_validator
-from typing import Optional, List, Any, Dict
+from pydantic import BaseModel, Field, ValidationError, validator, root_validator
+from typing import Optional, List, Any, Dict, Tuple
 from datetime import datetime
+import re
 import time
 import bleach
 
@@ -233,6 +234,142 @@ class PlaneIn(BaseModel):
         return doc
 
 
+# ---- fast-path batch validation for trusted feeds ----
+
+# Fields a collector record may carry; anything else set (form fields, an
+# explicit `position`, ...) sends the record through PlaneIn instead.
+_FEED_FIELDS = ('msg_id', 'source', 'icao', 'flight', 'country', 'ts_unix',
+                'lat', 'lon', 'alt', 'spd', 'heading', 'vr', 'alt_geom', 'squawk', 'on_ground')
+_SLOW_FIELDS = frozenset(PlaneIn.__fields__) - frozenset(_FEED_FIELDS)
+
+# (field, min, max, message) - the same bounds as the PlaneIn validators
+_RANGES = (
+    ('lat', -90, 90, 'latitude must be between -90 and 90'),
+    ('lon', -180, 180, 'longitude must be between -180 and 180'),
+    ('alt', -500, 20000, 'altitude must be between -500 and 20000 m'),
+    ('alt_geom', -500, 20000, 'altitude must be between -500 and 20000 m'),
+    ('spd', 0, 1000, 'speed must be between 0 and 1000 m/s'),
+    ('heading', 0, 360, 'heading must be between 0 and 360 degrees'),
+    ('vr', -100, 100, 'vertical rate too extreme (maximum: ±100 m/s)'),
+)
+
+# Plain callsigns / country names: bleach would return these unchanged
+_PLAIN_TEXT = re.compile(r"^[\w .,'()/-]*$")
+
+
+def _feed_text(v: str) -> str:
+    if len(v) > 1000:
+        raise ValueError('text field too long (maximum: 1000 characters)')
+    if not _PLAIN_TEXT.match(v):
+        v = bleach.clean(v, tags=[], attributes={}, strip=True)
+    v = ' '.join(v.split())
+    if '$' in v:
+        raise ValueError('invalid characters in field')
+    return v
+
+
+class FeedPlane:
+    """A validated collector record; quacks like PlaneIn for `crud.upsert_planes_bulk`."""
+    __slots__ = ('icao', 'source', 'on_ground', '_doc')
+
+    def __init__(self, doc: Dict[str, Any]):
+        self._doc = doc
+        self.icao = doc.get('icao')
+        self.source = doc.get('source')
+        self.on_ground = doc.get('on_ground')
+
+    def to_db(self) -> Dict[str, Any]:
+        return dict(self._doc)
+
+
+def _feed_doc(rec: Dict[str, Any], now: int) -> Optional[Dict[str, Any]]:
+    """Validate one collector record and build its DB document in a single pass.
+
+    Returns None when the record needs the full PlaneIn model (unusual fields
+    or types that PlaneIn would coerce); raises ValueError when it is invalid.
+    """
+    doc: Dict[str, Any] = {}
+    for f in _FEED_FIELDS:
+        v = rec.get(f)
+        if v is None:
+            continue
+        t = type(v)
+        if f in ('lat', 'lon', 'alt', 'spd', 'heading', 'vr', 'alt_geom'):
+            if t is not float and t is not int:
+                return None
+            doc[f] = float(v)
+        elif f == 'ts_unix':
+            if t is not int:
+                return None
+            doc[f] = v
+        elif f == 'on_ground':
+            if t is not bool:
+                return None
+            doc[f] = v
+        elif t is not str:
+            return None
+        else:
+            doc[f] = v
+
+    for f, lo, hi, message in _RANGES:
+        v = doc.get(f)
+        if v is not None and not (lo <= v <= hi):
+            raise ValueError(f'{f}: {message}')
+    ts = doc.get('ts_unix')
+    if ts is not None:
+        if ts > now + 60:
+            raise ValueError('ts_unix: timestamp cannot be in the future')
+        if ts < now - 86400:
+            raise ValueError('ts_unix: timestamp too old (maximum age: 24 hours)')
+    icao = doc.get('icao')
+    if icao is not None:
+        if not 3 <= len(icao) <= 24:
+            raise ValueError('icao: identifier must be 3 to 24 characters')
+        if '$' in icao:
+            raise ValueError('icao: invalid characters in field')
+    squawk = doc.get('squawk')
+    if squawk is not None and not (len(squawk) == 4 and squawk.isdigit() and squawk.isascii()):
+        raise ValueError('squawk: squawk must be 4 digits')
+    for f in ('flight', 'country'):
+        if f in doc:
+            doc[f] = _feed_text(doc[f])
+
+    # Same truthiness test as PlaneIn's root validator
+    lat, lon = doc.get('lat'), doc.get('lon')
+    if not lat or not lon:
+        raise ValueError('must provide either position or lat/lon coordinates')
+    doc['position'] = {'type': 'Point', 'coordinates': [lon, lat]}
+    return doc
+
+
+def validate_plane_batch(records: List[Any]) -> Tuple[List[Any], List[Dict[str, Any]]]:
+    """Validate a bulk batch, keeping the good records and reporting the bad ones.
+
+    Plain collector records take a fast path (`_feed_doc`) that applies the
+    same checks as PlaneIn without building a pydantic model; anything else
+    falls back to PlaneIn. Returns (planes, rejects) where each reject is
+    `{'index': i, 'error': message}`, so one bad record no longer fails the
+    whole batch.
+    """
+    now = int(time.time())
+    planes: List[Any] = []
+    rejects: List[Dict[str, Any]] = []
+    for i, rec in enumerate(records):
+        try:
+            if not isinstance(rec, dict):
+                raise ValueError('record must be an object')
+            doc = None
+            if not any(rec.get(f) is not None for f in _SLOW_FIELDS):
+                doc = _feed_doc(rec, now)
+            planes.append(FeedPlane(doc) if doc is not None else PlaneIn(**rec))
+        except ValidationError as e:
+            rejects.append({'index': i, 'error': '; '.join(
+                f"{'.'.join(str(x) for x in err['loc'])}: {err['msg']}" for err in e.errors())})
+        except (ValueError, TypeError) as e:
+            rejects.append({'index': i, 'error': str(e)})
+    return planes, rejects
+
+
 class PlaneOut(BaseModel):
     # ADS-B / opensky-style fields
     msg_id: Optional[str] = None
@@ -268,3 +405,51 @@ class PlaneOut(BaseModel):
 
     class Config:
         orm_mode = True
+
+
+class GeofenceZoneIn(BaseModel):
+    """A geofence zone: a circle (`center` + `radius_m`) or a `polygon` ring, both in [lon, lat]."""
+    zone_id: str = Field(..., min_length=1, max_length=64, regex=r'^[A-Za-z0-9_.-]+$')
+    name: Optional[str] = Field(None, max_length=200)
+    kind: str = Field('circle', regex=r'^(circle|polygon)$')
+    center: Optional[List[float]] = Field(None, min_items=2, max_items=2)
+    radius_m: Optional[float] = Field(None, gt=0, le=500000)
+    polygon: Optional[List[List[float]]] = None
+    # Only positions from these sources are checked (all sources if omitted)
+    sources: Optional[List[str]] = None
+    active: bool = True
+
+    @validator('center')
+    def validate_center(cls, v):
+        if v is not None:
+            lon, lat = v
+            if not (-180 <= lon <= 180 and -90 <= lat <= 90):
+                raise ValueError('center must be [lon, lat] in valid ranges')
+        return v
+
+    @validator('polygon')
+    def validate_polygon(cls, v):
+        if v is not None:
+            if len(v) < 3:
+                raise ValueError('polygon needs at least 3 points')
+            for point in v:
+                if len(point) != 2 or not (-180 <= point[0] <= 180 and -90 <= point[1] <= 90):
+                    raise ValueError('polygon points must be [lon, lat] in valid ranges')
+        return v
+
+    @root_validator
+    def validate_shape(cls, values):
+        kind = values.get('kind')
+        if kind == 'circle' and (values.get('center') is None or values.get('radius_m') is None):
+            raise ValueError('circle zones need center and radius_m')
+        if kind == 'polygon' and values.get('polygon') is None:
+            raise ValueError('polygon zones need polygon')
+        return values
+
+
+class PlaneDeltaBatchIn(BaseModel):
+    """A delta snapshot from a collector: changed planes plus the icaos that are still present unchanged."""
+    source: str = Field(..., regex=r'^(opensky|ogn)$')
+    planes: List[dict] = []
+    # Still-alive heartbeat keys: planes in this snapshot that did not move enough to be resent
+    alive: List[str] = []
@@ -0,0 +1,235 @@
+"""Wire formats for bulk ingest and plane listings.
+
+Besides plain JSON (a list of objects), `/planes/bulk` accepts, and
+`GET /planes` returns on request, a columnar layout that sends each field
+name once instead of once per record:
+
+    {"fields": ["icao", "lat", "lon", ...], "rows": [["4b1805", 50.9, 4.5, ...], ...]}
+
+It is encoded either as JSON (`application/vnd.droneradar.columns+json`) or
+as MessagePack (`application/msgpack`; a plain MessagePack array of objects
+is accepted on ingest too). Request bodies may be gzip or zstd compressed
+(`Content-Encoding`; decoded in chunks and refused with 413 past
+MAX_REQUEST_BODY_BYTES), and responses are compressed when the client's
+`Accept-Encoding` allows it.
+"""
+from .config import settings
+from fastapi import HTTPException, Request
+from fastapi.responses import Response
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+from bson import ObjectId
+from datetime import datetime
+import gzip
+import json
+import msgpack
+import zlib
+
+try:
+    import zstandard
+except ImportError:  # zstd is optional; gzip is always available
+    zstandard = None
+
+COLUMNS_JSON = 'application/vnd.droneradar.columns+json'
+MSGPACK = 'application/msgpack'
+MSGPACK_TYPES = (MSGPACK, 'application/x-msgpack', 'application/vnd.msgpack')
+
+# Smaller responses aren't worth the compression overhead
+MIN_COMPRESS_BYTES = 1024
+GZIP_LEVEL = 5
+ZSTD_LEVEL = 3
+
+
+def _default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, ObjectId):
+        return str(value)
+    raise TypeError(f'cannot encode {type(value).__name__}')
+
+
+def to_columns(docs: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """Convert records into the columnar layout (fields in first-seen order, None for gaps)."""
+    docs = list(docs)
+    index: Dict[str, int] = {}
+    for doc in docs:
+        for key in doc:
+            if key not in index:
+                index[key] = len(index)
+    fields = list(index)
+    return {'fields': fields, 'rows': [[doc.get(f) for f in fields] for doc in docs]}
+
+
+def from_columns(data: Any) -> Any:
+    """Expand a columnar payload back into records; anything else is returned unchanged."""
+    if not (isinstance(data, dict) and 'fields' in data and 'rows' in data):
+        return data
+    fields = data['fields']
+    if not isinstance(fields, list) or not isinstance(data['rows'], list):
+        raise HTTPException(status_code=400, detail='columnar payload needs `fields` and `rows` lists')
+    records = []
+    for row in data['rows']:
+        if not isinstance(row, list) or len(row) != len(fields):
+            raise HTTPException(status_code=400, detail='every row must have one value per field')
+        records.append({f: v for f, v in zip(fields, row) if v is not None})
+    return records
+
+
+# Decompressed output per step
+DECOMPRESS_CHUNK = 1024 * 1024
+
+
+def _too_large(limit: int) -> HTTPException:
+    return HTTPException(status_code=413, detail=f'Request body exceeds {limit} bytes')
+
+
+def _gunzip(body: bytes, limit: int) -> bytes:
+    """gzip.decompress (concatenated members included) that stops past `limit` output bytes."""
+    out = bytearray()
+    data = body
+    while data:
+        d = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        while not d.eof:
+            chunk = d.decompress(data, DECOMPRESS_CHUNK)
+            data = d.unconsumed_tail
+            if not chunk and not data and not d.eof:
+                raise ValueError('truncated gzip stream')
+            out += chunk
+            if len(out) > limit:
+                raise _too_large(limit)
+        data = d.unused_data
+    return bytes(out)
+
+
+def _unzstd(body: bytes, limit: int) -> bytes:
+    out = bytearray()
+    with zstandard.ZstdDecompressor().stream_reader(body) as reader:
+        while True:
+            chunk = reader.read(DECOMPRESS_CHUNK)
+            if not chunk:
+                return bytes(out)
+            out += chunk
+            if len(out) > limit:
+                raise _too_large(limit)
+
+
+def _decompress(body: bytes, encoding: str, limit: int) -> bytes:
+    encoding = encoding.strip().lower()
+    if encoding in ('', 'identity'):
+        return body
+    try:
+        if encoding in ('gzip', 'x-gzip'):
+            return _gunzip(body, limit)
+        if encoding == 'zstd' and zstandard is not None:
+            return _unzstd(body, limit)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f'Invalid {encoding} body: {e}')
+    raise HTTPException(status_code=415, detail=f'Unsupported Content-Encoding: {encoding}')
+
+
+async def read_body(request: Request) -> Any:
+    """Decode a request body (JSON, columnar JSON or MessagePack, optionally compressed)."""
+    limit = settings.MAX_REQUEST_BODY_BYTES
+    body = await request.body()
+    if len(body) > limit:
+        raise _too_large(limit)
+    body = _decompress(body, request.headers.get('content-encoding', ''), limit)
+    content_type = request.headers.get('content-type', 'application/json').split(';')[0].strip().lower()
+    try:
+        if content_type in MSGPACK_TYPES:
+            data = msgpack.unpackb(body, raw=False)
+        elif content_type == 'application/json' or content_type.endswith('+json'):
+            data = json.loads(body)
+        else:
+            raise HTTPException(status_code=415, detail=f'Unsupported Content-Type: {content_type}')
+    except (ValueError, msgpack.ExtraData, msgpack.FormatError, msgpack.StackError) as e:
+        raise HTTPException(status_code=400, detail=f'Invalid payload: {e}')
+    return from_columns(data)
+
+
+def _accepts(header: str, token: str) -> bool:
+    """Whether an Accept/Accept-Encoding header lists `token` with a non-zero q-value."""
+    for part in header.lower().split(','):
+        name, *params = [p.strip() for p in part.split(';')]
+        if name != token:
+            continue
+        for param in params:
+            if param.startswith('q='):
+                try:
+                    return float(param[2:]) > 0
+                except ValueError:
+                    return False
+        return True
+    return False
+
+
+def negotiate(request: Request) -> Tuple[str, Optional[str]]:
+    """Pick the representation for a plane list: (variant, content encoding).
+
+    The variant is '' for plain JSON, 'columns' or 'msgpack'.
+    """
+    accept = request.headers.get('accept', '')
+    if any(_accepts(accept, t) for t in MSGPACK_TYPES):
+        variant = 'msgpack'
+    elif _accepts(accept, COLUMNS_JSON):
+        variant = 'columns'
+    else:
+        variant = ''
+    accept_encoding = request.headers.get('accept-encoding', '')
+    if zstandard is not None and _accepts(accept_encoding, 'zstd'):
+        encoding = 'zstd'
+    elif _accepts(accept_encoding, 'gzip'):
+        encoding = 'gzip'
+    else:
+        encoding = None
+    return variant, encoding
+
+
+def render(variant: str, encoding: Optional[str], json_body: bytes,
+           docs: Callable[[], List[dict]]) -> Tuple[bytes, str, Dict[str, str]]:
+    """Encode a plane list as (body, media type, headers) for a negotiated representation.
+
+    `json_body` is the plain JSON rendering; `docs` lazily provides the
+    records for the columnar formats.
+    """
+    if variant == 'msgpack':
+        body, media_type = msgpack.packb(to_columns(docs()), default=_default), MSGPACK
+    elif variant == 'columns':
+        body = json.dumps(to_columns(docs()), default=_default, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        media_type = COLUMNS_JSON
+    else:
+        body, media_type = json_body, 'application/json'
+    headers = {'Vary': 'Accept, Accept-Encoding'}
+    if encoding and len(body) >= MIN_COMPRESS_BYTES:
+        if encoding == 'zstd':
+            body = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(body)
+        else:
+            body = gzip.compress(body, compresslevel=GZIP_LEVEL)
+        headers['Content-Encoding'] = encoding
+    return body, media_type, headers
+
+
+def representation_etag(etag: str, variant: str, encoding: Optional[str]) -> str:
+    """Suffix a strong ETag per representation so caches never mix them up."""
+    suffix = '-'.join(x for x in (variant, encoding) if x)
+    return f'{etag[:-1]}-{suffix}"' if suffix else etag
+
+
+def not_modified(request: Request, etag: str) -> bool:
+    """Whether the request's If-None-Match already names `etag`."""
+    header = request.headers.get('if-none-match')
+    if not header:
+        return False
+    tags = [t.strip() for t in header.split(',')]
+    return '*' in tags or etag in tags or f'W/{etag}' in tags
+
+
+def respond(request: Request, json_body: bytes, docs: Callable[[], List[dict]],
+            etag: Optional[str] = None) -> Response:
+    """Build a plane-list response in the format and encoding the client asked for."""
+    variant, encoding = negotiate(request)
+    body, media_type, headers = render(variant, encoding, json_body, docs)
+    if etag:
+        headers['ETag'] = representation_etag(etag, variant, encoding)
+    return Response(content=body, media_type=media_type, headers=headers)
@@ -0,0 +1,57 @@
+import asyncio
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import database  # noqa: E402
+from app.geofence import engine as geofence  # noqa: E402
+from app.live_state import store as live_state  # noqa: E402
+
+from fakedb import FakeDB  # noqa: E402
+
+
+@pytest.fixture
+def db(monkeypatch):
+    """A fresh in-memory database, with the live state and geofence engine reset."""
+    fake = FakeDB()
+    monkeypatch.setattr(database, 'db', fake)
+    live_state.invalidate()
+    live_state.loaded_at = live_state.checked_at = None
+    live_state.epoch, live_state.version = '', 0
+    geofence.zones, geofence.grid, geofence.version, geofence.synced_at = {}, {}, None, None
+    return fake
+
+
+@pytest.fixture
+def run():
+    """Run a coroutine to completion."""
+    return asyncio.run
+
+
+def plane(icao, lat, lon, source='opensky', seconds_ago=0, **fields):
+    """A plane document as stored in the `planes` collection."""
+    seen = datetime.utcnow() - timedelta(seconds=seconds_ago)
+    return {'_id': ObjectId(), 'icao': icao, 'source': source, 'lat': lat, 'lon': lon,
+            'position': {'type': 'Point', 'coordinates': [lon, lat]},
+            'last_seen': seen, 'created_at': seen, 'position_history': [], 'missed_updates': 0, **fields}
+
+
+@pytest.fixture
+def client(db):
+    """A test client for the planes and archive routers, backed by `db`."""
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from app.dependencies import limiter
+    from app.routers import archive, planes
+
+    api = FastAPI()
+    api.state.limiter = limiter
+    api.include_router(planes.router)
+    api.include_router(archive.router)
+    with TestClient(api) as test_client:
+        yield test_client
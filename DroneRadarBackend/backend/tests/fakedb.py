@@ -0,0 +1,388 @@
+"""A small in-memory stand-in for the Motor database used by the tests.
+
+It implements the subset of the collection API the backend modules call
+(find/sort/limit, single and bulk writes with the common update operators,
+a few aggregation stages) with Mongo's matching rules for the operators
+the code uses. Update pipelines support `$set`/`$unset` stages with the
+expression operators the ingest pipeline uses. Geo queries are not supported.
+"""
+from datetime import datetime
+from pymongo import DeleteMany, DeleteOne, InsertOne, UpdateMany, UpdateOne
+from pymongo.errors import BulkWriteError, CollectionInvalid, DuplicateKeyError
+from pymongo.results import BulkWriteResult, DeleteResult, InsertManyResult, InsertOneResult, UpdateResult
+from bson import ObjectId
+import copy
+
+_MISSING = object()
+
+
+def _get(doc, path):
+    value = doc
+    for part in path.split('.'):
+        if isinstance(value, dict) and part in value:
+            value = value[part]
+        else:
+            return _MISSING
+    return value
+
+
+def _compare(value, op, arg):
+    if op == '$exists':
+        return (value is not _MISSING) == bool(arg)
+    if op == '$type':
+        return isinstance(value, datetime) if arg == 'date' else value is not _MISSING
+    if op == '$in':
+        return (None if value is _MISSING else value) in arg
+    if op == '$nin':
+        return (None if value is _MISSING else value) not in arg
+    if op == '$ne':
+        return (None if value is _MISSING else value) != arg
+    if value is _MISSING or value is None:
+        return False
+    try:
+        return {'$lt': value < arg, '$lte': value <= arg, '$gt': value > arg, '$gte': value >= arg}[op]
+    except TypeError:
+        return False
+
+
+def matches(doc: dict, query: dict) -> bool:
+    for key, cond in query.items():
+        if key == '$and':
+            if not all(matches(doc, q) for q in cond):
+                return False
+        elif key == '$or':
+            if not any(matches(doc, q) for q in cond):
+                return False
+        elif key == '$nor':
+            if any(matches(doc, q) for q in cond):
+                return False
+        elif isinstance(cond, dict) and cond and all(op.startswith('$') for op in cond):
+            value = _get(doc, key)
+            if not all(_compare(value, op, arg) for op, arg in cond.items()):
+                return False
+        elif (None if _get(doc, key) is _MISSING else _get(doc, key)) != cond:
+            return False
+    return True
+
+
+def _sorted(docs, spec):
+    for key, direction in reversed(list(spec)):
+        def sort_key(doc, key=key):
+            value = _get(doc, key)
+            # Mongo orders missing/null before dates and numbers
+            return (0, 0) if value in (_MISSING, None) else (1, value)
+        docs = sorted(docs, key=sort_key, reverse=direction < 0)
+    return docs
+
+
+def _truthy(value):
+    return value not in (_MISSING, None, False, 0)
+
+
+def _expr(doc, e):
+    """Evaluate an aggregation expression against `doc`."""
+    if isinstance(e, str) and e.startswith('$'):
+        return _get(doc, e[1:])
+    if isinstance(e, list):
+        return [_expr(doc, x) for x in e]
+    if not isinstance(e, dict):
+        return e
+    if len(e) == 1 and next(iter(e)).startswith('$'):
+        (op, arg), = e.items()
+        if op == '$literal':
+            return copy.deepcopy(arg)
+        args = [_expr(doc, a) for a in arg] if isinstance(arg, list) and op != '$cond' else arg
+        if op == '$ifNull':
+            return next((a for a in args if a not in (_MISSING, None)), None)
+        if op == '$cond':
+            return _expr(doc, arg[1] if _truthy(_expr(doc, arg[0])) else arg[2])
+        if op == '$concatArrays':
+            return [x for a in args for x in a]
+        if op == '$slice':
+            items, n = args
+            return items[n:] if n < 0 else items[:n]
+        if op in ('$gte', '$gt', '$lte', '$lt'):
+            return _compare(args[0], op, args[1])
+        raise NotImplementedError(op)
+    return {k: _expr(doc, v) for k, v in e.items()}
+
+
+def _run_pipeline(doc, pipeline):
+    for stage in pipeline:
+        (op, arg), = stage.items()
+        if op == '$set':
+            values = {k: _expr(doc, v) for k, v in arg.items()}
+            for key, value in values.items():
+                if value is _MISSING:
+                    doc.pop(key, None)
+                else:
+                    doc[key] = value
+        elif op == '$unset':
+            for key in [arg] if isinstance(arg, str) else arg:
+                doc.pop(key, None)
+        else:
+            raise NotImplementedError(op)
+
+
+def _project(doc, projection):
+    if not projection:
+        return copy.deepcopy(doc)
+    include = [k for k, v in projection.items() if v and k != '_id']
+    if include:
+        out = {k: copy.deepcopy(doc[k]) for k in include if k in doc}
+        if projection.get('_id', True) and '_id' in doc:
+            out['_id'] = doc['_id']
+        return out
+    return {k: copy.deepcopy(v) for k, v in doc.items() if projection.get(k, True)}
+
+
+class FakeCursor:
+    def __init__(self, produce):
+        self._produce = produce
+        self._sort = None
+        self._skip = 0
+        self._limit = 0
+
+    def sort(self, key, direction=None):
+        self._sort = [(key, direction or 1)] if isinstance(key, str) else list(key)
+        return self
+
+    def skip(self, n):
+        self._skip = n
+        return self
+
+    def limit(self, n):
+        self._limit = n
+        return self
+
+    def batch_size(self, n):
+        return self
+
+    def _docs(self):
+        docs = self._produce(self._sort)[self._skip:]
+        return docs[:self._limit] if self._limit else docs
+
+    async def to_list(self, length=None):
+        docs = self._docs()
+        return docs[:length] if length else docs
+
+    def __aiter__(self):
+        async def gen():
+            for doc in self._docs():
+                yield doc
+        return gen()
+
+
+class FakeCollection:
+    def __init__(self, db, name):
+        self.db = db
+        self.name = name
+        self.docs = []
+
+    # ---- reads ----
+
+    def find(self, query=None, projection=None):
+        def produce(sort):
+            docs = [d for d in self.docs if matches(d, query or {})]
+            if sort:
+                docs = _sorted(docs, sort)
+            return [_project(d, projection) for d in docs]
+        return FakeCursor(produce)
+
+    async def find_one(self, query=None, projection=None):
+        docs = await self.find(query, projection).to_list(length=1)
+        return docs[0] if docs else None
+
+    async def count_documents(self, query):
+        return sum(1 for d in self.docs if matches(d, query))
+
+    async def estimated_document_count(self):
+        return len(self.docs)
+
+    async def distinct(self, key, query=None):
+        return list(dict.fromkeys(_get(d, key) for d in self.docs if matches(d, query or {}) and _get(d, key) is not _MISSING))
+
+    def aggregate(self, pipeline, **kwargs):
+        def produce(_sort):
+            docs = [copy.deepcopy(d) for d in self.docs]
+            for stage in pipeline:
+                (op, arg), = stage.items()
+                if op == '$match':
+                    docs = [d for d in docs if matches(d, arg)]
+                elif op == '$sort':
+                    docs = _sorted(docs, list(arg.items()))
+                elif op == '$limit':
+                    docs = docs[:arg]
+                elif op == '$skip':
+                    docs = docs[arg:]
+                elif op == '$project':
+                    docs = [_project(d, arg) for d in docs]
+                elif op == '$unionWith':
+                    docs += self.db[arg['coll']].aggregate(arg.get('pipeline', []))._docs()
+                else:
+                    raise NotImplementedError(op)
+            return docs
+        return FakeCursor(produce)
+
+    # ---- writes ----
+
+    async def create_index(self, *args, **kwargs):
+        self.db.created.add(self.name)
+
+    def _insert(self, doc):
+        doc.setdefault('_id', ObjectId())
+        if any(d['_id'] == doc['_id'] for d in self.docs):
+            raise DuplicateKeyError('E11000 duplicate key', 11000)
+        self.docs.append(copy.deepcopy(doc))
+        self.db.created.add(self.name)
+        return doc['_id']
+
+    async def insert_one(self, doc):
+        return InsertOneResult(self._insert(doc), True)
+
+    async def insert_many(self, docs, ordered=True):
+        ids, errors = [], []
+        for i, doc in enumerate(docs):
+            try:
+                ids.append(self._insert(doc))
+            except DuplicateKeyError as e:
+                errors.append({'index': i, 'code': 11000, 'errmsg': str(e)})
+                if ordered:
+                    break
+        if errors:
+            raise BulkWriteError({'nInserted': len(ids), 'writeErrors': errors})
+        return InsertManyResult(ids, True)
+
+    def _apply(self, doc, update, inserting):
+        if isinstance(update, list):
+            _run_pipeline(doc, update)
+            return
+        if inserting:
+            doc.update(copy.deepcopy(update.get('$setOnInsert', {})))
+        for key, value in update.get('$set', {}).items():
+            doc[key] = copy.deepcopy(value)
+        for key, value in update.get('$inc', {}).items():
+            doc[key] = doc.get(key, 0) + value
+        for key, value in update.get('$min', {}).items():
+            doc[key] = value if key not in doc else min(doc[key], value)
+        for key, value in update.get('$max', {}).items():
+            doc[key] = value if key not in doc else max(doc[key], value)
+        for key, value in update.get('$push', {}).items():
+            items = doc.setdefault(key, [])
+            if isinstance(value, dict) and '$each' in value:
+                items.extend(copy.deepcopy(value['$each']))
+                if '$slice' in value:
+                    items[:] = items[value['$slice']:] if value['$slice'] < 0 else items[:value['$slice']]
+            else:
+                items.append(copy.deepcopy(value))
+        for key, value in update.get('$addToSet', {}).items():
+            items = doc.setdefault(key, [])
+            for item in (value['$each'] if isinstance(value, dict) and '$each' in value else [value]):
+                if item not in items:
+                    items.append(item)
+
+    def _update(self, query, update, upsert, many):
+        """Returns (matched, modified, upserted_id)."""
+        hits = [d for d in self.docs if matches(d, query)]
+        if not many:
+            hits = hits[:1]
+        for doc in hits:
+            self._apply(doc, update, inserting=False)
+        if hits or not upsert:
+            return len(hits), len(hits), None
+        doc = {k: copy.deepcopy(v) for k, v in query.items() if not k.startswith('$') and not isinstance(v, dict)}
+        self._apply(doc, update, inserting=True)
+        return 0, 0, self._insert(doc)
+
+    async def update_one(self, query, update, upsert=False):
+        matched, modified, upserted_id = self._update(query, update, upsert, many=False)
+        raw = {'n': matched + (upserted_id is not None), 'nModified': modified}
+        if upserted_id is not None:
+            raw['upserted'] = upserted_id
+        return UpdateResult(raw, True)
+
+    async def find_one_and_update(self, query, update, upsert=False, return_document=False, projection=None):
+        """`return_document` is a `ReturnDocument` (BEFORE is False, AFTER is True)."""
+        before = next((copy.deepcopy(d) for d in self.docs if matches(d, query)), None)
+        _, _, upserted_id = self._update(query, update, upsert, many=False)
+        if not return_document:
+            return before and _project(before, projection)
+        if before is None and upserted_id is None:
+            return None
+        return await self.find_one({'_id': before['_id'] if before else upserted_id}, projection)
+
+    async def update_many(self, query, update, upsert=False):
+        matched, modified, upserted_id = self._update(query, update, upsert, many=True)
+        return UpdateResult({'n': matched, 'nModified': modified}, True)
+
+    async def replace_one(self, query, doc, upsert=False):
+        await self.delete_one(query)
+        return await self.insert_one(doc)
+
+    def _delete(self, query, many):
+        hits = [d for d in self.docs if matches(d, query)]
+        if not many:
+            hits = hits[:1]
+        self.docs = [d for d in self.docs if all(d is not h for h in hits)]
+        return len(hits)
+
+    async def delete_one(self, query):
+        return DeleteResult({'n': self._delete(query, many=False)}, True)
+
+    async def delete_many(self, query):
+        return DeleteResult({'n': self._delete(query, many=True)}, True)
+
+    async def bulk_write(self, operations, ordered=True):
+        result = {'nInserted': 0, 'nUpserted': 0, 'nMatched': 0, 'nModified': 0, 'nRemoved': 0,
+                  'upserted': [], 'writeErrors': []}
+        for i, op in enumerate(operations):
+            try:
+                if isinstance(op, InsertOne):
+                    self._insert(op._doc)
+                    result['nInserted'] += 1
+                elif isinstance(op, (UpdateOne, UpdateMany)):
+                    matched, modified, upserted_id = self._update(
+                        op._filter, op._doc, op._upsert, many=isinstance(op, UpdateMany))
+                    result['nMatched'] += matched
+                    result['nModified'] += modified
+                    if upserted_id is not None:
+                        result['nUpserted'] += 1
+                        result['upserted'].append({'index': i, '_id': upserted_id})
+                elif isinstance(op, (DeleteOne, DeleteMany)):
+                    result['nRemoved'] += self._delete(op._filter, many=isinstance(op, DeleteMany))
+            except DuplicateKeyError as e:
+                result['writeErrors'].append({'index': i, 'code': 11000, 'errmsg': str(e)})
+                if ordered:
+                    break
+        if result['writeErrors']:
+            raise BulkWriteError(result)
+        return BulkWriteResult(result, True)
+
+
+class FakeDB:
+    def __init__(self):
+        self.collections = {}
+        self.created = set()
+
+    def __getitem__(self, name):
+        if name not in self.collections:
+            self.collections[name] = FakeCollection(self, name)
+        return self.collections[name]
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return self[name]
+
+    async def create_collection(self, name, **kwargs):
+        if name in self.created:
+            raise CollectionInvalid(f'collection {name} already exists')
+        self.created.add(name)
+        return self[name]
+
+    async def drop_collection(self, name):
+        self.collections.pop(name, None)
+        self.created.discard(name)
+
+    async def list_collection_names(self):
+        return sorted(self.created | {n for n, c in self.collections.items() if c.docs})
@@ -0,0 +1,97 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import archive_store, crud
+from app.config import settings
+from conftest import plane
+
+
+class Clock(datetime):
+    """`datetime` with a settable utcnow(), patched into crud."""
+    now = None
+
+    @classmethod
+    def utcnow(cls):
+        return cls.now
+
+
+@pytest.fixture
+def archive(db, monkeypatch):
+    monkeypatch.setattr(archive_store, '_known', set())
+    monkeypatch.setattr(crud, 'datetime', Clock)
+    return db
+
+
+def archive_run(run, now, reports, batch_size=3):
+    """Age `reports` past ARCHIVE_AGE_HOURS at `now` and archive them."""
+    Clock.now = now
+    for doc in reports:
+        doc['last_seen'] = doc['created_at'] = now - timedelta(hours=settings.ARCHIVE_AGE_HOURS + 1)
+    crud.database.db.planes.docs += reports
+    return run(crud.archive_old_drone_reports(batch_size=batch_size))
+
+
+def reports(n, lat, lon):
+    return [plane(None, lat, lon + i / 100, source='dronereport') for i in range(n)]
+
+
+def test_reports_are_archived_by_month(archive, run):
+    assert archive_run(run, datetime(2025, 12, 3), reports(7, 40.0, 1.0)) == {'archived': 7, 'deleted': 7}
+    archive_run(run, datetime(2026, 1, 3), reports(4, 50.0, 4.0))
+
+    assert archive.planes.docs == []
+    assert run(archive_store.partitions()) == ['archive_2026_01', 'archive_2025_12']
+    entry = {e['_id']: e for e in run(archive_store.catalog())}['archive_2025_12']
+    assert (entry['count'], entry['sources'], entry['min_lat'], entry['max_lon']) == (7, ['dronereport'], 40.0, 1.06)
+    doc = archive['archive_2026_01'].docs[0]
+    assert 'position_history' not in doc and 'last_seen' not in doc and doc['original_last_seen']
+
+
+def test_partitions_are_pruned_by_time_and_bbox(archive, run):
+    archive_run(run, datetime(2025, 12, 3), reports(2, 40.0, 1.0))
+    archive_run(run, datetime(2026, 1, 3), reports(2, 50.0, 4.0))
+
+    assert run(archive_store.partitions(start=datetime(2026, 1, 10))) == ['archive_2026_01']
+    assert run(archive_store.partitions(end=datetime(2025, 12, 31))) == ['archive_2025_12']
+    assert run(archive_store.partitions(bbox=(39.0, 0.5, 41.0, 1.5))) == ['archive_2025_12']
+    assert run(archive_store.partitions(bbox=(10.0, 10.0, 11.0, 11.0))) == []
+
+
+def test_view_merges_partitions_in_order(archive, run):
+    for month in (datetime(2025, 11, 3), datetime(2025, 12, 3), datetime(2026, 1, 3)):
+        for i in range(3):
+            archive_run(run, month + timedelta(minutes=i), reports(1, 50.0, 4.0))
+    view = run(archive_store.view())
+    assert run(view.count_documents({})) == 9
+
+    newest = run(view.find({}).sort([('archived_at', -1), ('_id', -1)]).skip(2).limit(4).to_list())
+    stamps = [d['archived_at'] for d in newest]
+    assert stamps == [datetime(2026, 1, 3), datetime(2025, 12, 3, 0, 2), datetime(2025, 12, 3, 0, 1), datetime(2025, 12, 3)]
+
+    async def oldest_first():
+        return [d['archived_at'] async for d in view.find({}).sort('archived_at', 1)]
+    stamps = run(oldest_first())
+    assert len(stamps) == 9 and stamps == sorted(stamps)
+
+
+def test_interrupted_run_is_not_archived_twice(archive, run):
+    archive_run(run, datetime(2026, 2, 28, 23, 59), reports(2, 50.0, 4.0))
+    # Crashed before the delete: the report is still in planes when the month changes
+    leftover = dict(archive['archive_2026_02'].docs[0])
+    leftover['last_seen'] = leftover.pop('original_last_seen')
+
+    assert archive_run(run, datetime(2026, 3, 1, 0, 5), [leftover]) == {'archived': 0, 'deleted': 1}
+    assert 'archive_2026_03' not in archive.created
+    assert run(archive_store.partitions()) == ['archive_2026_02']
+
+
+def test_retention_drops_whole_expired_months(archive, run, monkeypatch):
+    archive_run(run, datetime(2025, 12, 3), reports(2, 50.0, 4.0))
+    archive_run(run, datetime(2026, 1, 3), reports(2, 50.0, 4.0))
+    monkeypatch.setattr(settings, 'ARCHIVE_RETENTION_DAYS', 60)
+
+    result = run(archive_store.apply_retention(datetime(2026, 3, 5)))
+    assert result == {'dropped': ['archive_2025_12'], 'deleted': 0}
+    assert run(archive_store.partitions()) == ['archive_2026_01']
+    assert 'archive_2025_12' not in archive.created
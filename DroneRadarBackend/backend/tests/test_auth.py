@@ -0,0 +1,86 @@
+import bcrypt
+import pytest
+from fastapi import HTTPException
+from fastapi.security import HTTPBasicCredentials
+
+from app import auth
+
+
+def hashed(password):
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=4))
+
+
+@pytest.fixture
+def users(db):
+    auth.invalidate_credentials()
+    db.users.docs = [{'username': 'operator', 'password_hash': hashed('old'), 'role': 'operator'}]
+    return db.users
+
+
+@pytest.fixture
+def checks(monkeypatch):
+    """Count bcrypt verifications."""
+    calls = []
+    checkpw = bcrypt.checkpw
+
+    def counting(password, stored):
+        calls.append(password)
+        return checkpw(password, stored)
+
+    monkeypatch.setattr(auth.bcrypt, 'checkpw', counting)
+    return calls
+
+
+def test_repeated_logins_skip_bcrypt(users, checks, run):
+    assert run(auth._authenticate('operator', 'old')) == (True, 'operator')
+    assert run(auth._authenticate('operator', 'old')) == (True, 'operator')
+    assert len(checks) == 1
+    assert run(auth._authenticate('operator', 'wrong')) == (False, None)
+
+
+def test_password_changed_by_another_worker(users, checks, run):
+    assert run(auth._authenticate('operator', 'old'))[0]
+    # Written straight to Mongo: this process's cache is never told
+    users.docs[0]['password_hash'] = hashed('new')
+    assert run(auth._authenticate('operator', 'old')) == (False, None)
+    assert run(auth._authenticate('operator', 'new')) == (True, 'operator')
+
+
+def test_role_change_and_deletion_apply_at_once(users, checks, run):
+    assert run(auth._authenticate('operator', 'old')) == (True, 'operator')
+    users.docs[0]['role'] = 'airplanefeed'
+    assert run(auth._authenticate('operator', 'old')) == (True, 'airplanefeed')
+    users.docs = []
+    assert run(auth._authenticate('operator', 'old')) == (False, None)
+    assert len(checks) == 1
+
+
+class Request:
+    class client:
+        host = '192.0.2.1'
+
+
+@pytest.fixture
+def clears(monkeypatch):
+    """Count lockout store clears."""
+    calls = []
+    clear = auth.failed_attempts.clear
+
+    async def counting(key):
+        calls.append(key)
+        await clear(key)
+
+    monkeypatch.setattr(auth.failed_attempts, 'clear', counting)
+    return calls
+
+
+def test_lockout_is_cleared_only_after_failures(users, clears, run):
+    good = HTTPBasicCredentials(username='operator', password='old')
+    assert run(auth._verify_credentials_with_ratelimit(good, Request)) == 'operator'
+    assert clears == []
+
+    with pytest.raises(HTTPException):
+        run(auth._verify_credentials_with_ratelimit(HTTPBasicCredentials(username='operator', password='bad'), Request))
+    assert run(auth._verify_credentials_with_ratelimit(good, Request)) == 'operator'
+    assert run(auth._verify_credentials_with_ratelimit(good, Request)) == 'operator'
+    assert clears == ['192.0.2.1']
@@ -0,0 +1,53 @@
+import time
+
+from app import crud
+from app.live_state import store as live_state
+from app.schemas import validate_plane_batch
+from conftest import plane
+
+NOW = int(time.time())
+
+
+def batch(*records):
+    planes, rejects = validate_plane_batch(list(records))
+    assert rejects == []
+    return planes
+
+
+def position(icao, lat, lon, age):
+    return {'source': 'opensky', 'icao': icao, 'ts_unix': NOW - age, 'lat': lat, 'lon': lon}
+
+
+def test_every_position_in_a_batch_is_kept(db, run):
+    db.planes.docs = [plane('abc123', 50.0, 4.0, seconds_ago=60)]
+    run(live_state.reload())
+
+    run(crud.upsert_planes_bulk(batch(position('abc123', 50.1, 4.1, 20), position('abc123', 50.2, 4.2, 10),
+                                      position('def456', 51.0, 5.0, 10))))
+
+    track = sorted((p['icao'], p['position']['coordinates']) for p in db.track_points.docs)
+    assert track == [('abc123', [4.1, 50.1]), ('abc123', [4.2, 50.2]), ('def456', [5.0, 51.0])]
+    stored, = [d for d in db.planes.docs if d['icao'] == 'abc123']
+    assert stored['position']['coordinates'] == [4.2, 50.2]
+    history = [h['position']['coordinates'] for h in stored['position_history']]
+    assert history == [[4.0, 50.0], [4.1, 50.1]]
+    assert [h['position']['coordinates'] for h in live_state.planes['abc123']['position_history']] == history
+
+
+def test_landing_discards_the_positions_before_it(db, run):
+    run(crud.upsert_planes_bulk(batch(position('abc123', 50.1, 4.1, 30),
+                                      {**position('abc123', 50.1, 4.1, 20), 'on_ground': True},
+                                      position('abc123', 50.2, 4.2, 10))))
+
+    stored, = db.planes.docs
+    assert stored['position_history'] == []
+    assert len(db.track_points.docs) == 2
+
+
+def test_replayed_records_do_not_overwrite_newer_positions(db, run):
+    db.planes.docs = [plane('abc123', 50.0, 4.0)]
+
+    run(crud.upsert_planes_bulk(batch(position('abc123', 50.1, 4.1, 30)), snapshot=False))
+
+    stored, = db.planes.docs
+    assert stored['position']['coordinates'] == [4.0, 50.0] and stored['position_history'] == []
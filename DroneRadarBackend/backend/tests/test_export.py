@@ -0,0 +1,39 @@
+import csv
+import io
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.auth import verify_operator
+
+
+@pytest.fixture
+def operator(client):
+    client.app.dependency_overrides[verify_operator] = lambda: 'operator'
+    yield client
+    client.app.dependency_overrides.clear()
+
+
+@pytest.mark.parametrize('bbox', ['50,4,51', '50,4,51,5,6', 'a,b,c,d'])
+def test_export_rejects_a_malformed_bbox(operator, bbox):
+    response = operator.get('/archive/export', params={'dataset': 'tracks', 'format': 'csv', 'bbox': bbox})
+    assert response.status_code == 400
+    assert 'bbox' in response.json()['detail']
+
+
+def test_track_export_as_csv(db, operator):
+    t0 = datetime(2026, 1, 1, 12, 0, 0)
+    db.track_points.docs = [
+        {'icao': 'abc123', 'ts': t0 + timedelta(seconds=s), 'source': 'opensky', 'alt': 1000 + s,
+         'position': {'type': 'Point', 'coordinates': [4.0, 50.0 + s / 1000]}}
+        for s in (20, 0, 10)
+    ]
+    response = operator.get('/archive/export', params={'dataset': 'tracks', 'format': 'csv',
+                                                       'start': '2026-01-01T12:00:05'})
+    assert response.status_code == 200
+    assert response.headers['content-disposition'] == 'attachment; filename="tracks_20260101T1200.csv"'
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert [(r['ts'], r['lat'], r['alt']) for r in rows] == [
+        ('2026-01-01T12:00:10', '50.01', '1010'),
+        ('2026-01-01T12:00:20', '50.02', '1020'),
+    ]
@@ -0,0 +1,95 @@
+from datetime import datetime, timedelta
+
+from app import crud
+from app.config import settings
+from app.geofence import GeofenceEngine, engine as geofence
+from app.schemas import PlaneIn
+from conftest import plane
+
+# Inside the seeded 3 km corridor around Brussels-Zaventem
+BRU = {'lat': 50.9010, 'lon': 4.4844}
+# Well away from every seeded corridor
+ELSEWHERE = {'lat': 50.2, 'lon': 5.9}
+
+
+def test_new_dronereport_inside_zone_raises_alert(db, run):
+    run(geofence.load())
+    # What POST /planes/single does with a Form report
+    plane = PlaneIn(icao='report_1700000000000000', source='dronereport', drone_description='quadcopter', **BRU)
+    run(crud.upsert_plane(plane))
+
+    alerts = db.alerts.docs
+    assert [(a['icao'], a['zone_id'], a['status']) for a in alerts] == [('report_1700000000000000', 'BRU', 'active')]
+    assert alerts[0]['severity'] == 'critical'
+    assert alerts[0]['report'] == {'drone_description': 'quadcopter'}
+
+
+def alerts(db):
+    return [(a['icao'], a['zone_id'], a['status']) for a in db.alerts.docs]
+
+
+def test_alert_ends_when_seen_outside(db, run):
+    run(geofence.load())
+    run(geofence.evaluate([plane('report_1', source='dronereport', **BRU)]))
+    run(geofence.evaluate([plane('report_1', source='dronereport', **BRU)]))
+    assert alerts(db) == [('report_1', 'BRU', 'active')]
+
+    run(geofence.evaluate([plane('report_1', source='dronereport', **ELSEWHERE)]))
+    assert alerts(db) == [('report_1', 'BRU', 'ended')]
+
+    # Entering again opens a new alert
+    run(geofence.evaluate([plane('report_1', source='dronereport', **BRU)]))
+    assert alerts(db) == [('report_1', 'BRU', 'ended'), ('report_1', 'BRU', 'active')]
+
+
+def test_default_corridors_ignore_aircraft(db, run):
+    run(geofence.load())
+    run(geofence.evaluate([plane('4b1805', **BRU)]))
+    assert alerts(db) == []
+
+
+def test_unseen_alert_expires_unless_touched(db, run):
+    run(geofence.load())
+    run(geofence.evaluate([plane('report_1', source='dronereport', **BRU),
+                           plane('report_2', source='dronereport', **BRU)]))
+    long_ago = datetime.utcnow() - timedelta(seconds=settings.GEOFENCE_ALERT_EXPIRY_SECONDS + 1)
+    for alert in db.alerts.docs:
+        alert['last_seen'] = long_ago
+    run(geofence.touch(['report_2']))
+
+    geofence.synced_at = None
+    run(geofence.evaluate([plane('other', source='dronereport', **ELSEWHERE)]))
+    assert sorted(alerts(db)) == [('report_1', 'BRU', 'ended'), ('report_2', 'BRU', 'active')]
+
+
+def test_workers_share_alert_state(db, run):
+    other = GeofenceEngine(grid_deg=geofence.grid_deg)
+    run(geofence.load())
+    run(other.load())
+
+    run(geofence.evaluate([plane('report_1', source='dronereport', **BRU)]))
+    run(other.evaluate([plane('report_1', source='dronereport', **BRU)]))
+    assert alerts(db) == [('report_1', 'BRU', 'active')]
+
+    run(other.evaluate([plane('report_1', source='dronereport', **ELSEWHERE)]))
+    assert alerts(db) == [('report_1', 'BRU', 'ended')]
+
+
+def test_zone_edits_reach_other_workers(db, run):
+    other = GeofenceEngine(grid_deg=geofence.grid_deg)
+    run(geofence.load())
+    run(other.load())
+
+    db.geofence_zones.docs.append({'zone_id': 'SPA', 'kind': 'circle', 'center': [ELSEWHERE['lon'], ELSEWHERE['lat']],
+                                   'radius_m': 1000, 'active': True})
+    run(geofence.zones_changed())
+    run(other.evaluate([plane('report_1', source='dronereport', **ELSEWHERE)]))
+    # Not yet due to look for zone edits
+    assert alerts(db) == []
+
+    other.synced_at = None
+    run(other.evaluate([plane('report_1', source='dronereport', **ELSEWHERE)]))
+    assert alerts(db) == [('report_1', 'SPA', 'active')]
+
+    run(geofence.end_zone('SPA'))
+    assert alerts(db) == [('report_1', 'SPA', 'ended')]
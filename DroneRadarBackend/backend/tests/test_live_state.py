@@ -0,0 +1,100 @@
+from datetime import datetime, timedelta
+
+from pymongo import DeleteMany, UpdateMany
+
+from app.config import settings
+from app.live_state import LiveState, store as live_state
+from conftest import plane
+
+
+def snapshot(db, run, source, incoming):
+    """Run the snapshot second pass of `upsert_planes_bulk` against Mongo and the live state."""
+    run(db.planes.bulk_write([
+        UpdateMany({'icao': {'$nin': incoming}, 'source': source}, {'$inc': {'missed_updates': 1}}),
+        DeleteMany({'source': source, 'missed_updates': {'$gte': 3}}),
+    ]))
+    live_state.apply_bulk({}, [], [], source, incoming, datetime.utcnow())
+
+
+def missed(docs):
+    return {d['icao']: d['missed_updates'] for d in docs}
+
+
+def test_missed_updates_mirror_mongo(db, run):
+    db.planes.docs = [plane('aaa111', 50.0, 4.0), plane('bbb222', 50.1, 4.1),
+                      plane('ccc333', 50.2, 4.2, missed_updates=1), plane('glider', 47.0, 8.0, source='ogn')]
+    run(live_state.reload())
+
+    snapshot(db, run, 'opensky', ['aaa111'])
+    assert missed(live_state.planes.values()) == missed(db.planes.docs) == {
+        'aaa111': 0, 'bbb222': 1, 'ccc333': 2, 'glider': 0}
+
+    snapshot(db, run, 'opensky', ['aaa111'])
+    assert missed(live_state.planes.values()) == missed(db.planes.docs) == {
+        'aaa111': 0, 'bbb222': 2, 'glider': 0}
+    assert live_state.bbox_keys(50.15, 4.15, 50.25, 4.25) == []
+
+
+def test_upsert_resets_missed_and_keeps_history(db, run):
+    db.planes.docs = [plane('aaa111', 50.0, 4.0, missed_updates=2), plane('bbb222', 50.1, 4.1, missed_updates=2)]
+    run(live_state.reload())
+    now = datetime.utcnow()
+    doc = {'icao': 'aaa111', 'source': 'opensky', 'lat': 50.5, 'lon': 4.5,
+           'position': {'type': 'Point', 'coordinates': [4.5, 50.5]}, 'last_seen': now}
+
+    live_state.apply_bulk({'aaa111': doc}, [], [], 'opensky', ['aaa111', 'bbb222'], now, alive=['bbb222'])
+    stored = live_state.planes['aaa111']
+    assert stored['missed_updates'] == 0 and stored['lat'] == 50.5
+    assert [h['position']['coordinates'] for h in stored['position_history']] == [[4.0, 50.0]]
+    assert live_state.planes['bbb222']['missed_updates'] == 0
+    assert live_state.bbox_keys(50.4, 4.4, 50.6, 4.6) == ['aaa111']
+
+
+def test_only_newer_skips_older_records(db, run):
+    db.planes.docs = [plane('aaa111', 50.0, 4.0)]
+    run(live_state.reload())
+    older = datetime.utcnow() - timedelta(minutes=5)
+    doc = {'icao': 'aaa111', 'source': 'opensky', 'lat': 51.0, 'lon': 5.0,
+           'position': {'type': 'Point', 'coordinates': [5.0, 51.0]}, 'last_seen': older}
+
+    live_state.apply_bulk({'aaa111': doc}, [], [], None, ['aaa111'], datetime.utcnow(), only_newer=True)
+    assert live_state.planes['aaa111']['lat'] == 50.0
+
+
+def test_stale_store_is_left_for_reload(db, run):
+    db.planes.docs = [plane('aaa111', 50.0, 4.0)]
+    run(live_state.reload())
+    live_state.invalidate()
+    version = live_state.version
+
+    live_state.apply_bulk({}, ['aaa111'], [], None, [], datetime.utcnow())
+    assert live_state.version == version and 'aaa111' in live_state.planes
+
+
+def test_workers_share_the_version(db, run):
+    other = LiveState()
+    db.planes.docs = [plane('aaa111', 50.0, 4.0)]
+    assert run(live_state.ensure_fresh()) and run(other.ensure_fresh())
+    assert live_state.etag == other.etag
+
+    # An ingest on this worker moves the shared version ahead of the other one...
+    now = datetime.utcnow()
+    doc = {'icao': 'aaa111', 'source': 'opensky', 'lat': 50.5, 'lon': 4.5,
+           'position': {'type': 'Point', 'coordinates': [4.5, 50.5]}, 'last_seen': now}
+    run(db.planes.update_one({'icao': 'aaa111'}, {'$set': doc}))
+    live_state.apply_bulk({'aaa111': doc}, [], [], None, ['aaa111'], now, version=run(live_state.bump()))
+    assert live_state.planes['aaa111']['lat'] == 50.5 and live_state.etag != other.etag
+
+    # ...which reloads once its sync interval is up, and then agrees on the ETag
+    other.checked_at -= settings.LIVE_STATE_SYNC_SECONDS
+    assert run(other.ensure_fresh())
+    assert other.planes['aaa111']['lat'] == 50.5 and other.etag == live_state.etag
+
+
+def test_missed_version_reloads(db, run):
+    db.planes.docs = [plane('aaa111', 50.0, 4.0)]
+    run(live_state.ensure_fresh())
+    run(live_state.bump())  # a write by another worker
+
+    live_state.apply_bulk({}, ['aaa111'], [], None, [], datetime.utcnow(), version=run(live_state.bump()))
+    assert live_state.stale and 'aaa111' in live_state.planes
@@ -0,0 +1,43 @@
+from app import crud
+from app.schemas import PlaneIn
+from conftest import plane
+
+
+def pages(client, **params):
+    """Follow X-Next-Cursor through every page of GET /planes."""
+    out = []
+    while True:
+        response = client.get('/planes', params=params)
+        assert response.status_code == 200, response.text
+        out.append([p['icao'] for p in response.json()])
+        if 'X-Next-Cursor' not in response.headers:
+            return out
+        params = {**params, 'cursor': response.headers['X-Next-Cursor']}
+
+
+def test_pages_cover_every_plane_newest_first(db, client):
+    db.planes.docs = [plane(f'p{i}', 50.0, 4.0, seconds_ago=i) for i in range(7)]
+    # Same last_seen: ordered by _id, newest first
+    stamp = db.planes.docs[3]['last_seen']
+    db.planes.docs[4]['last_seen'] = stamp
+
+    result = pages(client, limit=3, fields='icao')
+    assert [len(page) for page in result] == [3, 3, 1]
+    flat = [icao for page in result for icao in page]
+    assert flat == ['p0', 'p1', 'p2', 'p4', 'p3', 'p5', 'p6']
+
+
+def test_documents_without_last_seen_are_paged_last(db, client):
+    legacy = [plane(f'legacy{i}', 50.0, 4.0) for i in range(3)]
+    for doc in legacy:
+        del doc['last_seen']
+    db.planes.docs = legacy + [plane('recent', 50.0, 4.0), plane('older', 50.0, 4.0, seconds_ago=60)]
+
+    flat = [icao for page in pages(client, limit=2, fields='icao') for icao in page]
+    assert flat[:2] == ['recent', 'older']
+    assert sorted(flat[2:]) == ['legacy0', 'legacy1', 'legacy2']
+
+
+def test_new_report_has_last_seen(db, run):
+    run(crud.upsert_plane(PlaneIn(icao='report_1', source='dronereport', lat=50.5, lon=4.5)))
+    assert db.planes.docs[0]['last_seen'] is not None
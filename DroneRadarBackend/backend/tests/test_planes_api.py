@@ -0,0 +1,53 @@
+from conftest import plane
+
+
+def icaos(response):
+    assert response.status_code == 200, response.text
+    return sorted(p['icao'] for p in response.json())
+
+
+def test_bbox_query_filters_on_the_exact_box(db, client):
+    db.planes.docs = [
+        plane('inside', 50.8505, 4.3505),
+        # Inside the 0.01 degree cache tile around the box, but not inside the box
+        plane('outside', 50.8595, 4.3595),
+    ]
+    assert icaos(client.get('/planes', params={'bbox': '50.8501,4.3501,50.8510,4.3510'})) == ['inside']
+    # Same cache slot, different box: answered for its own bbox, not from the entry above
+    assert icaos(client.get('/planes', params={'bbox': '50.8590,4.3590,50.8599,4.3599'})) == ['outside']
+    assert icaos(client.get('/planes', params={'bbox': '50.8501,4.3501,50.8510,4.3510'})) == ['inside']
+
+
+def test_radius_query_is_centred_on_the_exact_point(db, client):
+    db.planes.docs = [plane('near', 50.8534, 4.3534), plane('far', 50.8566, 4.3566)]
+    # The centre would snap to (50.85, 4.35) or (50.86, 4.36); both are about 550 m off
+    params = {'lat': 50.8534, 'lon': 4.3534, 'radius': 100}
+    assert icaos(client.get('/planes', params=params)) == ['near']
+    params = {'lat': 50.8566, 'lon': 4.3566, 'radius': 100}
+    assert icaos(client.get('/planes', params=params)) == ['far']
+
+
+def test_viewport_shows_individual_aircraft_at_the_default_map_view(db, client):
+    # The Map GUI opens on Belgium at zoom 7
+    db.planes.docs = [plane(f'ac{i}', 50.0 + i * 0.005, 4.0 + i * 0.005) for i in range(300)]
+    body = client.get('/planes/viewport', params={'bbox': '49.0,2.0,52.0,7.0', 'zoom': 7}).json()
+    assert body['mode'] == 'planes'
+    assert body['count'] == 300 and len(body['planes']) == 300
+
+
+def test_viewport_clusters_when_too_many_aircraft_are_in_view(db, client, monkeypatch):
+    from app.config import settings
+    monkeypatch.setattr(settings, 'VIEWPORT_MAX_PLANES', 50)
+    db.planes.docs = [plane(f'ac{i}', 50.0 + i * 0.005, 4.0 + i * 0.005) for i in range(300)]
+    db.planes.docs.append(plane('report_1', 50.5, 4.5, source='dronereport'))
+    body = client.get('/planes/viewport', params={'bbox': '49.0,2.0,52.0,7.0', 'zoom': 12}).json()
+    assert body['mode'] == 'clusters'
+    assert sum(c['count'] for c in body['clusters']) == 300
+    # Reports are still listed individually
+    assert [p['icao'] for p in body['planes']] == ['report_1']
+
+
+def test_viewport_filters_on_the_exact_box(db, client):
+    db.planes.docs = [plane('inside', 50.8505, 4.3505), plane('outside', 50.8595, 4.3595)]
+    body = client.get('/planes/viewport', params={'bbox': '50.8501,4.3501,50.8510,4.3510', 'zoom': 14}).json()
+    assert [p['icao'] for p in body['planes']] == ['inside']
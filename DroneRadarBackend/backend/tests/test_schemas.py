@@ -0,0 +1,73 @@
+import time
+
+import pytest
+from pydantic import ValidationError
+
+from app.schemas import FeedPlane, PlaneIn, validate_plane_batch
+
+NOW = int(time.time())
+BASE = {'msg_id': 'm1', 'source': 'opensky', 'icao': '4b1805', 'flight': 'SWR123', 'country': 'Switzerland',
+        'ts_unix': NOW - 5, 'lat': 50.9, 'lon': 4.48, 'alt': 1200.0, 'spd': 120.5, 'heading': 270.0,
+        'vr': -3.2, 'alt_geom': 1250.0, 'squawk': '7000', 'on_ground': False}
+
+# Collector records: valid ones, records PlaneIn rejects, and types only PlaneIn coerces
+RECORDS = [
+    BASE,
+    {'icao': 'abc123', 'lat': 50, 'lon': 4},
+    {**BASE, 'flight': '  KLM   12 ', 'country': "Cote d'Ivoire"},
+    {**BASE, 'flight': '<b>KLM</b>12'},
+    {**BASE, 'on_ground': True, 'alt': None, 'spd': 0},
+    {**BASE, 'lat': -90, 'lon': 180, 'heading': 360, 'vr': 100, 'alt': -500},
+    {**BASE, 'lat': '50.5'},
+    {**BASE, 'ts_unix': '%d' % NOW},
+    {**BASE, 'on_ground': 1},
+    {**BASE, 'lat': 90.5},
+    {**BASE, 'lon': -180.1},
+    {**BASE, 'alt': 20000.5},
+    {**BASE, 'spd': -1},
+    {**BASE, 'heading': 361},
+    {**BASE, 'vr': -101},
+    {**BASE, 'ts_unix': NOW + 3600},
+    {**BASE, 'ts_unix': NOW - 2 * 86400},
+    {**BASE, 'icao': 'ab'},
+    {**BASE, 'icao': 'x' * 25},
+    {**BASE, 'icao': 'ab$ne'},
+    {**BASE, 'flight': 'A$B'},
+    {**BASE, 'squawk': '700'},
+    {**BASE, 'squawk': '70a0'},
+    {**BASE, 'flight': 'x' * 1001},
+    {**BASE, 'lat': 0.0},
+    {**BASE, 'lon': None},
+]
+
+
+def plane_in(rec):
+    try:
+        return PlaneIn(**rec).to_db()
+    except ValidationError:
+        return None
+
+
+@pytest.mark.parametrize('rec', RECORDS)
+def test_fast_path_matches_plane_in(rec):
+    planes, rejects = validate_plane_batch([rec])
+    expected = plane_in(rec)
+    if expected is None:
+        assert planes == [] and [r['index'] for r in rejects] == [0]
+    else:
+        assert rejects == []
+        assert planes[0].to_db() == expected
+        assert (planes[0].icao, planes[0].source, planes[0].on_ground) == (rec.get('icao'), rec.get('source'), rec.get('on_ground'))
+
+
+def test_plain_records_take_the_fast_path():
+    planes, _ = validate_plane_batch([BASE, {**BASE, 'lat': '50.5'}, {**BASE, 'notes': 'seen from the ground'}])
+    assert [type(p) for p in planes] == [FeedPlane, PlaneIn, PlaneIn]
+
+
+def test_bad_records_are_reported_by_index():
+    batch = [BASE, {**BASE, 'lat': 91}, 'not a record', {**BASE, 'icao': 'def456'}, {**BASE, 'heading': 'north'}]
+    planes, rejects = validate_plane_batch(batch)
+    assert [p.icao for p in planes] == ['4b1805', 'def456']
+    assert [r['index'] for r in rejects] == [1, 2, 4]
+    assert all(r['error'] for r in rejects)
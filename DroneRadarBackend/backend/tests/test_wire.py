@@ -0,0 +1,47 @@
+import gzip
+import json
+
+import pytest
+
+from app import wire
+from app.auth import verify_airplanefeed
+from app.config import settings
+
+
+@pytest.fixture
+def collector(client, monkeypatch):
+    monkeypatch.setattr(settings, 'MAX_REQUEST_BODY_BYTES', 64 * 1024)
+    client.app.dependency_overrides[verify_airplanefeed] = lambda: 'airplanefeed'
+    yield client
+    client.app.dependency_overrides.clear()
+
+
+COMPRESS = {'gzip': gzip.compress}
+if wire.zstandard is not None:
+    COMPRESS['zstd'] = wire.zstandard.ZstdCompressor().compress
+
+
+@pytest.mark.parametrize('encoding', list(COMPRESS))
+def test_oversized_bodies_are_refused_after_decompression(collector, encoding):
+    # A few hundred bytes on the wire, 1 MB decompressed
+    body = COMPRESS[encoding](b'[' + b' ' * (1024 * 1024) + b']')
+    assert len(body) < 64 * 1024
+    response = collector.post('/planes/bulk', content=body,
+                              headers={'Content-Type': 'application/json', 'Content-Encoding': encoding})
+    assert response.status_code == 413
+
+
+@pytest.mark.parametrize('encoding', list(COMPRESS))
+def test_compressed_bodies_within_the_limit_are_accepted(db, collector, encoding):
+    records = [{'source': 'opensky', 'icao': 'abc123', 'lat': 50.5, 'lon': 4.5}]
+    body = COMPRESS[encoding](json.dumps(records).encode('utf-8'))
+    response = collector.post('/planes/bulk', content=body,
+                              headers={'Content-Type': 'application/json', 'Content-Encoding': encoding})
+    assert response.status_code == 200, response.text
+    assert [p['icao'] for p in db.planes.docs] == ['abc123']
+
+
+def test_oversized_plain_bodies_are_refused(collector):
+    response = collector.post('/planes/bulk', content=b'[' + b' ' * (65 * 1024) + b']',
+                              headers={'Content-Type': 'application/json'})
+    assert response.status_code == 413
@@ -6,6 +6,15 @@ Behavior:
 - Each file may contain a single JSON object or an array of objects. The script POSTs either a one-item array or the array as-is.
 - On success the file can optionally be deleted (use `--delete-on-success`).
 - Environment variables are loaded from a `.env` file if present: `API_URL` and `INPUT_DIR`.
+- By default each file is one snapshot: it is posted whole, one file at a time and in
+  file name order, so the backend's missed_updates bookkeeping sees the snapshots as
+  they were taken.
+- With `--backfill` records are re-batched across files into requests of `--batch-size`
+  records and posted by `--concurrency` workers sharing one keep-alive connection pool.
+  Those chunks are not snapshots, so they are sent with `?snapshot=false`. Large array
+  files are parsed incrementally, so memory stays bounded by the batch size.
+- 429/5xx responses and connection errors are retried with exponential backoff.
+- A throughput summary (records/s, p50/p99 request latency) is logged at the end.
 
 Usage examples:
 
@@ -15,10 +24,8 @@ Usage examples:
   # override with flags
   python ingest.py --api-url http://backend:8000 --input-dir /input_json --delete-on-success
 
-Note: this is intentionally minimal. For production ingestion consider
-- streaming directly to MongoDB or a message queue,
-- adding retries/backoff, concurrency, and error handling,
-- authentication headers if your API is protected.
+  # backfill: 8 parallel requests of 1000 records each
+  python ingest.py --backfill --concurrency 8 --batch-size 1000
 """
 
 from __future__ import annotations
@@ -27,12 +34,16 @@ import sys
 import json
 import argparse
 import logging
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from pathlib import Path
-from typing import Generator, Tuple, Any
+from typing import Generator, Tuple, Any, Dict, Iterator, List, Optional
 
+import random
+import threading
 import requests
 import time
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
 from requests.auth import HTTPBasicAuth
 
 
@@ -41,6 +52,13 @@ load_dotenv()
 DEFAULT_API_URL = os.environ.get('API_URL', 'http://localhost:8000')
 DEFAULT_INPUT_DIR = os.environ.get('INPUT_DIR', './input_json')
 
+# Responses worth retrying, and the cap on a single backoff sleep
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+MAX_BACKOFF_SECONDS = 60.0
+# Files above this size are parsed incrementally instead of loaded whole
+STREAM_THRESHOLD_BYTES = 8 * 1024 * 1024
+READ_CHUNK_CHARS = 1024 * 1024
+
 
 logger = logging.getLogger('ingest')
 logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
@@ -50,7 +68,7 @@ def find_json_files(folder: Path, pattern: str = '*.json') -> Generator[Path, No
     if not folder.exists():
         logger.warning('Input folder %s does not exist', folder)
         return
-    for p in folder.glob(pattern):
+    for p in sorted(folder.glob(pattern)):
         if p.is_file():
             yield p
 
@@ -61,20 +79,142 @@ def load_json_file(path: Path) -> Any:
     return json.loads(text)
 
 
-def post_payload(api_url: str, payload: Any, timeout: int = 10) -> requests.Response:
-    url = api_url.rstrip('/') + '/planes/bulk'
-    headers = {'Content-Type': 'application/json'}
+def make_session(concurrency: int = 1) -> requests.Session:
+    """Create a keep-alive session whose connection pool fits `concurrency` workers."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, concurrency))
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
     # Load credentials from environment
-    auth_username = os.environ.get('AUTH_USERNAME', 'admin')
-    auth_password = os.environ.get('AUTH_PASSWORD', 'pass')
-    
-    return requests.post(
-            url, 
-            json=payload, 
-            headers=headers, 
-            auth=HTTPBasicAuth(auth_username, auth_password),
-            timeout=30
-        )
+    session.auth = HTTPBasicAuth(os.environ.get('AUTH_USERNAME', 'admin'), os.environ.get('AUTH_PASSWORD', 'pass'))
+    session.headers['Content-Type'] = 'application/json'
+    return session
+
+
+class IngestStats:
+    """Thread-safe counters and per-request latencies for the final summary."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies: List[float] = []
+        self.records_ok = 0
+        self.records_failed = 0
+        self.retries = 0
+
+    def add_latency(self, seconds: float) -> None:
+        with self.lock:
+            self.latencies.append(seconds)
+
+    def add_retry(self) -> None:
+        with self.lock:
+            self.retries += 1
+
+    def percentile(self, q: float) -> float:
+        with self.lock:
+            values = sorted(self.latencies)
+        if not values:
+            return 0.0
+        return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+def iter_json_records(path: Path) -> Iterator[Any]:
+    """Yield the plane objects of a JSON file: each element of a top-level array, or the object itself.
+
+    Files larger than STREAM_THRESHOLD_BYTES are decoded one array element at
+    a time from a sliding buffer, so a multi-GB array never sits in memory.
+    """
+    if path.stat().st_size <= STREAM_THRESHOLD_BYTES:
+        data = load_json_file(path)
+        if isinstance(data, dict):
+            yield data
+        elif isinstance(data, list):
+            yield from data
+        else:
+            raise ValueError(f'Unsupported JSON top-level type: {type(data)}')
+        return
+
+    decoder = json.JSONDecoder()
+    with open(path, 'r', encoding='utf-8-sig') as f:
+        buf = f.read(READ_CHUNK_CHARS)
+        pos = 0
+
+        def fill(pos: int) -> Tuple[str, int, bool]:
+            """Skip whitespace and separators, reading more input when the buffer runs dry."""
+            nonlocal buf
+            while True:
+                while pos < len(buf) and buf[pos] in ' \t\r\n,':
+                    pos += 1
+                if pos < len(buf):
+                    return buf, pos, True
+                more = f.read(READ_CHUNK_CHARS)
+                if not more:
+                    return buf, pos, False
+                buf, pos = more, 0
+
+        buf, pos, ok = fill(pos)
+        if not ok:
+            return
+        if buf[pos] != '[':
+            # One huge object: nothing to stream, decode it whole
+            data = json.loads(buf[pos:] + f.read())
+            if not isinstance(data, dict):
+                raise ValueError(f'Unsupported JSON top-level type: {type(data)}')
+            yield data
+            return
+        pos += 1
+        while True:
+            buf, pos, ok = fill(pos)
+            if not ok:
+                raise ValueError('Unexpected end of file inside JSON array')
+            if buf[pos] == ']':
+                return
+            try:
+                obj, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                more = f.read(READ_CHUNK_CHARS)
+                if not more:
+                    raise
+                buf, pos = buf[pos:] + more, 0
+                continue
+            yield obj
+            pos = end
+            if pos > READ_CHUNK_CHARS:
+                buf, pos = buf[pos:], 0
+
+
+def post_payload(session: requests.Session, api_url: str, payload: Any, stats: IngestStats,
+                 max_retries: int = 5, backoff: float = 0.5, timeout: int = 30,
+                 snapshot: bool = True) -> Optional[requests.Response]:
+    """POST one batch to /planes/bulk, retrying 429/5xx and connection errors with exponential backoff.
+
+    With `snapshot=False` the batch is sent with `?snapshot=false`, so the
+    backend doesn't count planes missing from it as missed updates.
+    Returns the last response, or None if every attempt failed to connect.
+    """
+    url = api_url.rstrip('/') + '/planes/bulk'
+    params = None if snapshot else {'snapshot': 'false'}
+    r = None
+    for attempt in range(max_retries + 1):
+        t0 = time.perf_counter()
+        try:
+            r = session.post(url, json=payload, params=params, timeout=timeout)
+        except requests.RequestException as e:
+            logger.debug('Request to %s failed (attempt %d): %s', url, attempt + 1, e)
+            r = None
+        stats.add_latency(time.perf_counter() - t0)
+        if r is not None and r.status_code not in RETRY_STATUSES:
+            return r
+        if attempt == max_retries:
+            break
+        retry_after = r.headers.get('Retry-After') if r is not None else None
+        if retry_after and retry_after.isdigit():
+            delay = float(retry_after)
+        else:
+            delay = backoff * (2 ** attempt) * (0.5 + random.random())
+        stats.add_retry()
+        time.sleep(min(delay, MAX_BACKOFF_SECONDS))
+    return r
+
 
 def wait_for_backend(api_url: str, timeout: float = 1.0, attempts: int = 30) -> bool:
     """Poll the backend /health endpoint until it responds or attempts are exhausted.
@@ -94,56 +234,135 @@ def wait_for_backend(api_url: str, timeout: float = 1.0, attempts: int = 30) ->
     return False
 
 
-def process_files(api_url: str, input_dir: str, pattern: str = '*.json', delete_on_success: bool = False) -> None:
+def process_files(api_url: str, input_dir: str, pattern: str = '*.json', delete_on_success: bool = False,
+                  concurrency: int = 1, batch_size: int = 500, max_retries: int = 5, backoff: float = 0.5,
+                  backfill: bool = False) -> None:
+    """Post every matching file to /planes/bulk.
+
+    Files are snapshots unless `backfill` is set: each is posted whole, in
+    order, one request at a time. `concurrency` and `batch_size` only apply
+    to backfills, whose re-batched chunks are posted with `snapshot=false`.
+    """
     folder = Path(input_dir)
     files = list(find_json_files(folder, pattern=pattern))
     if not files:
         logger.info('No files found in %s matching %s', folder, pattern)
         return
-
-    success_count = 0
-    fail_count = 0
-
-    for f in files:
-        logger.info('Processing %s', f)
-        try:
-            data = load_json_file(f)
-        except Exception as e:
-            logger.error('Failed to parse %s: %s', f, e)
-            fail_count += 1
-            continue
-
-        # Ensure payload is an array of plane objects
-        if isinstance(data, dict):
-            payload = [data]
-        elif isinstance(data, list):
-            payload = data
+    if not backfill:
+        if concurrency > 1:
+            logger.warning('Snapshot files are posted one at a time; use --backfill for concurrent requests')
+        concurrency = 1
+
+    session = make_session(concurrency)
+    stats = IngestStats()
+    # Per-file bookkeeping: a file succeeds once every batch holding its records succeeded
+    state: Dict[Path, Dict[str, Any]] = {f: {'pending': 0, 'failed': False, 'read': False} for f in files}
+    counts = {'success': 0, 'fail': 0}
+
+    def finish_if_done(f: Path) -> None:
+        st = state[f]
+        if not st['read'] or st['pending'] or st.get('done'):
+            return
+        st['done'] = True
+        if st['failed']:
+            counts['fail'] += 1
+            return
+        counts['success'] += 1
+        logger.info('Uploaded %s', f.name)
+        if delete_on_success:
+            try:
+                f.unlink()
+                logger.info('Deleted %s after success', f)
+            except Exception as e:
+                logger.warning('Failed to delete %s: %s', f, e)
+
+    def snapshots() -> Iterator[Tuple[List[Any], Dict[Path, int]]]:
+        """One request per file, in order."""
+        for f in files:
+            logger.info('Processing %s', f)
+            try:
+                records = list(iter_json_records(f))
+            except Exception as e:
+                logger.error('Failed to parse %s: %s', f, e)
+                state[f]['failed'] = True
+                records = []
+            if records:
+                state[f]['pending'] += 1
+            state[f]['read'] = True
+            if records:
+                yield records, {f: len(records)}
+            else:
+                finish_if_done(f)
+
+    def batches() -> Iterator[Tuple[List[Any], Dict[Path, int]]]:
+        """Re-batch records across files into requests of `batch_size` records.
+
+        A chunk may hold several positions of one aircraft (from consecutive
+        files); the backend upserts the last and keeps the others in its
+        position_history and track_points.
+        """
+        batch: List[Any] = []
+        owners: Dict[Path, int] = {}
+        for f in files:
+            logger.info('Processing %s', f)
+            try:
+                for rec in iter_json_records(f):
+                    if f not in owners:
+                        state[f]['pending'] += 1
+                        owners[f] = 0
+                    owners[f] += 1
+                    batch.append(rec)
+                    if len(batch) >= batch_size:
+                        yield batch, owners
+                        batch, owners = [], {}
+            except Exception as e:
+                logger.error('Failed to parse %s: %s', f, e)
+                state[f]['failed'] = True
+            state[f]['read'] = True
+            finish_if_done(f)
+        if batch:
+            yield batch, owners
+
+    def on_done(batch: List[Any], owners: Dict[Path, int], r: Optional[requests.Response]) -> None:
+        ok = r is not None and r.ok
+        if ok:
+            stats.records_ok += len(batch)
+            logger.debug('Posted %d records -> %s (%s)', len(batch), r.url, r.status_code)
         else:
-            logger.error('Unsupported JSON top-level type in %s: %s', f, type(data))
-            fail_count += 1
-            continue
-
-        try:
-            r = post_payload(api_url, payload)
-        except requests.RequestException as e:
-            logger.error('Request to %s failed for %s: %s', api_url, f.name, e)
-            fail_count += 1
-            continue
-
-        if r.ok:
-            logger.info('Uploaded %s -> %s (%s)', f.name, r.url, r.status_code)
-            success_count += 1
-            if delete_on_success:
-                try:
-                    f.unlink()
-                    logger.info('Deleted %s after success', f)
-                except Exception as e:
-                    logger.warning('Failed to delete %s: %s', f, e)
-        else:
-            logger.error('Server returned %s for %s: %s', r.status_code, f.name, r.text)
-            fail_count += 1
-
-    logger.info('Done. success=%d fail=%d total=%d', success_count, fail_count, len(files))
+            stats.records_failed += len(batch)
+            if r is None:
+                logger.error('Request to %s failed for %d records from %s', api_url, len(batch), ', '.join(f.name for f in owners))
+            else:
+                logger.error('Server returned %s for %d records from %s: %s', r.status_code, len(batch), ', '.join(f.name for f in owners), r.text[:500])
+        for f in owners:
+            state[f]['pending'] -= 1
+            if not ok:
+                state[f]['failed'] = True
+            finish_if_done(f)
+
+    t_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        in_flight = {}
+        for batch, owners in (batches() if backfill else snapshots()):
+            # Bound read-ahead so memory stays proportional to concurrency * batch_size
+            while len(in_flight) >= 2 * max(1, concurrency):
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    on_done(*in_flight.pop(fut), fut.result())
+            # A single worker posts the snapshots in submission order
+            fut = pool.submit(post_payload, session, api_url, batch, stats, max_retries, backoff,
+                              snapshot=not backfill)
+            in_flight[fut] = (batch, owners)
+        for fut in list(in_flight):
+            on_done(*in_flight.pop(fut), fut.result())
+    elapsed = time.perf_counter() - t_start
+    session.close()
+
+    logger.info('Done. success=%d fail=%d total=%d', counts['success'], counts['fail'], len(files))
+    total_records = stats.records_ok + stats.records_failed
+    logger.info('Throughput: %d records (%d failed) in %.1fs = %.0f records/s; %d requests, %d retries, latency p50=%.0f ms p99=%.0f ms',
+                total_records, stats.records_failed, elapsed, stats.records_ok / elapsed if elapsed > 0 else 0.0,
+                len(stats.latencies), stats.retries, stats.percentile(0.5) * 1000, stats.percentile(0.99) * 1000)
 
 
 def build_argparser() -> argparse.ArgumentParser:
@@ -152,6 +371,13 @@ def build_argparser() -> argparse.ArgumentParser:
     p.add_argument('--input-dir', default=DEFAULT_INPUT_DIR, help='Folder containing .json files')
     p.add_argument('--pattern', default='*.json', help='Glob pattern for files in input-dir')
     p.add_argument('--delete-on-success', action='store_true', help='Delete JSON file after successful POST')
+    p.add_argument('--backfill', action='store_true',
+                   help='Files are not snapshots: re-batch and post them concurrently with snapshot=false')
+    p.add_argument('--concurrency', type=int, default=1, help='Number of parallel POST requests with --backfill (default 1)')
+    p.add_argument('--batch-size', type=int, default=500,
+                   help='Records per request with --backfill; small files are combined (default 500)')
+    p.add_argument('--max-retries', type=int, default=5, help='Retries per request on 429/5xx or connection errors (default 5)')
+    p.add_argument('--backoff', type=float, default=0.5, help='Initial retry backoff in seconds, doubled per attempt (default 0.5)')
     p.add_argument('--verbose', action='store_true', help='Enable debug logging')
     return p
 
@@ -164,7 +390,9 @@ def main(argv: list[str] | None = None) -> int:
     if args.verbose:
         logger.setLevel(logging.DEBUG)
 
-    process_files(args.api_url, args.input_dir, pattern=args.pattern, delete_on_success=args.delete_on_success)
+    process_files(args.api_url, args.input_dir, pattern=args.pattern, delete_on_success=args.delete_on_success,
+                  concurrency=args.concurrency, batch_size=max(1, args.batch_size),
+                  max_retries=max(0, args.max_retries), backoff=args.backoff, backfill=args.backfill)
     return 0
 
 
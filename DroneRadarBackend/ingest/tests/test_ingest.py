@@ -0,0 +1,72 @@
+import json
+import threading
+
+import pytest
+
+import ingest
+
+
+class FakeResponse:
+    ok = True
+    status_code = 200
+    url = 'http://backend/planes/bulk'
+    text = ''
+
+
+@pytest.fixture
+def posts(monkeypatch):
+    """Record every /planes/bulk request instead of sending it."""
+    sent = []
+    lock = threading.Lock()
+
+    def post_payload(session, api_url, payload, stats, max_retries=5, backoff=0.5, timeout=30, snapshot=True):
+        with lock:
+            sent.append((list(payload), snapshot))
+        return FakeResponse()
+
+    monkeypatch.setattr(ingest, 'post_payload', post_payload)
+    return sent
+
+
+def write_snapshots(folder, count=3, planes=3):
+    # Written out of name order on purpose
+    for n in reversed(range(count)):
+        records = [{'source': 'opensky', 'icao': f'abc{i}', 'lat': 50.0 + n, 'lon': 4.0, 'ts_unix': 1700000000 + n}
+                   for i in range(planes)]
+        (folder / f'snapshot_{n:02d}.json').write_text(json.dumps(records))
+
+
+def test_snapshot_files_are_posted_whole_and_in_order(tmp_path, posts):
+    write_snapshots(tmp_path)
+    ingest.process_files('http://backend', str(tmp_path), concurrency=4, batch_size=2)
+
+    assert [snapshot for _, snapshot in posts] == [True, True, True]
+    assert [len(payload) for payload, _ in posts] == [3, 3, 3]
+    # One file per request, oldest snapshot first
+    assert [payload[0]['ts_unix'] for payload, _ in posts] == [1700000000, 1700000001, 1700000002]
+
+
+def test_backfill_chunks_are_not_snapshots(tmp_path, posts):
+    write_snapshots(tmp_path)
+    ingest.process_files('http://backend', str(tmp_path), concurrency=4, batch_size=2, backfill=True)
+
+    assert all(not snapshot for _, snapshot in posts)
+    assert sorted(len(payload) for payload, _ in posts) == [1, 2, 2, 2, 2]
+
+
+def test_backfill_posts_every_position_of_an_aircraft(tmp_path, posts):
+    write_snapshots(tmp_path, count=4, planes=2)
+    ingest.process_files('http://backend', str(tmp_path), batch_size=4, backfill=True)
+
+    # Chunks span files, so they carry several positions of one icao
+    assert any(len({rec['icao'] for rec in payload}) < len(payload) for payload, _ in posts)
+    track = sorted((rec['icao'], rec['lat']) for payload, _ in posts for rec in payload)
+    assert track == [(f'abc{i}', 50.0 + n) for i in range(2) for n in range(4)]
+
+
+def test_delete_on_success_waits_for_every_chunk_of_a_file(tmp_path, posts):
+    write_snapshots(tmp_path, count=2)
+    ingest.process_files('http://backend', str(tmp_path), delete_on_success=True, batch_size=2, backfill=True)
+
+    assert list(tmp_path.iterdir()) == []
+    assert sum(len(payload) for payload, _ in posts) == 6
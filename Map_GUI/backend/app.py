@@ -1,44 +1,141 @@
 import os
 import json
+import gzip
+import hashlib
 import threading
 import time
 import tempfile
 from pathlib import Path
 from flask import Flask, jsonify, send_from_directory, abort, Response, stream_with_context, request
 import requests
+from reports_store import ReportStore
 
-# where to write planefeed.json
+# data directory: report files, and the optional planefeed.json mirror
 DATA_DIR = Path(os.environ.get("ADSB_DATA_DIR", "/data"))
 # how often to poll the backend for plane data (seconds)
 POLL_SECONDS = int(os.environ.get("MAP_POLL_SECONDS", "5"))
 # backend API base (used by poller)
 BACKEND_API = os.environ.get("BACKEND_API", "http://backend:8000")
+# also mirror each new snapshot to DATA_DIR/planefeed.json (off by default; served from memory)
+WRITE_PLANEFEED = os.environ.get("MAP_WRITE_PLANEFEED", "false").lower() in ("1", "true", "yes")
+# longest a /api/planes long-poll (?since=<version>) is held open, and SSE keepalive interval (seconds)
+LONG_POLL_MAX_SECONDS = float(os.environ.get("MAP_LONG_POLL_MAX_SECONDS", "25"))
+SSE_KEEPALIVE_SECONDS = float(os.environ.get("MAP_SSE_KEEPALIVE_SECONDS", "15"))
+# open long-polls/streams per worker (each holds a gunicorn thread), and how long one stream may stay open
+MAX_WAITING = int(os.environ.get("MAP_MAX_WAITING", "8"))
+SSE_MAX_SECONDS = float(os.environ.get("MAP_SSE_MAX_SECONDS", "300"))
 
 app = Flask(__name__, static_folder="frontend", static_url_path="")
 
 
-def poll_backend_loop():
-    """Background thread: poll backend /planes and write local planefeed.json."""
+class PlaneSnapshot:
+    """Latest plane feed as ready-to-send bytes, shared by all request threads.
+
+    The poller publishes the backend response once per change; requests
+    serve the stored bytes (plain or gzipped) without touching disk or
+    re-encoding JSON. The ETag and `version` are a hash of the content,
+    so they are the same in every gunicorn worker and clients can long-poll
+    or stream changes whichever worker answers.
+    """
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.body = b'{"planes":[]}'
+        self.gzipped = gzip.compress(self.body)
+        self.etag = self._etag(self.body)
+        self.version = _content_version(self.body)
+        self.updated_at = None
+
+    @staticmethod
+    def _etag(body: bytes) -> str:
+        return '"%s"' % _content_version(body)
+
+    def publish(self, body: bytes) -> bool:
+        """Store a new feed body; returns False if it is unchanged."""
+        etag = self._etag(body)
+        if etag == self.etag:
+            return False
+        gzipped = gzip.compress(body, compresslevel=5)
+        version = _content_version(body)
+        with self.cond:
+            self.body, self.gzipped, self.etag, self.version = body, gzipped, etag, version
+            self.updated_at = time.time()
+            self.cond.notify_all()
+        return True
+
+    def wait_newer(self, version, timeout: float) -> str:
+        """Block until a version other than `version` is published or `timeout` passes; returns the current version."""
+        with self.cond:
+            self.cond.wait_for(lambda: _is_newer(self.version, version), timeout=timeout)
+            return self.version
+
+
+def _content_version(body: bytes) -> str:
+    """Version of a feed body: a hash of its content."""
+    return hashlib.sha1(body).hexdigest()[:16]
+
+
+def _is_newer(current: str, seen) -> bool:
+    """Whether `current` differs from the version a client already has.
+
+    Any change counts, including planes dropping out of the feed, so a
+    client may briefly get an older feed from a worker that hasn't polled
+    the newest one yet; it catches up on that worker's next poll.
+    """
+    return current != seen
+
+
+# Long-polls and streams each hold a request thread; past MAX_WAITING they aren't held
+waiting = threading.BoundedSemaphore(max(1, MAX_WAITING))
+
+
+snapshot = PlaneSnapshot()
+
+
+def _feed_body(content: bytes) -> bytes:
+    """Wrap a backend /planes response as {"planes": [...]} without re-encoding the list."""
+    stripped = content.lstrip()
+    if stripped.startswith(b'['):
+        return b'{"planes":' + stripped + b'}'
+    data = json.loads(content)
+    if not (isinstance(data, dict) and 'planes' in data):
+        data = {"planes": data}
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def _write_planefeed(body: bytes):
+    # atomic write
     DATA_DIR.mkdir(parents=True, exist_ok=True)
-    outfile = DATA_DIR / "planefeed.json"
+    with tempfile.NamedTemporaryFile('wb', delete=False, dir=DATA_DIR) as tf:
+        tf.write(body)
+        tmpname = tf.name
+    os.replace(tmpname, DATA_DIR / "planefeed.json")
+
+
+def poll_backend_loop():
+    """Background thread: poll backend /planes and publish it to the in-memory snapshot."""
+    # Until the backend answers, serve whatever planefeed.json a previous run (or a collector) left
+    planefile = DATA_DIR / "planefeed.json"
+    if planefile.exists():
+        try:
+            snapshot.publish(_feed_body(planefile.read_bytes()))
+        except Exception as e:
+            app.logger.debug(f"Map GUI: ignoring unreadable {planefile}: {e}")
+
     url = f"{BACKEND_API.rstrip('/')}/planes?limit=1000"
+    session = requests.Session()
+    upstream_etag = None
     while True:
         try:
-            resp = requests.get(url, timeout=10)
+            headers = {'If-None-Match': upstream_etag} if upstream_etag else {}
+            resp = session.get(url, headers=headers, timeout=10)
             if resp.status_code == 200:
-                planes = resp.json()
-                # normalize into {"planes": [...]}
-                if isinstance(planes, dict) and 'planes' in planes:
-                    data = planes
-                else:
-                    data = {"planes": planes}
-                # atomic write
-                with tempfile.NamedTemporaryFile('w', delete=False, dir=DATA_DIR, encoding='utf-8') as tf:
-                    json.dump(data, tf, ensure_ascii=False)
-                    tmpname = tf.name
-                os.replace(tmpname, outfile)
-            else:
-                # keep previous file if backend unavailable
+                upstream_etag = resp.headers.get('ETag')
+                body = _feed_body(resp.content)
+                if snapshot.publish(body) and WRITE_PLANEFEED:
+                    _write_planefeed(body)
+            elif resp.status_code != 304:
+                # keep previous snapshot if backend unavailable
                 app.logger.warning(f"Map GUI poll: backend returned {resp.status_code}")
         except Exception as e:
             app.logger.debug(f"Map GUI poll error: {e}")
@@ -48,43 +145,84 @@ def poll_backend_loop():
 # start background poller thread
 threading.Thread(target=poll_backend_loop, daemon=True).start()
 
+# analyst reports (SQLite); report files from the old directory store are imported on first start
+reports = ReportStore(Path(os.environ.get("MAP_REPORTS_DB", DATA_DIR / "reports.db")))
+try:
+    imported = reports.import_directory(DATA_DIR)
+    if imported:
+        app.logger.info(f"Imported {imported} report files into {reports.path}")
+except Exception as e:
+    app.logger.warning(f"Report import from {DATA_DIR} failed: {e}")
+
 
 @app.route("/")
 def index():
     return send_from_directory(app.static_folder, "index.html")
 
 
+def _float_arg(name):
+    value = request.args.get(name)
+    return None if value in (None, '') else float(value)
+
+
 @app.route('/api/reports', methods=['GET', 'POST'])
 def manage_reports():
-    """GET: Return all reports (drone, camera, radar).
-    POST: Create a new report."""
+    """GET: Return reports (drone, camera, radar), newest first.
+    POST: Create a new report.
+
+    Without query parameters GET returns every report (served from the
+    store's per-revision cache, with an ETag). Optional parameters:
+    `limit`/`offset` (total in `X-Total-Count`), `type`, `from`/`to` (epoch
+    seconds), `bbox=min_lat,min_lon,max_lat,max_lon`, and `since=<rev>` to
+    fetch only reports changed after a revision, oldest change first
+    (deleted ones come back as `{"_id": ..., "_deleted": true}`). The
+    revision the response brings the client up to is returned in
+    `X-Reports-Rev`: the current one, or with `since` the revision of the
+    last change sent when more remain.
+    """
     if request.method == 'GET':
-        reports = []
-        for file in DATA_DIR.glob("*.json"):
-            if file.name == "planefeed.json":
-                continue
-            try:
-                with open(file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    data['_filename'] = file.name
-                    data['_id'] = file.stem
-                    reports.append(data)
-            except Exception as e:
-                app.logger.warning(f"Error reading {file.name}: {e}")
-                continue
-        return jsonify(reports)
+        filters = ('since', 'type', 'from', 'to', 'bbox', 'limit', 'offset')
+        if not any(request.args.get(k) for k in filters):
+            rev, body = reports.all_encoded()
+            etag = f'"r{rev}"'
+            headers = {'ETag': etag, 'X-Reports-Rev': str(rev), 'Cache-Control': 'no-cache'}
+            if request.headers.get('If-None-Match') == etag:
+                return Response(status=304, headers=headers)
+            return Response(body, content_type='application/json', headers=headers)
+
+        try:
+            bbox = request.args.get('bbox')
+            if bbox:
+                bbox = tuple(float(x) for x in bbox.split(','))
+                if len(bbox) != 4:
+                    raise ValueError('bbox needs min_lat,min_lon,max_lat,max_lon')
+            results, total, rev = reports.query(
+                since=request.args.get('since', type=int),
+                report_type=request.args.get('type') or None,
+                start=_float_arg('from'),
+                end=_float_arg('to'),
+                bbox=bbox,
+                limit=min(request.args.get('limit', 1000, type=int), 5000),
+                offset=max(0, request.args.get('offset', 0, type=int)),
+            )
+        except ValueError as e:
+            return jsonify({'detail': f'Invalid filter: {e}'}), 400
+        resp = jsonify(results)
+        resp.headers['X-Reports-Rev'] = str(rev)
+        resp.headers['X-Total-Count'] = str(total)
+        return resp
     
     elif request.method == 'POST':
         try:
             payload = request.get_json(force=True)
         except Exception:
             return jsonify({'detail': 'Invalid JSON'}), 400
+        if not isinstance(payload, dict):
+            return jsonify({'detail': 'Report must be a JSON object'}), 400
         
-        # Generate unique filename
+        # Generate unique id
         import uuid
         report_id = str(uuid.uuid4())
-        filename = f"report_{report_id}.json"
-        filepath = DATA_DIR / filename
         
         # Ensure required fields
         if 'type' not in payload:
@@ -93,10 +231,9 @@ def manage_reports():
             payload['timestamp'] = time.time()
         
         try:
-            with open(filepath, 'w', encoding='utf-8') as f:
-                json.dump(payload, f, ensure_ascii=False, indent=2)
-            app.logger.info(f"Created report: {filename}")
-            return jsonify({'status': 'ok', 'id': report_id, 'filename': filename}), 201
+            reports.put(report_id, payload)
+            app.logger.info(f"Created report: {report_id}")
+            return jsonify({'status': 'ok', 'id': report_id}), 201
         except Exception as e:
             app.logger.error(f"Failed to create report: {e}")
             return jsonify({'detail': f'Failed to create report: {e}'}), 500
@@ -105,39 +242,23 @@ def manage_reports():
 @app.route('/api/reports/<report_id>', methods=['GET', 'PUT', 'DELETE'])
 def manage_report(report_id):
     """GET: Get single report. PUT: Update report. DELETE: Delete report."""
-    filepath = DATA_DIR / f"report_{report_id}.json"
-    
     if request.method == 'GET':
-        if not filepath.exists():
+        data = reports.get(report_id)
+        if data is None:
             return jsonify({'detail': 'Report not found'}), 404
-        try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                data['_id'] = report_id
-                data['_filename'] = filepath.name
-                return jsonify(data)
-        except Exception as e:
-            return jsonify({'detail': f'Error reading report: {e}'}), 500
+        return jsonify(data)
     
     elif request.method == 'PUT':
-        if not filepath.exists():
-            return jsonify({'detail': 'Report not found'}), 404
         try:
             payload = request.get_json(force=True)
         except Exception:
             return jsonify({'detail': 'Invalid JSON'}), 400
+        if not isinstance(payload, dict):
+            return jsonify({'detail': 'Report must be a JSON object'}), 400
         
         try:
-            # Read existing data
-            with open(filepath, 'r', encoding='utf-8') as f:
-                existing = json.load(f)
-            # Merge updates
-            existing.update(payload)
-            # Write back
-            with tempfile.NamedTemporaryFile('w', delete=False, dir=DATA_DIR, encoding='utf-8', suffix='.json') as tf:
-                json.dump(existing, tf, ensure_ascii=False, indent=2)
-                tmpname = tf.name
-            os.replace(tmpname, filepath)
+            if reports.update(report_id, payload) is None:
+                return jsonify({'detail': 'Report not found'}), 404
             app.logger.info(f"Updated report: {report_id}")
             return jsonify({'status': 'ok', 'id': report_id})
         except Exception as e:
@@ -145,10 +266,9 @@ def manage_report(report_id):
             return jsonify({'detail': f'Failed to update report: {e}'}), 500
     
     elif request.method == 'DELETE':
-        if not filepath.exists():
-            return jsonify({'detail': 'Report not found'}), 404
         try:
-            os.remove(filepath)
+            if not reports.delete(report_id):
+                return jsonify({'detail': 'Report not found'}), 404
             app.logger.info(f"Deleted report: {report_id}")
             return jsonify({'status': 'ok', 'id': report_id})
         except Exception as e:
@@ -188,35 +308,96 @@ def alert_authority():
         return jsonify({'status': 'accepted_local_only', 'forward_error': str(e)}), 202
 
 
-@app.route("/api/reports")
-def get_reports():
-    """Return all drone reports (JSON files except planefeed.json)."""
-    reports = []
-    for file in DATA_DIR.glob("*.json"):
-        if file.name == "planefeed.json":
-            continue
-        try:
-            with open(file) as f:
-                data = json.load(f)
-                reports.append(data)
-        except Exception:
-            continue
-    return jsonify(reports)
-
+@app.route('/api/alerts')
+def proxy_alerts():
+    """Proxy the backend geofence alerts (GET /alerts). Requires operator credentials."""
+    backend_url = f"{BACKEND_API.rstrip('/')}/alerts"
+    headers = {'Authorization': request.headers.get('Authorization', '')}
+    try:
+        resp = requests.get(backend_url, params=request.args, headers=headers, timeout=8)
+        return Response(resp.content, status=resp.status_code, content_type=resp.headers.get('Content-Type', 'application/json'))
+    except Exception as e:
+        app.logger.debug(f"Alerts proxy error: {e}")
+        return jsonify({"detail": "backend unreachable"}), 502
 
 
 @app.route("/api/planes")
 def get_planes():
-    """Return current plane telemetry feed."""
-    planefile = DATA_DIR / "planefeed.json"
-    if not planefile.exists():
-        return jsonify({"planes": []})
+    """Return current plane telemetry feed.
+
+    With `?since=<version>` the request is held (up to `wait` seconds,
+    at most MAP_LONG_POLL_MAX_SECONDS) until the feed differs from the
+    version the client has. The version is returned in `X-Planes-Version`.
+    When MAP_MAX_WAITING requests are already held, it answers at once.
+    """
+    since = request.args.get('since')
+    if since:
+        wait = min(request.args.get('wait', LONG_POLL_MAX_SECONDS, type=float), LONG_POLL_MAX_SECONDS)
+        if waiting.acquire(blocking=False):
+            try:
+                snapshot.wait_newer(since, max(0.0, wait))
+            finally:
+                waiting.release()
+
+    with snapshot.cond:
+        body, gzipped, etag, version = snapshot.body, snapshot.gzipped, snapshot.etag, snapshot.version
+    headers = {'ETag': etag, 'X-Planes-Version': version, 'Cache-Control': 'no-cache', 'Vary': 'Accept-Encoding'}
+    if etag in [t.strip() for t in request.headers.get('If-None-Match', '').split(',')]:
+        return Response(status=304, headers=headers)
+    if 'gzip' in request.headers.get('Accept-Encoding', ''):
+        headers['Content-Encoding'] = 'gzip'
+        body = gzipped
+    return Response(body, content_type='application/json', headers=headers)
+
+
+@app.route("/api/planes/viewport")
+def proxy_viewport():
+    """Proxy the backend level-of-detail query (GET /planes/viewport?bbox=&zoom=)."""
+    backend_url = f"{BACKEND_API.rstrip('/')}/planes/viewport"
+    headers = {k: v for k, v in request.headers.items() if k.lower() in ('accept-encoding', 'if-none-match')}
     try:
-        with open(planefile) as f:
-            data = json.load(f)
-    except Exception:
-        return jsonify({"planes": []})
-    return jsonify(data)
+        resp = requests.get(backend_url, params=request.args, headers=headers, timeout=8, stream=True)
+        out = {k: v for k, v in resp.headers.items() if k.lower() in ('content-encoding', 'etag', 'vary')}
+        # Pass the (possibly compressed) body through untouched
+        return Response(resp.raw.read(), status=resp.status_code,
+                        content_type=resp.headers.get('Content-Type', 'application/json'), headers=out)
+    except Exception as e:
+        app.logger.debug(f"Viewport proxy error: {e}")
+        return jsonify({"detail": "backend unreachable"}), 502
+
+
+@app.route("/api/planes/stream")
+def stream_planes():
+    """Server-Sent Events: one `planes` event with the full feed per new version.
+
+    A stream is closed after MAP_SSE_MAX_SECONDS; EventSource reconnects on
+    its own and resumes after `Last-Event-ID`. At most MAP_MAX_WAITING
+    streams and long-polls are held per worker; past that the client gets
+    503 with Retry-After.
+    """
+    if not waiting.acquire(blocking=False):
+        return Response(b'too many open streams\n', status=503, content_type='text/plain',
+                        headers={'Retry-After': str(int(POLL_SECONDS))})
+
+    def generate(version):
+        deadline = time.monotonic() + SSE_MAX_SECONDS
+        while time.monotonic() < deadline:
+            timeout = min(SSE_KEEPALIVE_SECONDS, max(0.0, deadline - time.monotonic()))
+            if not _is_newer(snapshot.wait_newer(version, timeout), version):
+                yield b': keepalive\n\n'
+                continue
+            with snapshot.cond:
+                version, body = snapshot.version, snapshot.body
+            # Newlines in JSON are only ever whitespace, so the event stays on one data line
+            yield b'event: planes\nid: %s\ndata: %s\n\n' % (version.encode(), body.replace(b'\n', b' '))
+
+    # Resume after `Last-Event-ID`; a new client gets the current feed immediately
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    resp = Response(stream_with_context(generate(request.headers.get('Last-Event-ID'))),
+                    content_type='text/event-stream', headers=headers)
+    # The server closes the response when the stream ends or the client goes away
+    resp.call_on_close(waiting.release)
+    return resp
 
 
 @app.route('/api/auth', methods=['POST'])
@@ -287,9 +468,10 @@ def get_image(image_id: str):
         return jsonify({'error': 'image not available', 'image_id': image_id}), 404
 
 
-# Note: unified design — all data is in `planefeed.json` (planes). We intentionally
-# removed the legacy /api/reports and /api/feed endpoints so the frontend and
-# other consumers only use /api/planes.
+# Note: planes are served from the in-memory PlaneSnapshot (/api/planes and
+# /api/planes/stream) or proxied to the backend (/api/planes/viewport); analyst
+# reports come from the ReportStore (/api/reports). The legacy /api/feed
+# endpoint is gone.
 
 
 # serve static frontend assets
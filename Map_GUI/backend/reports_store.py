@@ -0,0 +1,273 @@
+"""SQLite report store behind the Map GUI `/api/reports` endpoints.
+
+Reports live in one table (`MAP_REPORTS_DB`, WAL mode so readers never
+wait for a writer) with the report JSON as-is plus indexed columns for
+type, position and timestamp. Every write takes the next revision number
+(`rev`), deletes leave a tombstone, so clients can fetch only what changed
+since the revision they have (`?since=`).
+
+The unfiltered list the analyst page polls is kept encoded in memory per
+revision, so repeated polls cost one indexed `MAX(rev)` lookup.
+
+Report JSON files from the old directory-based store are imported once
+(automatically on first start, or `python reports_store.py import [dir]`).
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Iterable, List, Optional, Tuple
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS reports (
+    id TEXT PRIMARY KEY,
+    rev INTEGER NOT NULL,
+    type TEXT,
+    lat REAL,
+    lon REAL,
+    ts REAL,
+    deleted INTEGER NOT NULL DEFAULT 0,
+    data TEXT
+);
+CREATE INDEX IF NOT EXISTS reports_rev ON reports (rev);
+CREATE INDEX IF NOT EXISTS reports_ts ON reports (deleted, ts);
+CREATE INDEX IF NOT EXISTS reports_pos ON reports (lat, lon);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+# Files in the data directory that are not reports
+NON_REPORT_FILES = {"planefeed.json"}
+
+
+def _timestamp(value) -> Optional[float]:
+    """Report timestamps are epoch seconds or ISO strings; return epoch seconds."""
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+        except ValueError:
+            return None
+    return None
+
+
+def _coord(data: dict, *keys) -> Optional[float]:
+    for key in keys:
+        value = data.get(key)
+        if isinstance(value, (int, float)):
+            return float(value)
+    return None
+
+
+class ReportStore:
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.local = threading.local()
+        self.write_lock = threading.Lock()
+        # (rev, encoded unfiltered list)
+        self.list_cache: Tuple[int, bytes] = (-1, b"[]")
+        with self._conn() as conn:
+            conn.executescript(SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return conn
+
+    # ---- reads ----
+
+    @staticmethod
+    def _decode(report_id: str, data: str) -> dict:
+        report = json.loads(data)
+        report['_id'] = report_id
+        return report
+
+    def rev(self) -> int:
+        return self._conn().execute("SELECT COALESCE(MAX(rev), 0) FROM reports").fetchone()[0]
+
+    def get(self, report_id: str) -> Optional[dict]:
+        row = self._conn().execute(
+            "SELECT data FROM reports WHERE id = ? AND deleted = 0", (report_id,)).fetchone()
+        return self._decode(report_id, row[0]) if row else None
+
+    def all_encoded(self) -> Tuple[int, bytes]:
+        """Every live report, newest first, as encoded JSON (cached per revision)."""
+        rev = self.rev()
+        cached_rev, body = self.list_cache
+        if cached_rev != rev:
+            rows = self._conn().execute(
+                "SELECT id, data FROM reports WHERE deleted = 0 ORDER BY ts DESC").fetchall()
+            body = json.dumps([self._decode(i, d) for i, d in rows], ensure_ascii=False).encode('utf-8')
+            self.list_cache = (rev, body)
+        return rev, body
+
+    def query(self, since: Optional[int] = None, report_type: Optional[str] = None,
+              start: Optional[float] = None, end: Optional[float] = None,
+              bbox: Optional[Tuple[float, float, float, float]] = None,
+              limit: Optional[int] = None, offset: int = 0) -> Tuple[List[dict], int, int]:
+        """Filtered reports, the total matching before limit/offset, and a revision.
+
+        Without `since` reports come newest first and the revision is the
+        current one. With `since`, only reports changed after that revision
+        are returned, oldest change first, deletions included as
+        `{"_id": ..., "_deleted": true}`; the revision is that of the last
+        change returned when more remain (so passing it back as `since`
+        continues after it), else the current one.
+        """
+        where, params = [], []
+        if since is not None:
+            where.append("rev > ?")
+            params.append(since)
+        else:
+            where.append("deleted = 0")
+        if report_type:
+            where.append("type = ?")
+            params.append(report_type)
+        if start is not None:
+            where.append("ts >= ?")
+            params.append(start)
+        if end is not None:
+            where.append("ts <= ?")
+            params.append(end)
+        if bbox:
+            where.append("lat BETWEEN ? AND ? AND lon BETWEEN ? AND ?")
+            params += [bbox[0], bbox[2], bbox[1], bbox[3]]
+        clause = " WHERE " + " AND ".join(where)
+        order = " ORDER BY rev ASC" if since is not None else " ORDER BY ts DESC"
+        conn = self._conn()
+        # One read transaction, so the revision, count and rows agree
+        conn.execute("BEGIN")
+        try:
+            rev = conn.execute("SELECT COALESCE(MAX(rev), 0) FROM reports").fetchone()[0]
+            total = conn.execute("SELECT COUNT(*) FROM reports" + clause, params).fetchone()[0]
+            sql = "SELECT id, rev, deleted, data FROM reports" + clause + order + " LIMIT ? OFFSET ?"
+            rows = conn.execute(sql, params + [limit if limit is not None else -1, offset]).fetchall()
+        finally:
+            conn.execute("COMMIT")
+        if since is not None and rows and offset + len(rows) < total:
+            rev = rows[-1][1]
+        reports = [{'_id': i, '_deleted': True} if deleted else self._decode(i, d) for i, _, deleted, d in rows]
+        return reports, total, rev
+
+    # ---- writes ----
+
+    def _write(self, conn: sqlite3.Connection, report_id: str, data: Optional[dict]):
+        rev = conn.execute("SELECT COALESCE(MAX(rev), 0) + 1 FROM reports").fetchone()[0]
+        if data is None:
+            conn.execute("UPDATE reports SET rev = ?, deleted = 1, data = NULL WHERE id = ?", (rev, report_id))
+            return
+        data = {k: v for k, v in data.items() if k not in ('_id', '_filename')}
+        conn.execute(
+            "INSERT OR REPLACE INTO reports (id, rev, type, lat, lon, ts, deleted, data) VALUES (?, ?, ?, ?, ?, ?, 0, ?)",
+            (report_id, rev, data.get('type'), _coord(data, 'latitude', 'lat'), _coord(data, 'longitude', 'lon'),
+             _timestamp(data.get('timestamp')), json.dumps(data, ensure_ascii=False)),
+        )
+
+    def put(self, report_id: str, data: dict):
+        with self.write_lock:
+            conn = self._conn()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._write(conn, report_id, data)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def update(self, report_id: str, changes: dict) -> Optional[dict]:
+        """Merge `changes` into a report; returns None if it doesn't exist."""
+        with self.write_lock:
+            conn = self._conn()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT data FROM reports WHERE id = ? AND deleted = 0", (report_id,)).fetchone()
+                if row is None:
+                    conn.execute("ROLLBACK")
+                    return None
+                merged = {**json.loads(row[0]), **changes}
+                self._write(conn, report_id, merged)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return merged
+
+    def delete(self, report_id: str) -> bool:
+        with self.write_lock:
+            conn = self._conn()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if conn.execute("SELECT 1 FROM reports WHERE id = ? AND deleted = 0", (report_id,)).fetchone() is None:
+                    conn.execute("ROLLBACK")
+                    return False
+                self._write(conn, report_id, None)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return True
+
+    # ---- import ----
+
+    def import_directory(self, directory: Path, force: bool = False) -> int:
+        """Import report JSON files from the old directory store (once, unless `force`).
+
+        Existing ids are left alone, so running it again is harmless.
+        """
+        conn = self._conn()
+        if not force and conn.execute("SELECT 1 FROM meta WHERE key = 'imported_at'").fetchone():
+            return 0
+        imported = 0
+        with self.write_lock:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for report_id, data in _read_report_files(Path(directory)):
+                    if conn.execute("SELECT 1 FROM reports WHERE id = ?", (report_id,)).fetchone():
+                        continue
+                    self._write(conn, report_id, data)
+                    imported += 1
+                conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('imported_at', ?)", (str(time.time()),))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return imported
+
+
+def _read_report_files(directory: Path) -> Iterable[Tuple[str, dict]]:
+    for file in sorted(directory.glob("*.json")):
+        if file.name in NON_REPORT_FILES:
+            continue
+        try:
+            with open(file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except Exception:
+            continue
+        if isinstance(data, dict) and isinstance(data.get('drones'), list):
+            # Bundled sample file: one report per entry
+            for i, entry in enumerate(data['drones']):
+                if isinstance(entry, dict):
+                    yield str(entry.get('id') or f"{file.stem}_{i}"), {'type': 'drone', **entry}
+        elif isinstance(data, dict):
+            # report_<id>.json as written by the old POST /api/reports
+            report_id = file.stem[len('report_'):] if file.stem.startswith('report_') else file.stem
+            yield report_id, data
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) < 2 or sys.argv[1] != "import":
+        sys.exit("usage: python reports_store.py import [data_dir]")
+    data_dir = Path(sys.argv[2] if len(sys.argv) > 2 else os.environ.get("ADSB_DATA_DIR", "/data"))
+    db_path = Path(os.environ.get("MAP_REPORTS_DB", data_dir / "reports.db"))
+    count = ReportStore(db_path).import_directory(data_dir, force=True)
+    print(f"Imported {count} reports from {data_dir} into {db_path}")
@@ -0,0 +1,10 @@
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# app.py starts its poller and opens the report store on import: keep both local
+os.environ.setdefault('ADSB_DATA_DIR', tempfile.mkdtemp(prefix='map-gui-test-'))
+os.environ.setdefault('BACKEND_API', 'http://127.0.0.1:9')
+os.environ.setdefault('MAP_POLL_SECONDS', '3600')
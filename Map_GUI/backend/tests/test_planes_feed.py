@@ -0,0 +1,76 @@
+import json
+import threading
+
+import pytest
+
+import app as map_app
+
+
+def feed(*last_seen):
+    planes = [{'icao': f'abc{i}', 'last_seen': ts} for i, ts in enumerate(last_seen)]
+    return json.dumps({'planes': planes}).encode('utf-8')
+
+
+OLD = feed('2026-01-01T12:00:00', '2026-01-01T12:00:05')
+NEW = feed('2026-01-01T12:00:05', '2026-01-01T12:00:10')
+
+
+def test_version_is_the_same_in_every_worker():
+    first, second = map_app.PlaneSnapshot(), map_app.PlaneSnapshot()
+    first.publish(NEW)
+    second.publish(OLD)
+    second.publish(NEW)
+    assert first.version == second.version
+    assert first.etag == second.etag
+
+
+def test_any_change_is_delivered():
+    snapshot = map_app.PlaneSnapshot()
+    snapshot.publish(NEW)
+    seen = snapshot.version
+    # The newest plane drops out, then the feed empties: both are older by last_seen
+    for body in (OLD, feed()):
+        threading.Timer(0.05, snapshot.publish, args=(body,)).start()
+        assert snapshot.wait_newer(seen, timeout=5) == map_app._content_version(body)
+        seen = snapshot.version
+    assert snapshot.wait_newer(seen, timeout=0.05) == seen
+
+
+def test_unknown_versions_get_the_current_feed():
+    snapshot = map_app.PlaneSnapshot()
+    snapshot.publish(NEW)
+    assert map_app._is_newer(snapshot.version, None)
+    assert map_app._is_newer(snapshot.version, '17')
+    assert not map_app._is_newer(snapshot.version, snapshot.version)
+    assert snapshot.wait_newer('garbage', timeout=5) == snapshot.version
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(map_app, 'waiting', threading.BoundedSemaphore(1))
+    return map_app.app.test_client()
+
+
+def test_streams_past_the_cap_are_refused(client):
+    map_app.waiting.acquire()
+    try:
+        resp = client.get('/api/planes/stream')
+        assert resp.status_code == 503
+        assert resp.headers['Retry-After']
+        # Long-polls aren't held either, but still get the feed
+        resp = client.get('/api/planes', query_string={'since': map_app.snapshot.version, 'wait': 10})
+        assert resp.status_code == 200
+    finally:
+        map_app.waiting.release()
+
+
+def test_stream_releases_its_slot_when_closed(client, monkeypatch):
+    monkeypatch.setattr(map_app, 'SSE_MAX_SECONDS', 0.2)
+    monkeypatch.setattr(map_app, 'SSE_KEEPALIVE_SECONDS', 0.05)
+    resp = client.get('/api/planes/stream')
+    assert resp.status_code == 200
+    body = resp.get_data()
+    assert body.startswith(b'event: planes\nid: ' + map_app.snapshot.version.encode())
+    resp.close()
+    assert map_app.waiting.acquire(blocking=False)
+    map_app.waiting.release()
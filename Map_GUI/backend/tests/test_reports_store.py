@@ -0,0 +1,58 @@
+import pytest
+
+from reports_store import ReportStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ReportStore(tmp_path / 'reports.db')
+
+
+def sync(store, since, limit):
+    """Fetch changes page by page, as a client following X-Reports-Rev would."""
+    seen = {}
+    while True:
+        changes, total, rev = store.query(since=since, limit=limit)
+        for change in changes:
+            seen[change['_id']] = change
+        if rev == since or len(changes) == total:
+            return seen, rev
+        since = rev
+
+
+def test_since_returns_changes_in_revision_order(store):
+    for i in range(5):
+        store.put(f'r{i}', {'type': 'drone', 'timestamp': 1000 - i})
+    store.delete('r1')
+    changes, total, rev = store.query(since=2)
+    assert [c['_id'] for c in changes] == ['r2', 'r3', 'r4', 'r1']
+    assert changes[-1] == {'_id': 'r1', '_deleted': True}
+    assert (total, rev) == (4, store.rev())
+
+
+def test_client_far_behind_catches_up_through_limited_pages(store):
+    for i in range(10):
+        store.put(f'r{i}', {'type': 'drone', 'timestamp': i})
+    _, _, start = store.query()
+    for i in range(7):
+        store.update(f'r{i}', {'notes': 'reviewed'})
+    store.delete('r8')
+
+    changes, total, rev = store.query(since=start, limit=3)
+    assert total == 8 and len(changes) == 3
+    # Not the current revision: the older changes have not been sent yet
+    assert rev < store.rev()
+
+    seen, rev = sync(store, start, limit=3)
+    assert rev == store.rev()
+    assert sorted(seen) == ['r0', 'r1', 'r2', 'r3', 'r4', 'r5', 'r6', 'r8']
+    assert all(seen[f'r{i}']['notes'] == 'reviewed' for i in range(7))
+    assert seen['r8'] == {'_id': 'r8', '_deleted': True}
+
+
+def test_unfiltered_query_is_newest_first(store):
+    for i in range(3):
+        store.put(f'r{i}', {'type': 'drone', 'timestamp': i})
+    reports, total, rev = store.query(limit=2)
+    assert [r['_id'] for r in reports] == ['r2', 'r1']
+    assert (total, rev) == (3, store.rev())
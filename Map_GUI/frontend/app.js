@@ -18,6 +18,7 @@ document.addEventListener("DOMContentLoaded", () => {
   const dronesCameraLayer = L.layerGroup().addTo(map); // NEW LINE
   const dronesRadarLayer = L.layerGroup().addTo(map);  // NEW LINE
   const gliderLayer = L.layerGroup().addTo(map);       // NEW LINE
+  const clusterLayer = L.layerGroup().addTo(map);      // aircraft clusters when too many are in view
   
   // --- FILTER STATE ---
   
@@ -30,6 +31,7 @@ document.addEventListener("DOMContentLoaded", () => {
   function updateLayersVisibility() {
     
     showPlanes ? map.addLayer(planeLayer) : map.removeLayer(planeLayer);
+    showPlanes || showOgn ? map.addLayer(clusterLayer) : map.removeLayer(clusterLayer);
     showDronesReport ? map.addLayer(dronesReportLayer) : map.removeLayer(dronesReportLayer); // NEW LINE
     showDronesCamera ? map.addLayer(dronesCameraLayer) : map.removeLayer(dronesCameraLayer); // NEW LINE
     showDronesRadar ? map.addLayer(dronesRadarLayer) : map.removeLayer(dronesRadarLayer);    // NEW LINE
@@ -72,10 +74,70 @@ document.addEventListener("DOMContentLoaded", () => {
     updateLayersVisibility();                          // NEW LINE
   });
   // --- FETCH & RENDER ---
+  // The backend viewport query decides after each pan or zoom whether the view shows
+  // individual aircraft or clusters (falling back to the full feed if it is unreachable).
+  // While it shows individual aircraft, polls are served from the /api/planes snapshot.
+  let viewChanged = true;   // set on moveend, cleared once the viewport query answered
+  let viewMode = null;      // 'planes' or 'clusters' from the last viewport query
+  let viewCount = 0;        // planes it returned
+  let loadController = null; // aborts the load still in flight when a newer one starts
+
+  function planeLatLon(p) {
+    return [p.lat || p.latitude || (p.position?.coordinates?.[1]), p.lon || p.longitude || (p.position?.coordinates?.[0])];
+  }
+
+  async function fetchPlanes(signal) {
+    const b = map.getBounds();
+    if (!viewChanged && viewMode === 'planes') {
+      const resp = await fetch('/api/planes', { signal });
+      const planes = ((await resp.json()).planes || []).filter(p => {
+        const [lat, lon] = planeLatLon(p);
+        return typeof lat === 'number' && typeof lon === 'number' && b.contains([lat, lon]);
+      });
+      // The feed holds the newest planes only; with fewer in view than the viewport
+      // query found, it was cut off, so ask the backend again
+      if (planes.length >= viewCount) return { mode: 'planes', planes };
+    }
+    const bbox = [b.getSouth(), b.getWest(), b.getNorth(), b.getEast()].map(v => v.toFixed(4)).join(',');
+    try {
+      const resp = await fetch(`/api/planes/viewport?bbox=${bbox}&zoom=${map.getZoom()}`, { signal });
+      if (resp.ok) {
+        const data = await resp.json();
+        viewChanged = false;
+        viewMode = data.mode;
+        viewCount = (data.planes || []).length;
+        return data;
+      }
+    } catch (err) {
+      if (err.name === 'AbortError') throw err;
+      console.warn('Viewport query failed, loading the full feed:', err);
+    }
+    const resp = await fetch('/api/planes', { signal });
+    return await resp.json();
+  }
+
+  function renderClusters(clusters) {
+    clusters.forEach(c => {
+      const sources = Object.entries(c.sources || {}).map(([s, n]) => `${s}: ${n}`).join('<br>');
+      L.circleMarker([c.lat, c.lon], {
+        color: 'steelblue',
+        fillColor: 'steelblue',
+        fillOpacity: 0.6,
+        radius: Math.min(30, 8 + 3 * Math.log2(c.count))
+      }).bindTooltip(String(c.count), { permanent: true, direction: 'center', className: 'cluster-label' })
+        .bindPopup(`<b>${c.count} aircraft</b><br>${sources}<br><i>Zoom in for details</i>`)
+        .on('dblclick', () => map.setView([c.lat, c.lon], map.getZoom() + 2))
+        .addTo(clusterLayer);
+    });
+  }
+
   async function loadPlanes() {
+    // Responses can finish out of order; only the newest load may render
+    if (loadController) loadController.abort();
+    const controller = loadController = new AbortController();
     try {
-      const resp = await fetch('/api/planes');
-      const data = await resp.json();
+      const data = await fetchPlanes(controller.signal);
+      if (controller !== loadController) return;
       const planes = data.planes || [];
 
       // clear previous markers
@@ -85,6 +147,8 @@ document.addEventListener("DOMContentLoaded", () => {
       dronesCameraLayer.clearLayers(); // NEW LINE
       dronesRadarLayer.clearLayers();  // NEW LINE
       gliderLayer.clearLayers();       // NEW LINE
+      clusterLayer.clearLayers();
+      renderClusters(data.clusters || []);
 
       planes.forEach(p => {
         const source = (p.source || p.producer || '').toString().toLowerCase();
@@ -259,7 +323,7 @@ document.addEventListener("DOMContentLoaded", () => {
         }
       });
     } catch (err) {
-      console.error('Error loading planes:', err);
+      if (err.name !== 'AbortError') console.error('Error loading planes:', err);
     }
   }
 
@@ -348,6 +412,10 @@ document.addEventListener("DOMContentLoaded", () => {
   }
 
   updateLoop(); // Start loop
+  map.on('moveend', () => { // Refetch for the new viewport / zoom level
+    viewChanged = true;
+    loadPlanes();
+  });
 
   // --- LOGIN / MODAL HANDLING ---
   const btnLogin = document.getElementById('btn-login');
@@ -54,20 +54,7 @@ function drawAirports() {
     });
 }
 
-// Calculate distance between two points (Haversine formula)
-function haversineDistance(lat1, lon1, lat2, lon2) {
-    const R = 6371000; // Earth radius in meters
-    const toRad = deg => deg * Math.PI / 180;
-    const dLat = toRad(lat2 - lat1);
-    const dLon = toRad(lon2 - lon1);
-    const a = Math.sin(dLat/2) * Math.sin(dLat/2) +
-              Math.cos(toRad(lat1)) * Math.cos(toRad(lat2)) *
-              Math.sin(dLon/2) * Math.sin(dLon/2);
-    const c = 2 * Math.atan2(Math.sqrt(a), Math.sqrt(1-a));
-    return R * c;
-}
-
-// Load and check current reports for corridor violations
+// Load current reports and draw them on the map
 async function checkReports() {
     try {
         const resp = await fetch('/api/planes');
@@ -79,7 +66,6 @@ async function checkReports() {
 
         planes.forEach(p => {
             const source = (p.source || p.producer || '').toString().toLowerCase();
-            const isReport = source === 'dronereport' || source === 'form' || p.report_type || p.kind === 'report';
             const isCamera = source === 'camera';
             const isRadar = source === 'radar';
 
@@ -97,30 +83,33 @@ async function checkReports() {
                 fillOpacity: 0.8,
                 weight: 2
             }).bindPopup(`<b>${isCamera ? 'Camera' : isRadar ? 'Radar' : 'Drone'} Detection</b><br>${p.description || ''}`).addTo(detectionsLayer);
+        });
+    } catch (err) {
+        console.error('Error checking reports:', err);
+    }
+}
 
-            // Only process reports for corridor violations
-            if (!(isReport || isCamera || isRadar)) return;
+// Corridor violations are detected by the backend geofence engine; poll its active alerts
+async function checkAlerts() {
+    const token = localStorage.getItem('auth_token');
+    if (!token) return;
+    try {
+        const resp = await fetch('/api/alerts?status=active', {
+            headers: { 'Authorization': 'Basic ' + btoa(token) }
+        });
+        if (!resp.ok) return;
+        const serverAlerts = await resp.json();
 
-            // Check each airport
-            AIRPORTS.forEach(airport => {
-                const distance = haversineDistance(lat, lon, airport.lat, airport.lon);
-                
-                if (distance <= CORRIDOR_RADIUS_METERS) {
-                    // Create unique alert ID to avoid duplicates
-                    const alertId = `${p.icao || p.id || p.flight || (lat+lon)}_${airport.id}_${Math.round(distance/100)*100}`;
-                    
-                    if (!alertedSet.has(alertId)) {
-                        alertedSet.add(alertId);
-                        createAlert(p, airport, distance);
-                        
-                        // Send notification to backend
-                        notifyBackend(p, airport, distance);
-                    }
-                }
-            });
+        serverAlerts.forEach(a => {
+            if (alertedSet.has(a.alert_id)) return;
+            alertedSet.add(a.alert_id);
+            const coords = (a.position && a.position.coordinates) || [];
+            const report = { ...(a.report || {}), icao: a.icao, source: a.source, lon: coords[0], lat: coords[1] };
+            const airport = AIRPORTS.find(ap => ap.id === a.zone_id) || { id: a.zone_id, name: a.zone_name };
+            createAlert(report, airport, a.distance_m || 0);
         });
     } catch (err) {
-        console.error('Error checking reports:', err);
+        console.error('Error checking alerts:', err);
     }
 }
 
@@ -180,44 +169,6 @@ function escapeHtml(s) {
     return String(s).replace(/[&<>"]+/g, c => ({'&':'&amp;','<':'&lt;','>':'&gt;','"':'&quot;'})[c] || c);
 }
 
-async function notifyBackend(report, airport, distance) {
-    // Prepare alert message for backend consumption
-    const alertMessage = {
-        timestamp: new Date().toISOString(),
-        alert_type: 'corridor_violation',
-        corridor_radius_m: CORRIDOR_RADIUS_METERS,
-        report: report,
-        airport: {
-            id: airport.id,
-            name: airport.name,
-            latitude: airport.lat,
-            longitude: airport.lon
-        },
-        distance_m: Math.round(distance),
-        distance_km: (distance / 1000).toFixed(3),
-        severity: distance < 1000 ? 'critical' : distance < 2000 ? 'high' : 'medium',
-        detection_type: (report.source || '').toString().toLowerCase() === 'camera' ? 'camera' :
-                       (report.source || '').toString().toLowerCase() === 'radar' ? 'radar' : 'drone'
-    };
-
-    // Send to backend for storage and notification to analyst/admin
-    try {
-        const resp = await fetch('/api/alert/authority', {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify(alertMessage)
-        });
-        
-        if (resp.ok || resp.status === 202) {
-            console.log('Alert sent to backend:', alertMessage);
-        } else {
-            console.warn('Backend alert failed:', resp.status);
-        }
-    } catch (err) {
-        console.warn('Failed to send alert to backend:', err);
-    }
-}
-
 function showAlertDetails(alertId) {
     const alert = alerts.find(a => a.id === alertId);
     if (!alert) return;
@@ -307,8 +258,10 @@ if ('Notification' in window && Notification.permission === 'default') {
 document.addEventListener('DOMContentLoaded', () => {
     drawAirports();
     checkReports();
-    // Poll for new reports
+    checkAlerts();
+    // Poll for new reports and alerts
     setInterval(checkReports, POLL_INTERVAL_MS);
+    setInterval(checkAlerts, POLL_INTERVAL_MS);
 });
 
 function showInfo() {
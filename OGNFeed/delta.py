@@ -0,0 +1,108 @@
+"""
+Change-only (delta) posting for collectors.
+
+Instead of posting every aircraft each cycle, a collector keeps the record it
+last sent per icao and only resends aircraft whose position, altitude, speed
+or heading changed beyond the DELTA_* thresholds (or that were last sent more
+than DELTA_REFRESH_SECONDS ago, so `last_seen` keeps moving). The rest are
+posted as bare "alive" icaos to `/planes/bulk/delta`, which counts them as
+present in the snapshot without rewriting their documents.
+
+A record only becomes the new reference once the backend accepted it
+(`commit`), so a failed post is resent in full next cycle. Icaos the backend
+reports as unknown are forgotten and resent in full too.
+
+This file is shared by the OpenSky and OGN collectors (each Docker build
+context carries its own copy).
+"""
+
+import math
+import os
+import time
+from typing import Dict, Iterable, List, Tuple
+
+DELTA_POSTING = os.getenv("DELTA_POSTING", "true").lower() not in ("0", "false", "no")
+DELTA_POSITION_M = float(os.getenv("DELTA_POSITION_M", "100"))
+DELTA_ALT_M = float(os.getenv("DELTA_ALT_M", "30"))
+DELTA_SPEED_MS = float(os.getenv("DELTA_SPEED_MS", "2"))
+DELTA_HEADING_DEG = float(os.getenv("DELTA_HEADING_DEG", "5"))
+DELTA_REFRESH_SECONDS = float(os.getenv("DELTA_REFRESH_SECONDS", "60"))
+
+
+def delta_url(ingest_url: str) -> str:
+    """The delta endpoint that sits next to /planes/bulk."""
+    return ingest_url.rstrip("/") + "/delta"
+
+
+def _distance_m(lat1, lon1, lat2, lon2) -> float:
+    # Equirectangular approximation: plenty for thresholds of a few hundred metres
+    x = math.radians(lon2 - lon1) * math.cos(math.radians((lat1 + lat2) / 2))
+    y = math.radians(lat2 - lat1)
+    return 6371000.0 * math.hypot(x, y)
+
+
+def _changed(old, new, threshold: float) -> bool:
+    if old is None or new is None:
+        return old is not new
+    return abs(new - old) > threshold
+
+
+def _heading_changed(old, new) -> bool:
+    if old is None or new is None:
+        return old is not new
+    diff = abs(new - old) % 360
+    return min(diff, 360 - diff) > DELTA_HEADING_DEG
+
+
+class DeltaTracker:
+    def __init__(self):
+        # icao -> (last record the backend accepted, monotonic time it was sent)
+        self.sent: Dict[str, Tuple[dict, float]] = {}
+
+    def moved(self, old: dict, new: dict) -> bool:
+        if None in (old.get("lat"), old.get("lon"), new.get("lat"), new.get("lon")):
+            return True
+        return (
+            _distance_m(old["lat"], old["lon"], new["lat"], new["lon"]) > DELTA_POSITION_M
+            or _changed(old.get("alt"), new.get("alt"), DELTA_ALT_M)
+            or _changed(old.get("spd"), new.get("spd"), DELTA_SPEED_MS)
+            or _heading_changed(old.get("heading"), new.get("heading"))
+            or old.get("on_ground") != new.get("on_ground")
+        )
+
+    def split(self, batch: List[dict]) -> Tuple[List[dict], List[str]]:
+        """Split a full snapshot into records to send and icaos to report as alive."""
+        now = time.monotonic()
+        changed, alive, present = [], [], set()
+        for rec in batch:
+            icao = rec.get("icao")
+            if not icao or rec.get("on_ground"):
+                # Standalone reports and landings (which delete the plane) always go out
+                changed.append(rec)
+                continue
+            present.add(icao)
+            previous = self.sent.get(icao)
+            if previous is None or now - previous[1] >= DELTA_REFRESH_SECONDS or self.moved(previous[0], rec):
+                changed.append(rec)
+            else:
+                alive.append(icao)
+        # Aircraft that left the picture are resent in full if they come back
+        for icao in [icao for icao in self.sent if icao not in present]:
+            del self.sent[icao]
+        return changed, alive
+
+    def commit(self, changed: List[dict]) -> None:
+        """Record what the backend accepted as the new reference per icao."""
+        now = time.monotonic()
+        for rec in changed:
+            icao = rec.get("icao")
+            if not icao:
+                continue
+            if rec.get("on_ground"):
+                self.sent.pop(icao, None)
+            else:
+                self.sent[icao] = (rec, now)
+
+    def forget(self, icaos: Iterable[str]) -> None:
+        for icao in icaos:
+            self.sent.pop(icao, None)
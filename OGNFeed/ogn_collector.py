@@ -8,6 +8,9 @@ import datetime
 import threading
 from ogn.client import AprsClient
 from ogn.parser import parse, AprsParseError
+from spool import Spool, Replayer
+from delta import DeltaTracker, DELTA_POSTING, delta_url
+from wire import encode_body
 
 # ---- Config from .env ----
 LAMIN = float(os.getenv("LAMIN", "49.5"))
@@ -16,6 +19,8 @@ LOMIN = float(os.getenv("LOMIN", "2.5"))
 LOMAX = float(os.getenv("LOMAX", "6.5"))
 POLL = float(os.getenv("POLL_SECONDS", str(5)))  # 5 seconds
 INGEST_URL = os.getenv("INGEST_URL", "http://localhost:8000/planes/bulk")
+DELTA_URL = os.getenv("DELTA_URL", delta_url(INGEST_URL))
+HEALTH_URL = os.getenv("HEALTH_URL", INGEST_URL.rsplit("/planes", 1)[0] + "/health")
 APRS_USER = os.getenv("APRS_USER", "N0CALL-BE")
 
 # Authentication credentials
@@ -25,6 +30,12 @@ AUTH_PASSWORD = os.getenv("AUTH_PASSWORD", "pass")
 # In-memory store: {address: latest beacon data}
 gliders_in_belgium = {}
 
+# Failed batches are spooled to disk and replayed in the background
+spool = Spool(prefix="ogn")
+
+# Last record the backend accepted per address, for change-only snapshots
+tracker = DeltaTracker()
+
 # Aircraft type mapping (from OGN protocol)
 AIRCRAFT_TYPES = {
     0: "Reserved",
@@ -89,11 +100,11 @@ def process_beacon(raw_message):
         pass  # Skip bad packets silently
 
 def post_batch(batch):
-    headers = {"Content-Type": "application/json"}
+    body, headers = encode_body(batch)
     try:
         resp = requests.post(
-            INGEST_URL, 
-            json=batch, 
+            INGEST_URL,
+            data=body,
             headers=headers,
             auth=HTTPBasicAuth(AUTH_USERNAME, AUTH_PASSWORD),
             timeout=30
@@ -105,6 +116,49 @@ def post_batch(batch):
         print(f"[collector] POST ERROR: {e}", flush=True)
         return False
 
+def post_delta(changed, alive):
+    """POST a snapshot as changed records + alive addresses; forget ones the backend doesn't know."""
+    body, headers = encode_body({"source": "ogn", "planes": changed, "alive": alive})
+    try:
+        resp = requests.post(
+            DELTA_URL,
+            data=body,
+            headers=headers,
+            auth=HTTPBasicAuth(AUTH_USERNAME, AUTH_PASSWORD),
+            timeout=30
+        )
+        resp.raise_for_status()
+        unknown = resp.json().get("unknown") or []
+        tracker.commit(changed)
+        tracker.forget(unknown)
+        print(f"[collector] POSTED {len(changed)} changed + {len(alive)} alive OGN records -> {DELTA_URL}")
+        return True
+    except (requests.RequestException, ValueError) as e:
+        print(f"[collector] DELTA POST ERROR: {e}", flush=True)
+        return False
+
+def replay_batch(batch):
+    """POST a spooled batch as a non-snapshot replay. Returns the HTTP status, or None."""
+    try:
+        resp = requests.post(
+            INGEST_URL,
+            json=batch,
+            params={"snapshot": "false"},
+            auth=HTTPBasicAuth(AUTH_USERNAME, AUTH_PASSWORD),
+            timeout=30
+        )
+        print(f"[collector] REPLAYED {len(batch)} OGN records -> {resp.status_code}")
+        return resp.status_code
+    except requests.RequestException as e:
+        print(f"[collector] REPLAY ERROR: {e}", flush=True)
+        return None
+
+def backend_healthy():
+    try:
+        return requests.get(HEALTH_URL, timeout=5).ok
+    except requests.RequestException:
+        return False
+
 def periodic_post():
     while True:
         batch = []
@@ -140,11 +194,10 @@ def periodic_post():
             batch.append(rec)
 
         if batch:
-            if not post_batch(batch):
-                fname = f"ogn_failed_{int(time.time())}.json"
-                with open(fname, "w", encoding="utf-8") as f:
-                    json.dump(batch, f, indent=2)
-                print(f"[collector] SAVED failed batch -> {fname}")
+            ok = post_delta(*tracker.split(batch)) if DELTA_POSTING else post_batch(batch)
+            if not ok:
+                spool.append(batch)
+                print(f"[collector] SPOOLED failed batch ({len(batch)} records)")
 
         print(f"[collector] Processed {len(batch)} OGN gliders in Belgium", flush=True)
         gliders_in_belgium.clear()
@@ -159,6 +212,9 @@ client.connect()
 poster = threading.Thread(target=periodic_post, daemon=True)
 poster.start()
 
+# === Start spool replayer thread ===
+Replayer(spool, replay_batch, backend_healthy).start()
+
 print(f"[collector] OGN Belgium tracker STARTED")
 print(f"   Authenticating as: {AUTH_USERNAME}")
 print(f"   BBox: lat {LAMIN}–{LAMAX}, lon {LOMIN}–{LOMAX}")
@@ -0,0 +1,158 @@
+"""
+Durable on-disk spool for batches the backend could not accept.
+
+Failed batches are appended as one JSON line each to segment files
+(`<prefix>-<seq>.ndjson`) in SPOOL_DIR. A segment is sealed once it reaches
+SPOOL_SEGMENT_BYTES; when the spool exceeds SPOOL_MAX_BYTES the oldest
+segments are evicted, so a long backend outage costs bounded disk.
+
+A background `Replayer` thread drains sealed segments oldest-first once the
+backend answers its health check. Stale snapshots are collapsed first: only
+the newest record per aircraft (by `ts_unix`) is replayed, and records older
+than SPOOL_MAX_AGE_SECONDS (the backend rejects timestamps > 24h old) are
+dropped. Replays are posted with `snapshot=false` so they never count as a
+full snapshot nor overwrite newer live positions.
+
+This file is shared by the OpenSky and OGN collectors (each Docker build
+context carries its own copy).
+"""
+
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+SPOOL_DIR = os.getenv("SPOOL_DIR", "spool")
+SPOOL_SEGMENT_BYTES = int(os.getenv("SPOOL_SEGMENT_BYTES", str(4 * 1024 * 1024)))
+SPOOL_MAX_BYTES = int(os.getenv("SPOOL_MAX_BYTES", str(256 * 1024 * 1024)))
+SPOOL_MAX_AGE_SECONDS = int(os.getenv("SPOOL_MAX_AGE_SECONDS", str(23 * 3600)))
+SPOOL_REPLAY_CHUNK = int(os.getenv("SPOOL_REPLAY_CHUNK", "1000"))
+
+
+class Spool:
+    def __init__(self, directory: str = SPOOL_DIR, prefix: str = "batch",
+                 segment_bytes: int = SPOOL_SEGMENT_BYTES, max_bytes: int = SPOOL_MAX_BYTES):
+        self.dir = Path(directory)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.prefix = prefix
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self._current: Optional[Path] = None
+
+    def _segments(self) -> List[Path]:
+        return sorted(self.dir.glob(f"{self.prefix}-*.ndjson"))
+
+    def _next_segment(self) -> Path:
+        segments = self._segments()
+        seq = int(segments[-1].stem.rsplit("-", 1)[1]) + 1 if segments else 0
+        return self.dir / f"{self.prefix}-{seq:012d}.ndjson"
+
+    def append(self, batch: List[dict]) -> None:
+        """Append one failed batch; roll the segment and evict old ones as needed."""
+        line = json.dumps({"spooled_at": int(time.time()), "batch": batch}, separators=(",", ":")) + "\n"
+        with self.lock:
+            if self._current is None or not self._current.exists():
+                self._current = self._next_segment()
+            with open(self._current, "a", encoding="utf-8") as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            if self._current.stat().st_size >= self.segment_bytes:
+                self._current = None
+            self._evict()
+
+    def _evict(self) -> None:
+        segments = self._segments()
+        total = sum(p.stat().st_size for p in segments)
+        while total > self.max_bytes and len(segments) > 1:
+            oldest = segments.pop(0)
+            total -= oldest.stat().st_size
+            oldest.unlink()
+            print(f"[spool] size cap reached, evicted {oldest.name}", flush=True)
+
+    def pending_bytes(self) -> int:
+        return sum(p.stat().st_size for p in self._segments())
+
+    def seal(self) -> List[Path]:
+        """Close the current segment and return every segment ready for replay."""
+        with self.lock:
+            self._current = None
+            return self._segments()
+
+    def drain(self, post: Callable[[List[dict]], Optional[int]]) -> bool:
+        """Replay all sealed segments, newest record per aircraft only.
+
+        `post` returns the HTTP status (None on connection failure). Segments
+        are deleted once everything collapsed from them was accepted, or
+        rejected as invalid (4xx other than 429), which would never succeed.
+        Returns False if the backend should be retried later.
+        """
+        segments = self.seal()
+        if not segments:
+            return True
+        cutoff = time.time() - SPOOL_MAX_AGE_SECONDS
+        latest: Dict[str, dict] = {}
+        anonymous: List[dict] = []
+        spooled = 0
+        for path in segments:
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # torn write at crash time
+                    for rec in entry.get("batch", []):
+                        spooled += 1
+                        ts = rec.get("ts_unix") or entry.get("spooled_at") or 0
+                        if ts < cutoff:
+                            continue
+                        icao = rec.get("icao")
+                        if not icao:
+                            anonymous.append(rec)
+                        elif icao not in latest or (latest[icao].get("ts_unix") or 0) <= ts:
+                            latest[icao] = rec
+        records = list(latest.values()) + anonymous
+        print(f"[spool] replaying {len(records)} of {spooled} spooled records from {len(segments)} segment(s)", flush=True)
+
+        for i in range(0, len(records), SPOOL_REPLAY_CHUNK):
+            chunk = records[i:i + SPOOL_REPLAY_CHUNK]
+            status = post(chunk)
+            if status is None or status == 429 or status >= 500:
+                return False
+            if status >= 400:
+                print(f"[spool] backend rejected {len(chunk)} replayed records ({status}); dropping them", flush=True)
+        for path in segments:
+            path.unlink(missing_ok=True)
+        return True
+
+
+class Replayer(threading.Thread):
+    """Background thread draining a Spool whenever the backend is healthy."""
+
+    def __init__(self, spool: Spool, post: Callable[[List[dict]], Optional[int]],
+                 healthy: Callable[[], bool], idle_seconds: float = 10.0, max_backoff: float = 300.0):
+        super().__init__(daemon=True, name="spool-replayer")
+        self.spool = spool
+        self.post = post
+        self.healthy = healthy
+        self.idle_seconds = idle_seconds
+        self.max_backoff = max_backoff
+
+    def run(self) -> None:
+        backoff = self.idle_seconds
+        while True:
+            try:
+                if self.spool.pending_bytes() == 0:
+                    backoff = self.idle_seconds
+                elif self.healthy() and self.spool.drain(self.post):
+                    print("[spool] replay complete", flush=True)
+                    backoff = self.idle_seconds
+                else:
+                    backoff = min(backoff * 2, self.max_backoff)
+            except Exception as e:
+                print(f"[spool] replay error: {e}", flush=True)
+                backoff = min(backoff * 2, self.max_backoff)
+            time.sleep(backoff)
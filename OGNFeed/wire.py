@@ -0,0 +1,39 @@
+"""
+Compact request bodies for posting batches to the backend.
+
+Batches are sent in the backend's columnar layout, where each field name
+appears once (`{"fields": [...], "rows": [[...], ...]}`) instead of once per
+record, and gzip-compressed. Set COMPACT_POSTS=false to post plain JSON.
+
+This file is shared by the OpenSky and OGN collectors (each Docker build
+context carries its own copy).
+"""
+
+import gzip
+import json
+import os
+from typing import Any, Dict, List, Tuple
+
+COMPACT_POSTS = os.getenv("COMPACT_POSTS", "true").lower() not in ("0", "false", "no")
+COLUMNS_JSON = "application/vnd.droneradar.columns+json"
+
+
+def to_columns(records: List[dict]) -> Dict[str, Any]:
+    fields: Dict[str, None] = {}
+    for rec in records:
+        for key in rec:
+            fields.setdefault(key)
+    names = list(fields)
+    return {"fields": names, "rows": [[rec.get(f) for f in names] for rec in records]}
+
+
+def encode_body(payload: Any) -> Tuple[bytes, Dict[str, str]]:
+    """Encode a batch (list of records) or a delta payload (`planes` + `alive`) for POSTing."""
+    if not COMPACT_POSTS:
+        return json.dumps(payload, separators=(",", ":")).encode(), {"Content-Type": "application/json"}
+    if isinstance(payload, list):
+        body, content_type = to_columns(payload), COLUMNS_JSON
+    else:
+        body, content_type = {**payload, "planes": to_columns(payload.get("planes", []))}, "application/json"
+    data = gzip.compress(json.dumps(body, separators=(",", ":")).encode(), compresslevel=6)
+    return data, {"Content-Type": content_type, "Content-Encoding": "gzip"}